@@ -1,14 +1,47 @@
 import cv2
-import numpy as np
 import os
 import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import nullcontext
+import multiprocessing
 import json
 import webbrowser
 from datetime import datetime
 from tkinter import *
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 from PIL import Image, ImageTk
-import imageio
+
+from ascii_art.batch import find_inputs, run_batch
+from ascii_art.cache import ConversionCache
+from ascii_art.container import (CONTAINER_EXTENSION, ContainerReader, format_container_stats, is_container,
+                                 write_container)
+from ascii_art.core import (PALETTES, DIRECTION_CHARS, AsciiFrame, ConversionParams, convert_gif, is_animation, is_gif,
+                            iter_source_frames, load_image, output_name, source_frame_count)
+from ascii_art.dedup import count_repeats
+from ascii_art.export import format_stats, write_html, write_text
+from ascii_art.live import LiveState
+from ascii_art.playback import TextPlayback
+from ascii_art.player import write_delta_html
+from ascii_art.preview import PREVIEW_SIZE, LazyGifPreview
+from ascii_art.profiling import Profiler, format_summary
+from ascii_art.progress import ProgressChannel, format_progress
+from ascii_art.raster import format_raster_stats, write_raster
+from ascii_art.sources import VIDEO_EXTENSIONS, sequence_pattern_for
+from ascii_art.tiles import preview_image, should_tile
+from ascii_art.timing import FrameScheduler
+
+# Период опроса прогресса генерации, мс
+PROGRESS_POLL_MS = 100
+# Превью GIF: сколько кадров PhotoImage держать в памяти, на сколько кадров
+# вперёд декодировать и как часто проверять готовность кадра, мс
+PREVIEW_CACHE_FRAMES = 24
+PREVIEW_AHEAD = 6
+PREVIEW_POLL_MS = 20
+# Анимации длиннее этого конвертируются потоково, без промежуточных данных
+# для пересборки на лету (иначе память растёт с длиной видео)
+LIVE_MAX_FRAMES = 500
+
 
 class AsciiArtPro:
     def __init__(self, root):
@@ -18,21 +51,10 @@ class AsciiArtPro:
         self.root.configure(bg='#2b2b2b')
         
         # Палитры
-        self.palettes = {
-            'Блочная': '█▓▒░ ',
-            'Градиентная': '█▇▆▅▄▃▂▁ ',
-            'Минимальная': '@ ',
-            '3D-стиль': ' .:!/r(l1Z4H9W8$@'
-        }
+        self.palettes = dict(PALETTES)
         
         # Символы для направлений
-        self.direction_chars = {
-            'horizontal': '-',
-            'vertical': '|',
-            'diag_up': '/',
-            'diag_down': '\\',
-            'cross': '+'
-        }
+        self.direction_chars = dict(DIRECTION_CHARS)
         
         self.image_path = None
         self.ascii_art = None
@@ -40,16 +62,32 @@ class AsciiArtPro:
         self.resized_color = None
         self.font_size = 8
         self.stop_flag = False
+        self.generation_start = 0.0
+        self.progress_channel = ProgressChannel()  # прогресс и отмена текущей генерации
+        self.progress_job = None
         self.settings_file = os.path.join(os.path.expanduser("~"), "ascii_art_pro_settings.json")
+        self.cache_dir = os.path.join(os.path.expanduser("~"), ".ascii_art_pro_cache")
+        self.cache_mb = 256
+        self.cache_disk_mb = 1024
         self.preview_photo = None
         self.gif_frames = None
         self.is_gif_result = False
-        self.gif_original_frames = []  # для хранения кадров оригинального GIF
+        self.container = None  # открытый контейнер .asca, кадры читаются из него по мере надобности
+        self.gif_preview = None  # кадры оригинального GIF, декодируемые в фоне
+        self.preview_shared = False  # превью показывает кадры из прохода конвертации
+        self.preview_photos = OrderedDict()  # LRU готовых PhotoImage: номер кадра -> изображение
         self.anim_timer = None
         self.anim_index = 0
+        self.anim_scheduler = None
         self.ascii_frames = []  # для хранения ASCII-строк (анимация)
-        self.ascii_anim_timer = None
-        self.ascii_anim_index = 0
+        self.ascii_durations = []
+        self.ascii_player = None  # воспроизведение ASCII-анимации в текстовом поле
+        self.generating = False
+        self.live_state = None  # промежуточные данные последней генерации
+        self.live_params = None
+        self.live_queue = deque()  # кадры, ожидающие пересборки
+        self.live_job = None
+        self.live_step_job = None
         
         # Переменные для хранения настроек
         self.width_var = IntVar(value=150)
@@ -61,9 +99,24 @@ class AsciiArtPro:
         self.v_compress_var = DoubleVar(value=1.0)
         self.font_size_var = IntVar(value=8)
         self.export_html_var = BooleanVar(value=False)
+        self.html_colors_var = IntVar(value=0)
+        self.dedup_tolerance_var = DoubleVar(value=0.0)
+        self.shape_match_var = BooleanVar(value=False)
+        self.start_time_var = DoubleVar(value=0.0)  # фрагмент и частота кадров видео
+        self.end_time_var = DoubleVar(value=0.0)
+        self.max_fps_var = DoubleVar(value=0.0)
+        self.profile_var = BooleanVar(value=False)
+        self.profiler = None  # замеры этапов последней генерации и сохранения
+        self.profile_window = None
         
         self.load_settings()
+        self.cache = ConversionCache(max_bytes=self.cache_mb << 20, disk_dir=self.cache_dir,
+                                     disk_max_bytes=self.cache_disk_mb << 20)
         self.setup_ui()
+        
+        # Палитра и порог меняют только выбор символов - пересобираем результат на лету
+        self.palette_var.trace_add('write', self._schedule_live_render)
+        self.gradient_threshold_var.trace_add('write', self._schedule_live_render)
     
     def load_settings(self):
         try:
@@ -78,6 +131,13 @@ class AsciiArtPro:
                 self.v_compress_var.set(settings.get('v_compress', 1.0))
                 self.font_size_var.set(settings.get('font_size', 8))
                 self.export_html_var.set(settings.get('export_html', False))
+                self.html_colors_var.set(settings.get('html_colors', 0))
+                self.dedup_tolerance_var.set(settings.get('dedup_tolerance', 0.0))
+                self.shape_match_var.set(settings.get('shape_match', False))
+                self.max_fps_var.set(settings.get('max_fps', 0.0))
+                self.profile_var.set(settings.get('profile', False))
+                self.cache_mb = settings.get('cache_mb', 256)
+                self.cache_disk_mb = settings.get('cache_disk_mb', 1024)
         except:
             pass
     
@@ -91,7 +151,14 @@ class AsciiArtPro:
             'gradient_threshold': self.gradient_threshold_var.get(),
             'v_compress': self.v_compress_var.get(),
             'font_size': self.font_size_var.get(),
-            'export_html': self.export_html_var.get()
+            'export_html': self.export_html_var.get(),
+            'html_colors': self.html_colors_var.get(),
+            'dedup_tolerance': self.dedup_tolerance_var.get(),
+            'shape_match': self.shape_match_var.get(),
+            'max_fps': self.max_fps_var.get(),
+            'profile': self.profile_var.get(),
+            'cache_mb': self.cache_mb,
+            'cache_disk_mb': self.cache_disk_mb
         }
         try:
             with open(self.settings_file, 'w', encoding='utf-8') as f:
@@ -115,8 +182,10 @@ class AsciiArtPro:
         btn_style = {'font': ('Arial', 10), 'bg': '#4CAF50', 'fg': 'white',
                      'activebackground': '#45a049', 'bd': 0, 'padx': 20, 'pady': 10}
         
-        Button(left_frame, text="📁 ВЫБРАТЬ ИЗОБРАЖЕНИЕ/ГИФКУ",
-               command=self.load_image, **btn_style).pack(pady=(0, 15))
+        Button(left_frame, text="📁 ВЫБРАТЬ ИЗОБРАЖЕНИЕ/ГИФКУ/ВИДЕО",
+               command=self.load_image, **btn_style).pack(pady=(0, 5))
+        Button(left_frame, text="📂 ПАКЕТНАЯ ОБРАБОТКА ПАПКИ",
+               command=self.batch_convert, bg='#555555', fg='white', bd=0, padx=10, pady=5).pack(pady=(0, 15))
         
         Label(left_frame, text="Ширина ASCII:", bg='#3c3c3c', fg='white').pack(anchor=W, padx=10)
         Scale(left_frame, from_=50, to=300, variable=self.width_var,
@@ -148,6 +217,10 @@ class AsciiArtPro:
                    variable=self.use_gradient_var, bg='#3c3c3c', fg='white',
                    selectcolor='#3c3c3c').pack(anchor=W, padx=10, pady=5)
         
+        Checkbutton(left_frame, text="🔤 Подбор символов по форме",
+                   variable=self.shape_match_var, bg='#3c3c3c', fg='white',
+                   selectcolor='#3c3c3c').pack(anchor=W, padx=10, pady=5)
+        
         Label(left_frame, text="Порог градиента:", bg='#3c3c3c', fg='white').pack(anchor=W, padx=10)
         Scale(left_frame, from_=0, to=100, variable=self.gradient_threshold_var,
               orient=HORIZONTAL, length=200, bg='#3c3c3c', fg='white').pack(pady=(0, 10))
@@ -166,6 +239,32 @@ class AsciiArtPro:
                    variable=self.export_html_var, bg='#3c3c3c', fg='white',
                    selectcolor='#3c3c3c').pack(anchor=W, padx=10, pady=5)
         
+        html_colors_frame = Frame(left_frame, bg='#3c3c3c')
+        html_colors_frame.pack(anchor=W, padx=10)
+        Label(html_colors_frame, text="Уровней цвета в HTML (0 = точно):",
+              bg='#3c3c3c', fg='white').pack(side=LEFT)
+        Spinbox(html_colors_frame, from_=0, to=64, textvariable=self.html_colors_var,
+                width=4).pack(side=LEFT, padx=5)
+        
+        dedup_frame = Frame(left_frame, bg='#3c3c3c')
+        dedup_frame.pack(anchor=W, padx=10, pady=(5, 0))
+        Label(dedup_frame, text="Допуск повторов кадров GIF (0 = точные):",
+              bg='#3c3c3c', fg='white').pack(side=LEFT)
+        Spinbox(dedup_frame, from_=0, to=32, increment=0.5, textvariable=self.dedup_tolerance_var,
+                width=4).pack(side=LEFT, padx=5)
+        
+        video_frame = Frame(left_frame, bg='#3c3c3c')
+        video_frame.pack(anchor=W, padx=10, pady=(5, 0))
+        Label(video_frame, text="Видео, с:", bg='#3c3c3c', fg='white').pack(side=LEFT)
+        Spinbox(video_frame, from_=0, to=36000, increment=1, textvariable=self.start_time_var,
+                width=5).pack(side=LEFT, padx=2)
+        Label(video_frame, text="до", bg='#3c3c3c', fg='white').pack(side=LEFT)
+        Spinbox(video_frame, from_=0, to=36000, increment=1, textvariable=self.end_time_var,
+                width=5).pack(side=LEFT, padx=2)
+        Label(video_frame, text="к/с:", bg='#3c3c3c', fg='white').pack(side=LEFT)
+        Spinbox(video_frame, from_=0, to=60, increment=1, textvariable=self.max_fps_var,
+                width=3).pack(side=LEFT, padx=2)
+        
         btn_frame = Frame(left_frame, bg='#3c3c3c')
         btn_frame.pack(pady=10)
         
@@ -182,6 +281,17 @@ class AsciiArtPro:
                               command=self.save_ascii, state=DISABLED, **btn_style)
         self.btn_save.pack(pady=10)
         
+        self.btn_raster = Button(left_frame, text="🖼 ЭКСПОРТ PNG/GIF/MP4", command=self.export_raster,
+                                 state=DISABLED, bg='#555555', fg='white', bd=0, padx=10, pady=5)
+        self.btn_raster.pack(pady=(0, 10))
+        
+        profile_frame = Frame(left_frame, bg='#3c3c3c')
+        profile_frame.pack(anchor=W, padx=10)
+        Checkbutton(profile_frame, text="Замерять этапы", variable=self.profile_var,
+                    bg='#3c3c3c', fg='white', selectcolor='#3c3c3c').pack(side=LEFT)
+        Button(profile_frame, text="📊 Профиль", command=self.show_profile,
+               bg='#555555', fg='white', bd=0, padx=8).pack(side=LEFT, padx=5)
+        
         self.progress = ttk.Progressbar(left_frame, orient=HORIZONTAL, length=250, mode='determinate')
         self.progress.pack(pady=10)
         
@@ -194,6 +304,9 @@ class AsciiArtPro:
         
         # Виджет для текста
         self.text_frame = Frame(self.right_content, bg='#1e1e1e')
+        self.playback_var = StringVar(value="")
+        Label(self.text_frame, textvariable=self.playback_var, bg='#1e1e1e', fg='#aaaaaa',
+              anchor=W).pack(side=BOTTOM, fill=X)
         self.ascii_text = scrolledtext.ScrolledText(self.text_frame, font=('Courier', self.font_size),
                                                     bg='black', fg='white',
                                                     insertbackground='white',
@@ -208,17 +321,20 @@ class AsciiArtPro:
                           bg='#3c3c3c', fg='white', anchor=W, relief=SUNKEN)
         status_bar.pack(side=BOTTOM, fill=X)
     
-    def show_image_mode(self, pil_image=None, gif_frames=None):
+    def show_image_mode(self, pil_image=None, gif_preview=None):
         """Показывает картинку или анимацию в правой панели, скрывает текст."""
         self.stop_animation()          # останавливаем предыдущую анимацию
         self.stop_ascii_animation()    # останавливаем ASCII-анимацию
         self.text_frame.pack_forget()
         self.image_label.pack(fill=BOTH, expand=True)
         
-        if gif_frames is not None:
-            # Это анимация
-            self.gif_original_frames = gif_frames
-            self.anim_index = 0
+        if gif_preview is not None:
+            # Это анимация: кадры декодируются в фоне, первый покажется сразу, как будет готов
+            self.gif_preview = gif_preview
+            self.preview_photos.clear()
+            self.anim_index = -1
+            self.anim_scheduler = None
+            self.image_label.config(image='', text="Загрузка...")
             self.play_animation()
         elif pil_image is not None:
             # Статичное изображение
@@ -226,14 +342,50 @@ class AsciiArtPro:
             self.image_label.config(image=self.preview_photo, text="")
     
     def play_animation(self):
-        """Воспроизводит следующий кадр GIF."""
-        if not self.gif_original_frames:
+        """Показывает кадр GIF, положенный по времени, с его собственной длительностью."""
+        self.anim_timer = None
+        preview = self.gif_preview
+        if preview is None:
+            return
+        if preview.error is not None:
+            self.status_var.set(f"Не удалось загрузить превью: {preview.error}")
             return
-        frame = self.gif_original_frames[self.anim_index]
-        self.preview_photo = ImageTk.PhotoImage(frame)
-        self.image_label.config(image=self.preview_photo)
-        self.anim_index = (self.anim_index + 1) % len(self.gif_original_frames)
-        self.anim_timer = self.root.after(100, self.play_animation)
+        if self.anim_scheduler is None:
+            # Длительности ещё читаются - пока показываем первый кадр
+            self._show_preview_frame(0)
+            if preview.durations is not None:
+                self.anim_scheduler = FrameScheduler(preview.durations)
+            self.anim_timer = self.root.after(PREVIEW_POLL_MS, self.play_animation)
+            return
+        count = len(preview.durations)
+        index, delay = self.anim_scheduler.tick()
+        shown = self._show_preview_frame(index)
+        upcoming = [(index + k) % count for k in range(min(PREVIEW_AHEAD, count))]
+        preview.want([i for i in upcoming if i not in self.preview_photos])
+        if shown and count == 1:
+            return
+        # Кадр ещё не декодирован - проверяем чаще, чтобы показать его без опоздания
+        self.anim_timer = self.root.after(delay if shown else min(delay, PREVIEW_POLL_MS), self.play_animation)
+    
+    def _show_preview_frame(self, index):
+        """Показывает кадр превью, если он готов; False - кадр ещё декодируется."""
+        if index == self.anim_index:
+            return True
+        photo = self.preview_photos.get(index)
+        if photo is None:
+            frame = self.gif_preview.take(index)
+            if frame is None:
+                return False
+            photo = ImageTk.PhotoImage(frame)
+            self.preview_photos[index] = photo
+            while len(self.preview_photos) > PREVIEW_CACHE_FRAMES:
+                self.preview_photos.popitem(last=False)
+        else:
+            self.preview_photos.move_to_end(index)
+        self.preview_photo = photo
+        self.image_label.config(image=photo, text="")
+        self.anim_index = index
+        return True
     
     def stop_animation(self):
         """Останавливает анимацию, если она запущена."""
@@ -242,19 +394,22 @@ class AsciiArtPro:
             self.anim_timer = None
     
     def play_ascii_animation(self):
-        """Воспроизводит следующий кадр ASCII-анимации."""
+        """Запускает ASCII-анимацию: меняются только изменившиеся строки, отставшие кадры пропускаются."""
         if not self.ascii_frames:
             return
-        self.ascii_text.delete(1.0, END)
-        self.ascii_text.insert(1.0, self.ascii_frames[self.ascii_anim_index])
-        self.ascii_anim_index = (self.ascii_anim_index + 1) % len(self.ascii_frames)
-        self.ascii_anim_timer = self.root.after(100, self.play_ascii_animation)
+        self.ascii_player = TextPlayback(self.ascii_text, self.ascii_frames, self.ascii_durations,
+                                         on_frame=self._show_playback_stats)
+        self.ascii_player.start()
+    
+    def _show_playback_stats(self, player):
+        self.playback_var.set(f"Кадр {player.index + 1}/{len(player.frames)} | {player.fps:.1f} к/с | "
+                              f"пропущено кадров: {player.dropped}")
     
     def stop_ascii_animation(self):
         """Останавливает ASCII-анимацию."""
-        if self.ascii_anim_timer:
-            self.root.after_cancel(self.ascii_anim_timer)
-            self.ascii_anim_timer = None
+        if self.ascii_player is not None:
+            self.ascii_player.stop()
+        self.playback_var.set("")
     
     def show_text_mode(self, content=None, is_animation=False):
         """Показывает текстовое поле в правой панели, скрывает картинку."""
@@ -266,7 +421,6 @@ class AsciiArtPro:
             self.ascii_text.delete(1.0, END)
             self.ascii_text.insert(1.0, content)
         if is_animation and self.ascii_frames:
-            self.ascii_anim_index = 0
             self.play_ascii_animation()
     
     def change_font_size(self):
@@ -280,42 +434,52 @@ class AsciiArtPro:
     
     def stop_generation(self):
         self.stop_flag = True
+        self.progress_channel.cancel()
         self.status_var.set("Остановка...")
     
     def load_image(self):
+        video_types = " ".join(f"*{ext}" for ext in VIDEO_EXTENSIONS)
         filename = filedialog.askopenfilename(
-            title="Выберите изображение или GIF",
-            filetypes=[("Images", "*.jpg *.jpeg *.png *.bmp *.gif")]
+            title="Выберите изображение, GIF или видео",
+            filetypes=[("Images", "*.jpg *.jpeg *.png *.bmp *.gif"), ("Видео", video_types),
+                       ("ASCII-контейнер", f"*{CONTAINER_EXTENSION}"), ("Все файлы", "*.*")]
         )
         if filename:
+            pattern = sequence_pattern_for(filename)
+            if pattern is not None and messagebox.askyesno(
+                    "Последовательность кадров",
+                    f"Рядом есть другие пронумерованные кадры.\n\n"
+                    f"Загрузить всю последовательность ({os.path.basename(pattern)}) как анимацию?"):
+                filename = pattern
             self.image_path = filename
             # Сбрасываем флаги
             self.is_gif_result = False
             self.gif_frames = None
+            self.container = None
             self.ascii_frames = []
+            self.live_state = None
+            self._cancel_live_render()
+            if self.gif_preview is not None:
+                self.gif_preview.close()
+                self.gif_preview = None
+            if is_container(filename):
+                self._open_container(filename)
+                return
             # Загружаем и показываем
             try:
-                img = Image.open(filename)
-                if filename.lower().endswith('.gif'):
-                    # Это GIF — извлекаем все кадры
-                    frames = []
-                    try:
-                        while True:
-                            frame_copy = img.copy().convert('RGB')
-                            frame_copy.thumbnail((800, 600))
-                            frames.append(frame_copy)
-                            img.seek(img.tell() + 1)
-                    except EOFError:
-                        pass
-                    if frames:
-                        self.show_image_mode(gif_frames=frames)
-                    else:
-                        # Если не удалось извлечь кадры, показываем первый как статику
-                        img.thumbnail((800, 600))
-                        self.show_image_mode(pil_image=img)
+                if is_gif(filename):
+                    # Это GIF — кадры декодируются в фоне по мере воспроизведения
+                    self.show_image_mode(gif_preview=LazyGifPreview(filename))
+                elif is_animation(filename):
+                    # Видео или последовательность - превью по первому кадру
+                    self.show_image_mode(pil_image=self._first_frame_preview(filename))
                 else:
-                    # Обычное изображение
-                    img.thumbnail((800, 600))
+                    # Обычное изображение; очень большое читается уменьшенным
+                    if should_tile(filename):
+                        img = preview_image(filename, PREVIEW_SIZE)
+                    else:
+                        img = Image.open(filename)
+                        img.thumbnail(PREVIEW_SIZE)
                     self.show_image_mode(pil_image=img)
                 
                 self.status_var.set(f"Загружено: {os.path.basename(filename)}")
@@ -324,41 +488,71 @@ class AsciiArtPro:
                 self.show_text_mode(f"Ошибка загрузки {os.path.basename(filename)}")
             self.stop_flag = False
             self.btn_save.config(state=DISABLED)
+            self.btn_raster.config(state=DISABLED)
     
     def generate_ascii(self):
         if not self.image_path:
             messagebox.showwarning("Внимание", "Сначала выберите изображение!")
             return
+        if self.container is not None:
+            messagebox.showinfo("Контейнер", "Кадры контейнера уже готовы: их можно проиграть и сохранить. "
+                                             "Для новой конвертации откройте исходник.")
+            return
         
         self.save_settings()
         self.btn_save.config(state=DISABLED)
+        self.btn_raster.config(state=DISABLED)
         self.stop_btn.config(state=NORMAL)
         self.stop_flag = False
+        self.generating = True
+        self._cancel_live_render()
         self.progress['value'] = 0
         self.status_var.set("Генерация...")
-        
-        thread = threading.Thread(target=self._generate_thread)
+        self.generation_start = time.perf_counter()
+        self.progress_channel = ProgressChannel()
+        # Превью GIF на экране: на время конвертации оно берёт кадры из её прохода декодирования
+        self.preview_shared = (self.gif_preview is not None and self.anim_timer is not None
+                               and is_gif(self.image_path))
+        if self.preview_shared:
+            self.stop_animation()
+            self.gif_preview.want([])
+        
+        thread = threading.Thread(target=self._generate_thread, args=(self.progress_channel,))
         thread.daemon = True
         thread.start()
+        if self.progress_job is None:
+            self._poll_progress()
+    
+    def _current_params(self):
+        palette_name = self.palette_var.get()
+        return ConversionParams(
+            width=self.width_var.get(),
+            palette=self.palettes.get(palette_name, list(self.palettes.values())[0]),
+            gamma=self.contrast_var.get(),
+            use_edges=self.edges_var.get(),
+            use_gradient=self.use_gradient_var.get(),
+            grad_thresh=self.gradient_threshold_var.get(),
+            v_compress=self.v_compress_var.get(),
+            export_html=self.export_html_var.get(),
+            dedup_tolerance=self.dedup_tolerance_var.get(),
+            start_time=self.start_time_var.get(),
+            end_time=self.end_time_var.get(),
+            max_fps=self.max_fps_var.get(),
+            shape_match=self.shape_match_var.get()
+        )
     
-    def _generate_thread(self):
+    def _generate_thread(self, channel):
         try:
-            width = self.width_var.get()
-            palette_name = self.palette_var.get()
-            palette = self.palettes.get(palette_name, list(self.palettes.values())[0])
-            gamma = self.contrast_var.get()
-            use_edges = self.edges_var.get()
-            use_gradient = self.use_gradient_var.get()
-            grad_thresh = self.gradient_threshold_var.get()
-            v_compress = self.v_compress_var.get()
-            export_html = self.export_html_var.get()
-            
-            is_gif = self.image_path.lower().endswith('.gif')
+            params = self._current_params()
+            if is_animation(self.image_path):
+                channel.total = source_frame_count(self.image_path, params)
             
-            if is_gif:
-                self._process_gif(width, palette, gamma, use_edges, use_gradient, grad_thresh, v_compress, export_html)
-            else:
-                self._process_single_image(width, palette, gamma, use_edges, use_gradient, grad_thresh, v_compress, export_html)
+            self.profiler = Profiler() if self.profile_var.get() else None
+            with self._profiling():
+                if is_animation(self.image_path):
+                    self._process_gif(params, channel)
+                else:
+                    self._process_single_image(params, channel)
             
             if not self.stop_flag:
                 self.root.after(0, self._generation_done)
@@ -368,210 +562,172 @@ class AsciiArtPro:
             self.root.after(0, lambda: messagebox.showerror("Ошибка", str(e)))
             self.root.after(0, self._generation_finished)
     
-    def _process_single_image(self, width, palette, gamma, use_edges, use_gradient, grad_thresh, v_compress, export_html):
-        img = self._load_image(self.image_path)
-        if img is None:
-            raise ValueError("Не удалось загрузить изображение")
-        
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        inv_gamma = 1.0 / gamma
-        table = np.array([((i / 255.0) ** inv_gamma) * 255 for i in range(256)]).astype("uint8")
-        gray = cv2.LUT(gray, table)
-        gray = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
-        
-        if use_edges:
-            edges = cv2.Canny(gray, 100, 200)
-            kernel = np.ones((2, 2), np.uint8)
-            edges = cv2.dilate(edges, kernel, iterations=1)
-            gray = cv2.addWeighted(gray, 0.8, edges, 0.2, 0)
-        
-        height, orig_width = gray.shape
-        char_aspect = 2.0
-        aspect_ratio = height / orig_width
-        new_height = int(width * aspect_ratio / char_aspect * v_compress)
-        if new_height < 1:
-            new_height = 1
-        
-        resized = cv2.resize(gray, (width, new_height), interpolation=cv2.INTER_CUBIC)
-        
-        if use_gradient:
-            gx = cv2.Sobel(resized, cv2.CV_64F, 1, 0, ksize=3)
-            gy = cv2.Sobel(resized, cv2.CV_64F, 0, 1, ksize=3)
-            magnitude = np.sqrt(gx**2 + gy**2)
-            angle = np.arctan2(gy, gx) * 180 / np.pi
-            angle = (angle + 360) % 360
+    def batch_convert(self):
+        """Конвертирует все файлы папки с текущими настройками; прерванный пакет продолжается с места остановки."""
+        if self.generating:
+            return
+        source = filedialog.askdirectory(title="Папка с изображениями")
+        if not source:
+            return
+        target = filedialog.askdirectory(title="Куда сохранить результаты")
+        if not target:
+            return
+        items = find_inputs([source])
+        if not items:
+            messagebox.showinfo("Пакетная обработка", "В папке нет изображений, GIF или видео.")
+            return
+        self.save_settings()
+        self.stop_btn.config(state=NORMAL)
+        self.stop_flag = False
+        self.generating = True
+        self.progress['value'] = 0
+        self.generation_start = time.perf_counter()
+        self.progress_channel = ProgressChannel(total=len(items))
+        thread = threading.Thread(target=self._batch_thread, args=(self.progress_channel, items, target))
+        thread.daemon = True
+        thread.start()
+        if self.progress_job is None:
+            self._poll_progress()
+    
+    def _batch_thread(self, channel, items, target):
+        try:
+            stats = run_batch(items, self._current_params(), target, html_colors=self.html_colors_var.get(),
+                              progress=channel.report, should_stop=channel.should_stop)
+            message = (f"Пакет: сконвертировано {stats.converted}, пропущено готовых {stats.skipped}, "
+                       f"ошибок {stats.failed} ({stats.seconds:.1f} с)")
+            self.root.after(0, lambda: self._batch_done(message))
+        except Exception as e:
+            # e удаляется по выходу из except, а lambda выполнится позже - сообщение берём сейчас
+            error = str(e) or type(e).__name__
+            self.root.after(0, lambda: messagebox.showerror("Ошибка", error))
+            self.root.after(0, self._generation_finished)
+    
+    def _batch_done(self, message):
+        self._generation_finished()
+        if self.stop_flag:
+            message = "Прервано; повторный запуск продолжит с места остановки. " + message
         else:
-            magnitude = None
-            angle = None
-        
-        chars = palette
-        char_range = len(chars) - 1
-        
-        ascii_str = ""
-        color_data = []
-        
-        if export_html:
-            img_color = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            self.resized_color = cv2.resize(img_color, (width, new_height), interpolation=cv2.INTER_CUBIC)
-        
-        for y in range(new_height):
-            if self.stop_flag:
-                return
-            line_chars = []
-            line_colors = []
-            for x in range(width):
-                pixel = resized[y, x]
-                
-                if use_gradient and magnitude is not None and magnitude[y, x] > grad_thresh:
-                    ang = angle[y, x]
-                    if (0 <= ang < 22.5) or (157.5 <= ang < 202.5) or (337.5 <= ang < 360):
-                        char = self.direction_chars['horizontal']
-                    elif (22.5 <= ang < 67.5) or (202.5 <= ang < 247.5):
-                        char = self.direction_chars['diag_up']
-                    elif (67.5 <= ang < 112.5) or (247.5 <= ang < 292.5):
-                        char = self.direction_chars['vertical']
-                    elif (112.5 <= ang < 157.5) or (292.5 <= ang < 337.5):
-                        char = self.direction_chars['diag_down']
-                    else:
-                        char = self.direction_chars['cross']
-                else:
-                    char_index = int(pixel / 255 * char_range)
-                    char = chars[char_index]
-                
-                line_chars.append(char)
-                
-                if export_html and self.resized_color is not None:
-                    r, g, b = self.resized_color[y, x]
-                    line_colors.append((r, g, b))
-            
-            ascii_str += ''.join(line_chars) + "\n"
-            if line_colors:
-                color_data.append(line_colors)
-            
-            # Обновление прогресса
-            self.root.after(0, lambda val=(y+1)/new_height*100: self.progress.config(value=val))
+            self.progress['value'] = 100
+        self.status_var.set(message)
+    
+    def _poll_progress(self):
+        """Забирает последнее состояние прогресса с фиксированной частотой, пока идёт генерация."""
+        if not self.generating:
+            self.progress_job = None
+            return
+        snapshot = self.progress_channel.poll()
+        if snapshot is not None and not self.progress_channel.cancelled:
+            self.progress['value'] = snapshot.fraction * 100
+            self.status_var.set("Генерация... " + format_progress(snapshot))
+        fed = self.gif_preview.take_fed() if self.preview_shared else None
+        if fed is not None:
+            self.preview_photo = ImageTk.PhotoImage(fed[1])
+            self.image_label.config(image=self.preview_photo, text="")
+            self.anim_index = -1
+        self.progress_job = self.root.after(PROGRESS_POLL_MS, self._poll_progress)
+    
+    def _convert_with_fields(self, params, channel, on_frame=None):
+        """Конвертирует через кэш и запоминает промежуточные данные для пересборки на лету."""
+        fields = self.cache.fields(self.image_path, params, progress=channel.report,
+                                   should_stop=channel.should_stop, on_frame=on_frame)
+        if fields is None or self.stop_flag:
+            return None
+        frames = self.cache.render(self.image_path, params, self.direction_chars, fields)
+        self.live_state = LiveState(fields[0], params, self.direction_chars)
+        self.live_params = params
+        return frames
+    
+    def _process_single_image(self, params, channel):
+        frames = self._convert_with_fields(params, channel)
+        if frames is None:
+            return
+        self.ascii_art = frames[0].text
+        self.ascii_color_data = frames[0].colors if params.export_html else None
+        self.ascii_frames = [frames[0].text]  # один кадр
+        self.ascii_durations = [frames[0].duration]
+    
+    def _process_gif(self, params, channel):
+        on_frame = self.gif_preview.feed if self.preview_shared else None
+        if channel.total > LIVE_MAX_FRAMES:
+            # Длинное видео: кадры идут потоком, в памяти остаются только результаты
+            self.live_state = None
+            gif_ascii_frames = convert_gif(self.image_path, params, self.direction_chars,
+                                           progress=channel.report, should_stop=channel.should_stop,
+                                           on_frame=on_frame)
+        else:
+            gif_ascii_frames = self._convert_with_fields(params, channel, on_frame)
+        if gif_ascii_frames is None:
+            return
         
-        self.ascii_art = ascii_str
-        self.ascii_color_data = color_data if export_html else None
-        self.ascii_frames = [ascii_str]  # один кадр
+        self.gif_frames = gif_ascii_frames
+        self.ascii_frames = [frame.text for frame in gif_ascii_frames]
+        self.ascii_durations = [frame.duration for frame in gif_ascii_frames]
+        self.is_gif_result = True
+        self.ascii_art = gif_ascii_frames[0].text
+        self.ascii_color_data = gif_ascii_frames[0].colors if params.export_html else None
+    
+    def _schedule_live_render(self, *args):
+        """Откладывает пересборку до простоя цикла Tk, схлопывая частые события ползунка."""
+        if self.live_state is None or self.generating or self.live_job is not None:
+            return
+        self.live_job = self.root.after_idle(self._live_render)
     
-    def _process_gif(self, width, palette, gamma, use_edges, use_gradient, grad_thresh, v_compress, export_html):
+    def _live_render(self):
+        self.live_job = None
         try:
-            pil_gif = Image.open(self.image_path)
-            frames = []
-            while True:
-                frame_rgb = pil_gif.convert('RGB')
-                frame_bgr = cv2.cvtColor(np.array(frame_rgb), cv2.COLOR_RGB2BGR)
-                frames.append(frame_bgr)
-                try:
-                    pil_gif.seek(pil_gif.tell() + 1)
-                except EOFError:
-                    break
-            
-            total_frames = len(frames)
-            if total_frames == 0:
-                raise ValueError("GIF не содержит кадров")
-            
-            gif_ascii_frames = []
-            ascii_strings = []  # для хранения только текста
-            
-            for idx, frame in enumerate(frames):
-                if self.stop_flag:
-                    return
-                
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                
-                inv_gamma = 1.0 / gamma
-                table = np.array([((i / 255.0) ** inv_gamma) * 255 for i in range(256)]).astype("uint8")
-                gray = cv2.LUT(gray, table)
-                gray = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
-                
-                if use_edges:
-                    edges = cv2.Canny(gray, 100, 200)
-                    kernel = np.ones((2, 2), np.uint8)
-                    edges = cv2.dilate(edges, kernel, iterations=1)
-                    gray = cv2.addWeighted(gray, 0.8, edges, 0.2, 0)
-                
-                height, orig_width = gray.shape
-                char_aspect = 2.0
-                aspect_ratio = height / orig_width
-                new_height = int(width * aspect_ratio / char_aspect * v_compress)
-                if new_height < 1:
-                    new_height = 1
-                
-                resized = cv2.resize(gray, (width, new_height), interpolation=cv2.INTER_CUBIC)
-                
-                if use_gradient:
-                    gx = cv2.Sobel(resized, cv2.CV_64F, 1, 0, ksize=3)
-                    gy = cv2.Sobel(resized, cv2.CV_64F, 0, 1, ksize=3)
-                    magnitude = np.sqrt(gx**2 + gy**2)
-                    angle = np.arctan2(gy, gx) * 180 / np.pi
-                    angle = (angle + 360) % 360
-                else:
-                    magnitude = None
-                    angle = None
-                
-                chars = palette
-                char_range = len(chars) - 1
-                
-                ascii_str = ""
-                color_data = []
-                
-                if export_html:
-                    img_color = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    resized_color = cv2.resize(img_color, (width, new_height), interpolation=cv2.INTER_CUBIC)
-                
-                for y in range(new_height):
-                    line_chars = []
-                    line_colors = []
-                    for x in range(width):
-                        pixel = resized[y, x]
-                        
-                        if use_gradient and magnitude is not None and magnitude[y, x] > grad_thresh:
-                            ang = angle[y, x]
-                            if (0 <= ang < 22.5) or (157.5 <= ang < 202.5) or (337.5 <= ang < 360):
-                                char = self.direction_chars['horizontal']
-                            elif (22.5 <= ang < 67.5) or (202.5 <= ang < 247.5):
-                                char = self.direction_chars['diag_up']
-                            elif (67.5 <= ang < 112.5) or (247.5 <= ang < 292.5):
-                                char = self.direction_chars['vertical']
-                            elif (112.5 <= ang < 157.5) or (292.5 <= ang < 337.5):
-                                char = self.direction_chars['diag_down']
-                            else:
-                                char = self.direction_chars['cross']
-                        else:
-                            char_index = int(pixel / 255 * char_range)
-                            char = chars[char_index]
-                        
-                        line_chars.append(char)
-                        
-                        if export_html and resized_color is not None:
-                            r, g, b = resized_color[y, x]
-                            line_colors.append((r, g, b))
-                    
-                    ascii_str += ''.join(line_chars) + "\n"
-                    if line_colors:
-                        color_data.append(line_colors)
-                
-                gif_ascii_frames.append((ascii_str, color_data))
-                ascii_strings.append(ascii_str)
-                progress_val = (idx+1)/total_frames * 100
-                self.root.after(0, lambda val=progress_val: self.progress.config(value=val))
-            
-            self.gif_frames = gif_ascii_frames
-            self.ascii_frames = ascii_strings
-            self.is_gif_result = True
-            self.ascii_art = gif_ascii_frames[0][0]
-            self.ascii_color_data = gif_ascii_frames[0][1] if export_html else None
-        except Exception as e:
-            raise e
+            params = self._current_params()
+        except TclError:
+            return  # поле ещё редактируется
+        if self.generating or not self.live_state.accepts(params) or params == self.live_params:
+            return
+        self.live_params = params
+        self._cancel_live_render()
+        # Сначала кадр, который сейчас на экране, затем остальные
+        count = len(self.live_state)
+        start = self.ascii_player.index % count if count > 1 and self.ascii_player is not None else 0
+        self.live_queue = deque(self.live_state.unique_order(start))
+        self._live_render_step()
+    
+    def _live_render_step(self):
+        """Пересобирает кадры порциями не дольше ~15 мс, чтобы не блокировать интерфейс."""
+        deadline = time.perf_counter() + 0.015
+        while self.live_queue and time.perf_counter() < deadline:
+            source = self.live_queue.popleft()
+            text = self.live_state.render_text(source, self.live_params)
+            for index in self.live_state.copies[source]:
+                if self.gif_frames is not None and self.is_gif_result:
+                    self.gif_frames[index] = self.gif_frames[index]._replace(text=text)
+                if index < len(self.ascii_frames):
+                    self.ascii_frames[index] = text
+            if source == 0:
+                self.ascii_art = text
+                if len(self.ascii_frames) <= 1 and self.text_frame.winfo_ismapped():
+                    self.show_text_mode(text)
+        if self.live_queue:
+            self.live_step_job = self.root.after(1, self._live_render_step)
+        else:
+            self.live_step_job = None
+            self.status_var.set("Обновлено без повторной генерации")
+    
+    def _cancel_live_render(self):
+        if self.live_step_job is not None:
+            self.root.after_cancel(self.live_step_job)
+            self.live_step_job = None
+        self.live_queue.clear()
     
     def _generation_done(self):
+        self.generating = False
+        self.preview_shared = False
         self.progress['value'] = 100
         self.stop_btn.config(state=DISABLED)
         self.btn_save.config(state=NORMAL)
-        self.status_var.set("Готово!")
+        self.btn_raster.config(state=NORMAL)
+        elapsed = time.perf_counter() - self.generation_start
+        status = f"Готово! ({elapsed:.2f} с) | {self.cache.summary()}"
+        if self.is_gif_result and self.live_state is not None:
+            status += f" | повторов кадров пропущено: {count_repeats(self.live_state.fields)}"
+        self.status_var.set(status)
+        self._refresh_profile()
         # Переключаемся на текстовый режим
         if self.ascii_frames and len(self.ascii_frames) > 1:
             # Это анимация
@@ -581,20 +737,22 @@ class AsciiArtPro:
             self.show_text_mode(self.ascii_art)
     
     def _generation_stopped(self):
-        self.stop_btn.config(state=DISABLED)
+        self._generation_finished()
         self.status_var.set("Прервано пользователем")
         self.progress['value'] = 0
     
     def _generation_finished(self):
+        self.generating = False
         self.stop_btn.config(state=DISABLED)
+        if self.preview_shared:
+            # Конвертация не дошла до конца - превью снова проигрывается само
+            self.preview_shared = False
+            self.play_animation()
     
     def save_ascii(self):
         if not self.ascii_art:
             return
         
-        base = os.path.splitext(os.path.basename(self.image_path))[0]
-        now = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        
         # Если это гифка и есть кадры, предлагаем сохранить анимацию (только при сохранении)
         if self.is_gif_result and self.gif_frames and len(self.gif_frames) > 1:
             choice = messagebox.askyesno("Сохранение анимации",
@@ -606,130 +764,217 @@ class AsciiArtPro:
                 return
             # иначе продолжаем обычное сохранение (первый кадр)
         
-        if self.export_html_var.get() and self.ascii_color_data:
-            default_name = f"{base}_{now}.html"
+        if self.export_html_var.get() and self.ascii_color_data is not None:
+            default_name = output_name(self.image_path, ext='.html')
             filename = filedialog.asksaveasfilename(
                 defaultextension=".html",
-                filetypes=[("HTML", "*.html"), ("Все файлы", "*.*")],
+                filetypes=[("HTML", "*.html"), ("ASCII-контейнер", f"*{CONTAINER_EXTENSION}"),
+                           ("Все файлы", "*.*")],
                 initialfile=default_name
             )
-            if filename:
+            if filename and is_container(filename):
+                self._save_container(filename)
+            elif filename:
                 self.save_as_html(filename, single=True)
         else:
-            default_name = f"{base}_{now}.txt"
+            default_name = output_name(self.image_path, ext='.txt')
             filename = filedialog.asksaveasfilename(
                 defaultextension=".txt",
-                filetypes=[("Text", "*.txt"), ("Все файлы", "*.*")],
+                filetypes=[("Text", "*.txt"), ("ASCII-контейнер", f"*{CONTAINER_EXTENSION}"), ("Все файлы", "*.*")],
                 initialfile=default_name
             )
-            if filename:
-                with open(filename, 'w', encoding='utf-8') as f:
-                    f.write(self.ascii_art)
+            if filename and is_container(filename):
+                self._save_container(filename)
+            elif filename:
+                with self._profiling():
+                    write_text(filename, self.ascii_art)
+                self._refresh_profile()
                 self.status_var.set(f"Сохранено: {os.path.basename(filename)}")
                 messagebox.showinfo("Успех", "ASCII арт сохранён!")
     
     def _save_animated_html(self):
-        base = os.path.splitext(os.path.basename(self.image_path))[0]
-        now = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        default_name = f"{base}_animated_{now}.html"
+        default_name = output_name(self.image_path, '_animated', '.html')
         filename = filedialog.asksaveasfilename(
             defaultextension=".html",
-            filetypes=[("HTML", "*.html"), ("Все файлы", "*.*")],
+            filetypes=[("HTML", "*.html"), ("ASCII-контейнер", f"*{CONTAINER_EXTENSION}"), ("Все файлы", "*.*")],
             initialfile=default_name
         )
         if not filename:
             return
+        if is_container(filename):
+            self._save_container(filename)
+            return
         
-        html_lines = ['<!DOCTYPE html><html><head><meta charset="UTF-8">',
-                      '<style>body { background: black; font-family: "Courier New", monospace; font-size: 8px; line-height: 8px; }',
-                      '#ascii-container { white-space: pre; }',
-                      '</style>',
-                      '</head><body>',
-                      '<div id="ascii-container"></div>',
-                      '<script>']
-        
-        frames_js = []
-        for ascii_str, color_data in self.gif_frames:
-            lines = ascii_str.split('\n')
-            html_frame = ''
-            for y, line in enumerate(lines):
-                if y >= len(color_data):
-                    html_frame += line + '\n'
-                    continue
-                for x, ch in enumerate(line):
-                    if x < len(color_data[y]):
-                        r, g, b = color_data[y][x]
-                        html_frame += f'<span style="color: rgb({r},{g},{b});">{ch}</span>'
-                    else:
-                        html_frame += ch
-                html_frame += '\n'
-            frame_escaped = html_frame.replace('\\', '\\\\').replace('`', '\\`').replace('${', '\\${')
-            frames_js.append(frame_escaped)
-        
-        html_lines.append(f'const frames = [`{frames_js[0]}`')
-        for frame in frames_js[1:]:
-            html_lines.append(',')
-            html_lines.append(f'`{frame}`')
-        html_lines.append('];')
-        
-        html_lines.extend([
-            'let currentFrame = 0;',
-            'const container = document.getElementById("ascii-container");',
-            'function showFrame() {',
-            '  container.innerHTML = frames[currentFrame];',
-            '  currentFrame = (currentFrame + 1) % frames.length;',
-            '}',
-            'setInterval(showFrame, 100);',
-            '</script></body></html>'
-        ])
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(html_lines))
-        
-        self.status_var.set(f"Сохранена анимация: {os.path.basename(filename)}")
+        try:
+            with self._profiling():
+                stats = write_delta_html(filename, self.gif_frames, quantize=self.html_colors_var.get())
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Не удалось сохранить: {e}")
+            return
+        self._refresh_profile()
+        
+        self.status_var.set(f"Сохранена анимация: {os.path.basename(filename)} ({format_stats(stats)})")
         if messagebox.askyesno("Открыть", "Открыть анимацию в браузере?"):
             webbrowser.open(filename)
     
+    def export_raster(self):
+        """Сохраняет результат картинкой (PNG - текущий кадр) или анимацией GIF/MP4."""
+        if not self.ascii_art:
+            return
+        animated = self.is_gif_result and self.gif_frames and len(self.gif_frames) > 1
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".gif" if animated else ".png",
+            filetypes=[("GIF", "*.gif"), ("MP4", "*.mp4"), ("PNG", "*.png")] if animated else
+                      [("PNG", "*.png"), ("GIF", "*.gif")],
+            initialfile=output_name(self.image_path, '_animated' if animated else '',
+                                    '.gif' if animated else '.png')
+        )
+        if not filename:
+            return
+        frames = self.gif_frames if animated else [AsciiFrame(self.ascii_art, self.ascii_color_data)]
+        # В контейнере могут быть символы другой палитры - атлас строится по его таблице
+        palette = self.container.table if self.container is not None else self._current_params().palette
+        try:
+            with self._profiling():
+                stats = write_raster(filename, frames, palette, self.direction_chars, font_size=self.font_size)
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Не удалось сохранить: {e}")
+            return
+        self._refresh_profile()
+        self.status_var.set(f"Сохранено: {os.path.basename(filename)} ({format_raster_stats(stats)})")
+    
+    def _save_container(self, filename):
+        """Сохраняет все кадры результата в контейнер .asca (открывается снова без конвертации)."""
+        animated = self.is_gif_result and self.gif_frames and len(self.gif_frames) > 1
+        frames = self.gif_frames if animated else [AsciiFrame(self.ascii_art, self.ascii_color_data)]
+        params = self.container.params if self.container is not None else self._current_params()
+        # Кадры читаются из того же файла: отображение закрывается перед заменой, затем файл открывается заново
+        reopen = self.container is not None and os.path.abspath(self.container.path) == os.path.abspath(filename)
+        try:
+            with self._profiling():
+                stats = write_container(filename, frames, params, os.path.basename(self.image_path),
+                                        before_replace=self.container.close if reopen else None)
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Не удалось сохранить: {e}")
+            return
+        finally:
+            if reopen:
+                self._open_container(filename)
+        self._refresh_profile()
+        self.status_var.set(f"Сохранён контейнер: {os.path.basename(filename)} ({format_container_stats(stats)})")
+    
+    def _open_container(self, filename):
+        """Открывает сохранённый контейнер: кадры читаются из файла по мере воспроизведения и экспорта."""
+        try:
+            container = ContainerReader(filename)
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Не удалось открыть контейнер: {e}")
+            return
+        self.container = container
+        first = container[0]
+        self.ascii_art = first.text
+        self.ascii_color_data = first.colors
+        self.ascii_durations = container.durations
+        if len(container) > 1:
+            self.gif_frames = container
+            self.ascii_frames = container.texts
+            self.is_gif_result = True
+            self.show_text_mode(is_animation=True)
+        else:
+            self.ascii_frames = [first.text]
+            self.show_text_mode(self.ascii_art)
+        self.btn_save.config(state=NORMAL)
+        self.btn_raster.config(state=NORMAL)
+        self.status_var.set(f"Открыт контейнер: {os.path.basename(filename)} | кадров {len(container)}"
+                            + (f" | исходник: {container.source}" if container.source else ""))
+    
     def save_as_html(self, filename, single=False):
         if single:
-            html = ['<!DOCTYPE html><html><head><meta charset="UTF-8"><style>',
-                    'body { background: black; font-family: "Courier New", monospace; font-size: 8px; line-height: 8px; }',
-                    'pre { margin: 0; }',
-                    '</style></head><body><pre>']
-            
-            lines = self.ascii_art.split('\n')
-            for y, line in enumerate(lines):
-                if y >= len(self.ascii_color_data):
-                    break
-                html_line = ''
-                for x, ch in enumerate(line):
-                    if x < len(self.ascii_color_data[y]):
-                        r, g, b = self.ascii_color_data[y][x]
-                        html_line += f'<span style="color: rgb({r},{g},{b});">{ch}</span>'
-                    else:
-                        html_line += ch
-                html.append(html_line)
+            with self._profiling():
+                stats = write_html(filename, self.ascii_art, self.ascii_color_data,
+                                   quantize=self.html_colors_var.get())
+            self._refresh_profile()
             
-            html.append('</pre></body></html>')
-            
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write('\n'.join(html))
-            
-            self.status_var.set(f"Сохранён цветной HTML: {os.path.basename(filename)}")
+            self.status_var.set(f"Сохранён цветной HTML: {os.path.basename(filename)} ({format_stats(stats)})")
             messagebox.showinfo("Успех", "Цветной HTML сохранён!")
     
+    def _profiling(self):
+        """Замеры этапов в текущем потоке, если включено 'Замерять этапы'."""
+        return self.profiler.activate() if self.profiler is not None else nullcontext()
+    
+    def show_profile(self):
+        """Окно с итогом замеров по этапам последней генерации и сохранения."""
+        if self.profile_window is not None and self.profile_window.winfo_exists():
+            self.profile_window.lift()
+            self._refresh_profile()
+            return
+        window = Toplevel(self.root)
+        window.title("Профиль этапов")
+        window.configure(bg='#2b2b2b')
+        columns = ('count', 'time', 'share', 'memory', 'size')
+        tree = ttk.Treeview(window, columns=columns, height=12)
+        tree.heading('#0', text="Этап")
+        for column, title in zip(columns, ("Вызовов", "Время, мс", "Доля", "Память, МБ", "Данные, МБ")):
+            tree.heading(column, text=title)
+            tree.column(column, width=90, anchor=E)
+        tree.pack(fill=BOTH, expand=True, padx=10, pady=10)
+        Button(window, text="Сохранить трассу JSON", command=self.save_profile_trace,
+               bg='#555555', fg='white', bd=0, padx=10, pady=5).pack(pady=(0, 10))
+        window.tree = tree
+        self.profile_window = window
+        self._refresh_profile()
+    
+    def _refresh_profile(self):
+        if self.profile_window is None or not self.profile_window.winfo_exists():
+            return
+        tree = self.profile_window.tree
+        tree.delete(*tree.get_children())
+        if self.profiler is None:
+            tree.insert('', END, text="Включите 'Замерять этапы' и сгенерируйте заново")
+            return
+        summary = self.profiler.summary()
+        total = sum(item['seconds'] for item in summary.values()) or 1.0
+        for name, item in summary.items():
+            memory = f"{item['memory'] / (1 << 20):.2f}" if item['memory'] is not None else "-"
+            tree.insert('', END, text=name, values=(
+                item['count'], f"{item['seconds'] * 1000:.1f}", f"{item['seconds'] / total:.0%}",
+                memory, f"{item['size'] / (1 << 20):.2f}"))
+    
+    def save_profile_trace(self):
+        if self.profiler is None:
+            messagebox.showinfo("Профиль", "Нет замеров: включите 'Замерять этапы' и сгенерируйте заново.")
+            return
+        base = os.path.splitext(os.path.basename(self.image_path or 'ascii'))[0]
+        now = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("JSON", "*.json"), ("Все файлы", "*.*")],
+            initialfile=f"{base}_trace_{now}.json"
+        )
+        if filename:
+            self.profiler.write_trace(filename)
+            self.status_var.set(f"Трасса сохранена: {os.path.basename(filename)} | "
+                                + "; ".join(format_summary(self.profiler.summary())[:3]))
+    
     def _load_image(self, path):
-        img = cv2.imread(path)
-        if img is None:
-            try:
-                pil_img = Image.open(path)
-                pil_img = pil_img.convert('RGB')
-                img = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
-            except:
-                return None
+        return load_image(path)
+    
+    def _first_frame_preview(self, path):
+        """Первый кадр видео или последовательности, уменьшенный до размера превью."""
+        frames = iter_source_frames(path, ConversionParams())
+        try:
+            frame = next(frames, None)
+        finally:
+            frames.close()
+        if frame is None:
+            raise ValueError("Не удалось прочитать первый кадр")
+        img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        img.thumbnail(PREVIEW_SIZE)
         return img
 
 if __name__ == "__main__":
+    # Нужно для пула процессов в собранном PyInstaller exe
+    multiprocessing.freeze_support()
     root = Tk()
     app = AsciiArtPro(root)
     root.mainloop()
\ No newline at end of file
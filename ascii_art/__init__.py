@@ -0,0 +1,7 @@
+from .engine import DIRECTION_KEYS, glyph_table, glyph_indices, indices_to_text, map_glyphs
+from .core import (PALETTES, DIRECTION_CHARS, ConversionParams, AsciiFrame, load_image, convert_frame,
+                   convert_image, convert_gif, convert_file)
+from .preprocess import FrameFields, Preprocessor, preprocessor_for
+from .cache import ConversionCache
+from .timing import FrameTiming, FrameScheduler
+from .profiling import Profiler, StageRecord
@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime
+from functools import partial
+
+from .cli import add_conversion_arguments, expand_inputs, params_from_args, save_result
+from .core import IMAGE_EXTENSIONS, NAME_TEMPLATE, convert_file, output_name
+from .parallel import ordered_map
+from .progress import ProgressChannel, format_progress
+from .sources import VIDEO_EXTENSIONS
+
+MANIFEST_NAME = 'ascii_manifest.json'
+# Меняется при изменении формата манифеста; старый манифест тогда не учитывается
+MANIFEST_VERSION = 1
+# Манифест переписывается не чаще раза в столько секунд (и в конце работы)
+MANIFEST_SAVE_INTERVAL = 2.0
+
+# Файл пакета: путь к исходнику, подпапка результата относительно выходной папки
+# и свой шаблон имени (None - общий), если по общему имя совпало бы с другим файлом
+BatchItem = namedtuple('BatchItem', ['path', 'folder', 'template'], defaults=[None])
+# Итог пакета: всего файлов, сконвертировано, пропущено как готовые, с ошибкой, время
+BatchStats = namedtuple('BatchStats', ['total', 'converted', 'skipped', 'failed', 'seconds'])
+
+
+def find_inputs(inputs, recursive=True):
+    """Файлы для пакетной обработки (BatchItem) из папок и масок, по порядку имён.
+
+    Структура подпапок сохраняется в folder, чтобы одинаковые имена из разных
+    папок не затирали друг друга.
+    """
+    extensions = IMAGE_EXTENSIONS + VIDEO_EXTENSIONS
+    items = []
+    for path in expand_inputs(inputs):
+        if not os.path.isdir(path):
+            items.append(BatchItem(path, ''))
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            if not recursive:
+                dirs.clear()
+            folder = os.path.relpath(root, path)
+            for name in sorted(files):
+                if name.lower().endswith(extensions):
+                    items.append(BatchItem(os.path.join(root, name), '' if folder == '.' else folder))
+    return list({os.path.abspath(item.path): item for item in items}.values())
+
+
+class BatchManifest:
+    """JSON-список уже сконвертированных файлов пакета.
+
+    Файл считается готовым, если он не менялся (размер и время изменения те же)
+    и его результат на месте. Манифест с другими настройками не учитывается.
+    Запись атомарная (через временный файл), так что прерванный запуск
+    оставляет целый манифест и следующий продолжает с места остановки.
+    """
+
+    def __init__(self, path, settings):
+        self.path = path
+        self.settings = settings
+        self.timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        self.done = {}
+        self.failed = {}
+        self._dirty = False
+        self._saved_at = 0.0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') != MANIFEST_VERSION or data.get('settings') != self.settings:
+            return
+        # Имена при продолжении - с временем первого запуска
+        self.timestamp = data.get('timestamp', self.timestamp)
+        self.done = data.get('done', {})
+
+    def is_done(self, path):
+        entry = self.done.get(os.path.abspath(path))
+        if entry is None:
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return (entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+                and os.path.exists(entry['output']))
+
+    def mark_done(self, path, output):
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        self.done[key] = {'output': os.path.abspath(output), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        self.failed.pop(key, None)
+        self._dirty = True
+
+    def mark_failed(self, path, error):
+        self.failed[os.path.abspath(path)] = error
+        self._dirty = True
+
+    def save(self, force=False):
+        if not self._dirty or (not force and time.monotonic() - self._saved_at < MANIFEST_SAVE_INTERVAL):
+            return
+        folder = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(folder, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'settings': self.settings, 'timestamp': self.timestamp,
+                       'done': self.done, 'failed': self.failed}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+
+def _output_key(item, output_dir, template, timestamp):
+    folder = os.path.join(output_dir, item.folder) if output_dir else os.path.dirname(item.path)
+    name = output_name(item.path, '', '', timestamp, item.template or template)
+    return os.path.normcase(os.path.abspath(os.path.join(folder, name)))
+
+
+def _group_by_output(items, output_dir, template, timestamp):
+    groups = {}
+    for item in items:
+        groups.setdefault(_output_key(item, output_dir, template, timestamp), []).append(item)
+    return groups
+
+
+def resolve_name_collisions(items, output_dir, template, timestamp):
+    """Разводит файлы, чьи результаты получили бы одно имя (p.jpg и p.png в одной папке).
+
+    Таким файлам шаблон дополняется расширением исходника ({base} -> {base}_{source_ext}).
+    Возвращает (items, conflicts): conflicts - пары (файл, файл с тем же именем
+    результата), которые развести не удалось; их конвертировать нельзя.
+    """
+    own = template.replace('{base}', '{base}_{source_ext}') if '{base}' in template else template + '_{source_ext}'
+    colliding = {item.path for group in _group_by_output(items, output_dir, template, timestamp).values()
+                 if len(group) > 1 for item in group}
+    items = [item._replace(template=own) if item.path in colliding else item for item in items]
+    resolved = []
+    conflicts = []
+    # Группы идут в порядке своих первых файлов, так что порядок items сохраняется
+    for group in _group_by_output(items, output_dir, template, timestamp).values():
+        resolved.append(group[0])
+        conflicts += [(item, group[0]) for item in group[1:]]
+    return resolved, conflicts
+
+
+def convert_item(item, params, output_dir=None, html_colors=0, full_frames=False, template=NAME_TEMPLATE,
+                 timestamp=None):
+    """Конвертирует и сохраняет один файл пакета; возвращает (путь, имя результата, ошибка или None)."""
+    folder = os.path.join(output_dir, item.folder) if output_dir else None
+    try:
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        frames = convert_file(item.path, params, workers=1)
+        filename, _ = save_result(item.path, frames, params, folder, html_colors, full_frames,
+                                  item.template or template, timestamp)
+        return item.path, filename, None
+    except Exception as e:
+        return item.path, None, str(e) or type(e).__name__
+
+
+def run_batch(items, params, output_dir=None, manifest_path=None, template=NAME_TEMPLATE, html_colors=0,
+              full_frames=False, workers=None, progress=None, should_stop=None, log=None):
+    """Конвертирует файлы пакета в пуле процессов (по файлу на процесс); возвращает BatchStats.
+
+    Готовые по манифесту файлы пропускаются; манифест по умолчанию лежит в
+    выходной папке (или в текущей, если результаты сохраняются рядом с исходниками).
+    Файлы с совпадающими именами результатов разводятся (см. resolve_name_collisions),
+    а если не удалось - считаются ошибкой, чтобы не затереть чужой результат.
+    """
+    start = time.perf_counter()
+    output_name('x', template=template)  # неверный шаблон - ошибка сразу, а не в каждом файле
+    manifest_path = manifest_path or os.path.join(output_dir or os.getcwd(), MANIFEST_NAME)
+    manifest = BatchManifest(manifest_path, {'params': params._asdict(), 'template': template,
+                                             'html_colors': html_colors, 'full_frames': full_frames})
+    resolved, conflicts = resolve_name_collisions(items, output_dir, template, manifest.timestamp)
+    pending = [item for item in resolved if not manifest.is_done(item.path)]
+    skipped = len(resolved) - len(pending)
+    convert = partial(convert_item, params=params, output_dir=output_dir, html_colors=html_colors,
+                      full_frames=full_frames, template=template, timestamp=manifest.timestamp)
+    converted = 0
+    failed = len(conflicts)
+    for item, other in conflicts:
+        error = f"имя результата совпадает с {other.path}"
+        manifest.mark_failed(item.path, error)
+        if log is not None:
+            log(f"Ошибка: {item.path}: {error}")
+    try:
+        for path, filename, error in ordered_map(convert, pending, workers, should_stop=should_stop):
+            if error is None:
+                manifest.mark_done(path, filename)
+                converted += 1
+            else:
+                manifest.mark_failed(path, error)
+                failed += 1
+                if log is not None:
+                    log(f"Ошибка: {path}: {error}")
+            manifest.save()
+            if progress is not None:
+                progress((skipped + converted + failed) / len(items))
+    finally:
+        manifest.save(force=True)
+    return BatchStats(len(items), converted, skipped, failed, time.perf_counter() - start)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='ascii_art.batch',
+        description="Пакетная конвертация папок и масок с продолжением прерванного запуска."
+    )
+    parser.add_argument('inputs', nargs='+',
+                        help="Папки (обходятся рекурсивно) или маски файлов")
+    parser.add_argument('-o', '--output-dir', default=None,
+                        help="Папка для результатов со структурой подпапок (по умолчанию - рядом с исходниками)")
+    add_conversion_arguments(parser)
+    parser.add_argument('--name-template', default=NAME_TEMPLATE,
+                        help="Шаблон имени результата без расширения: поля {base}, {suffix}, {timestamp}, {source_ext}")
+    parser.add_argument('--manifest', default=None,
+                        help=f"Файл манифеста (по умолчанию - {MANIFEST_NAME} в папке результатов)")
+    parser.add_argument('--no-recursive', dest='recursive', action='store_false',
+                        help="Не заходить в подпапки")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="Число процессов (по умолчанию - по числу ядер)")
+    parser.set_defaults(stdout=False, terminal=False, raster=None)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    items = find_inputs(args.inputs, args.recursive)
+    if not items:
+        print("Нет файлов для обработки", file=sys.stderr)
+        return 1
+    channel = ProgressChannel(total=len(items), interval=1.0)
+
+    def report(fraction):
+        channel.report(fraction)
+        snapshot = channel.poll()
+        if snapshot is not None:
+            print(f"{snapshot.done:.0f}/{len(items)} | {format_progress(snapshot, 'файл')}", file=sys.stderr)
+
+    def log(message):
+        print(message, file=sys.stderr)
+
+    try:
+        stats = run_batch(items, params_from_args(args), args.output_dir, args.manifest, args.name_template,
+                          args.html_colors, args.html_full_frames, args.jobs, report, log=log)
+    except KeyboardInterrupt:
+        log("Прервано; следующий запуск продолжит с места остановки")
+        return 130
+    log(f"Готово за {stats.seconds:.1f} с: сконвертировано {stats.converted}, пропущено готовых {stats.skipped}, "
+        f"ошибок {stats.failed}")
+    return 1 if stats.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
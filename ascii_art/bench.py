@@ -0,0 +1,290 @@
+"""Замеры скорости конвертации по этапам на синтетических изображениях и GIF.
+
+    python -m ascii_art.bench -o bench.json
+    python -m ascii_art.bench --quick -o new.json --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from itertools import product
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from .core import (PALETTES, DIRECTION_CHARS, ConversionParams, convert_gif, iter_gif_frames, load_image,
+                   resolve_palette)
+from .engine import map_glyphs
+from .export import write_animated_html, write_html, write_text
+from .parallel import default_workers
+from .player import write_delta_html
+from .preprocess import compute_gradient, preprocessor_for
+
+# Наборы случаев: полный и быстрый (для проверки перед коммитом)
+FULL = {
+    'resolutions': [(640, 480), (1920, 1080), (3840, 2160)],
+    'widths': [80, 150, 300],
+    'gif_resolution': (480, 360),
+    'gif_frames': [10, 60],
+}
+QUICK = {
+    'resolutions': [(640, 480)],
+    'widths': [150],
+    'gif_resolution': (320, 240),
+    'gif_frames': [10],
+}
+
+# Отклонение, начиная с которого compare_results сообщает об изменении
+DEFAULT_THRESHOLD = 0.1
+
+
+def synthetic_image(width, height, seed=0):
+    """BGR-изображение с плавными переходами, фигурами и шумом - есть и границы, и градиенты."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    cx, cy = width / 2, height / 2
+    radial = np.hypot(x - cx, y - cy) / np.hypot(cx, cy)
+    img = np.empty((height, width, 3), np.uint8)
+    img[..., 0] = (255 * x / max(width - 1, 1)).astype(np.uint8)
+    img[..., 1] = (255 * (1 - radial)).clip(0, 255).astype(np.uint8)
+    img[..., 2] = (255 * y / max(height - 1, 1)).astype(np.uint8)
+    scale = min(width, height)
+    for _ in range(12):
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        if rng.random() < 0.5:
+            cv2.circle(img, center, int(rng.integers(scale // 20, scale // 5)), color, -1)
+        else:
+            corner = (center[0] + int(rng.integers(scale // 10, scale // 3)),
+                      center[1] + int(rng.integers(scale // 10, scale // 3)))
+            cv2.rectangle(img, center, corner, color, -1)
+    noise = rng.integers(-12, 13, img.shape, dtype=np.int16)
+    return (img.astype(np.int16) + noise).clip(0, 255).astype(np.uint8)
+
+
+def synthetic_gif(path, width, height, frames, seed=0):
+    """GIF с движущимся кругом поверх фона; все кадры разные."""
+    background = synthetic_image(width, height, seed)
+    radius = max(min(width, height) // 8, 2)
+    images = []
+    for index in range(frames):
+        img = background.copy()
+        phase = 2 * np.pi * index / frames
+        center = (int(width / 2 + width / 3 * np.cos(phase)), int(height / 2 + height / 3 * np.sin(phase)))
+        cv2.circle(img, center, radius, (255, 255, 255), -1)
+        images.append(Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB)))
+    images[0].save(path, save_all=True, append_images=images[1:], duration=80, loop=0)
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def time_frame(img, params, direction_chars=DIRECTION_CHARS):
+    """Прогоняет кадр по этапам конвейера по одному; возвращает (время этапов, текст, цвета)."""
+    pre = preprocessor_for(params)
+    times = {}
+    gray, times['contrast'] = _timed(pre.contrast, img)
+    if params.use_edges:
+        gray, times['edges'] = _timed(pre.edges, gray)
+    size = pre.output_size(img.shape)
+    resized, times['resize'] = _timed(pre.resize, gray, size)
+    magnitude = angle = None
+    if params.use_gradient:
+        (magnitude, angle), times['sobel'] = _timed(compute_gradient, resized)
+    if params.shape_match:
+        # Подбор по форме заменяет обычный подбор символов, а не добавляется к нему
+        detail, times['detail'] = _timed(pre.detail, gray, size)
+        text, times['glyphs_shape'] = _timed(map_glyphs, resized, magnitude, angle, params.palette,
+                                             direction_chars, params.grad_thresh, detail)
+    else:
+        text, times['glyphs'] = _timed(map_glyphs, resized, magnitude, angle, params.palette,
+                                       direction_chars, params.grad_thresh)
+    colors, times['color'] = _timed(pre.color, img, size)
+    return times, text, colors
+
+
+def _median_times(runs):
+    """Медиана по повторам для каждого этапа и для суммы этапов."""
+    stages = {stage: statistics.median(run[stage] for run in runs) for stage in runs[0]}
+    total = statistics.median(sum(run.values()) for run in runs)
+    return stages, total
+
+
+def bench_image(path, params, folder, repeat=3):
+    """Время этапов для одного изображения (медиана по repeat прогонам)."""
+    runs = []
+    for _ in range(repeat):
+        img, decode = _timed(load_image, path)
+        times, text, colors = time_frame(img, params)
+        times = {'decode': decode, **times}
+        _, times['write_txt'] = _timed(write_text, os.path.join(folder, 'out.txt'), text)
+        _, times['write_html'] = _timed(write_html, os.path.join(folder, 'out.html'), text, colors)
+        runs.append(times)
+    return _median_times(runs)
+
+
+def bench_gif(path, params, folder, repeat=3, workers=None):
+    """Время этапов для GIF (суммы по кадрам) и полной конвертации последовательно и в пуле."""
+    runs = []
+    for _ in range(repeat):
+        frames, decode = _timed(lambda: list(iter_gif_frames(path)))
+        times = {'decode': decode}
+        for img in frames:
+            frame_times, _, _ = time_frame(img, params)
+            for stage, seconds in frame_times.items():
+                times[stage] = times.get(stage, 0.0) + seconds
+        del frames
+        result, times['convert_serial'] = _timed(convert_gif, path, params, workers=1)
+        _, times['convert_parallel'] = _timed(convert_gif, path, params, workers=workers)
+        _, times['write_html'] = _timed(write_animated_html, os.path.join(folder, 'full.html'), result)
+        _, times['write_delta_html'] = _timed(write_delta_html, os.path.join(folder, 'delta.html'), result)
+        runs.append(times)
+    stages, _ = _median_times(runs)
+    # В сумму не входят полные конвертации - они повторяют замеренные этапы
+    total = sum(seconds for stage, seconds in stages.items() if not stage.startswith('convert_'))
+    return stages, total
+
+
+def case_id(case):
+    """Строковый ключ случая для сравнения прогонов."""
+    parts = [case['kind'], 'x'.join(map(str, case['resolution'])), f"w{case['width']}"]
+    if case['kind'] == 'gif':
+        parts.append(f"f{case['frames']}")
+    parts += [case['palette'], 'edges' if case['use_edges'] else 'no-edges',
+              'gradient' if case['use_gradient'] else 'no-gradient']
+    # Без подбора по форме ключ прежний, чтобы сравнивать с прогонами до этой оси
+    if case.get('shape_match'):
+        parts.append('shape')
+    return ' '.join(parts)
+
+
+def run_benchmarks(config=FULL, repeat=3, workers=None, palettes=None, log=None, shape=False):
+    """Прогоняет все случаи config; возвращает словарь для JSON.
+
+    shape=True добавляет в матрицу параметров подбор символов по форме.
+    """
+    palettes = palettes or list(PALETTES)
+    results = []
+    options = list(product(palettes, (True, False), (True, False), (False, True) if shape else (False,)))
+    with tempfile.TemporaryDirectory() as folder:
+        cases = []
+        for width, height in config['resolutions']:
+            path = os.path.join(folder, f'image_{width}x{height}.png')
+            cv2.imwrite(path, synthetic_image(width, height))
+            for ascii_width, (palette, use_edges, use_gradient, shape_match) in product(config['widths'], options):
+                cases.append(({'kind': 'image', 'resolution': [width, height], 'width': ascii_width,
+                               'palette': palette, 'use_edges': use_edges, 'use_gradient': use_gradient,
+                               'shape_match': shape_match}, path))
+        width, height = config['gif_resolution']
+        for frames in config['gif_frames']:
+            path = os.path.join(folder, f'anim_{frames}.gif')
+            synthetic_gif(path, width, height, frames)
+            for ascii_width, (palette, use_edges, use_gradient, shape_match) in product(config['widths'], options):
+                cases.append(({'kind': 'gif', 'resolution': [width, height], 'width': ascii_width,
+                               'frames': frames, 'palette': palette, 'use_edges': use_edges,
+                               'use_gradient': use_gradient, 'shape_match': shape_match}, path))
+
+        for number, (case, path) in enumerate(cases, 1):
+            params = ConversionParams(width=case['width'], palette=resolve_palette(case['palette']),
+                                      use_edges=case['use_edges'], use_gradient=case['use_gradient'],
+                                      export_html=True, shape_match=case['shape_match'])
+            if case['kind'] == 'gif':
+                stages, total = bench_gif(path, params, folder, repeat, workers)
+            else:
+                stages, total = bench_image(path, params, folder, repeat)
+            case['id'] = case_id(case)
+            case['stages'] = stages
+            case['total'] = total
+            results.append(case)
+            if log is not None:
+                log(f"[{number}/{len(cases)}] {case['id']}: {total * 1000:.1f} мс")
+
+    return {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'workers': workers or default_workers(),
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def compare_results(old, new, threshold=DEFAULT_THRESHOLD):
+    """Сравнивает два прогона; возвращает строки об этапах, изменившихся больше threshold."""
+    old_cases = {case['id']: case for case in old['results']}
+    lines = []
+    for case in new['results']:
+        before = old_cases.get(case['id'])
+        if before is None:
+            continue
+        for stage, seconds in list(case['stages'].items()) + [('total', case['total'])]:
+            was = before['total'] if stage == 'total' else before['stages'].get(stage)
+            if not was or not seconds:
+                continue
+            ratio = seconds / was
+            if abs(ratio - 1) > threshold:
+                word = "медленнее" if ratio > 1 else "быстрее"
+                lines.append(f"{case['id']} / {stage}: {was * 1000:.2f} -> {seconds * 1000:.2f} мс "
+                             f"(x{ratio:.2f}, {word})")
+    return lines
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='ascii_art.bench',
+                                     description="Замер скорости конвертации по этапам.")
+    parser.add_argument('-o', '--output', default='bench.json',
+                        help="Файл для результатов в JSON")
+    parser.add_argument('--quick', action='store_true',
+                        help="Только небольшие изображения и одна ширина")
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help="Повторов каждого замера (берётся медиана)")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="Процессов для параллельной конвертации GIF")
+    parser.add_argument('-p', '--palette', action='append', default=None,
+                        help=f"Палитры для матрицы параметров (по умолчанию все: {', '.join(PALETTES)})")
+    parser.add_argument('--shape', action='store_true',
+                        help="Добавить в матрицу подбор символов по форме (по умолчанию выключен)")
+    parser.add_argument('--compare', default=None,
+                        help="Прошлый JSON: вывести этапы, время которых изменилось")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Порог изменения для --compare (0.1 = 10%%)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    def log(message):
+        print(message, file=sys.stderr)
+
+    report = run_benchmarks(QUICK if args.quick else FULL, args.repeat, args.jobs, args.palette, log, args.shape)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    log(f"Результаты: {args.output}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            old = json.load(f)
+        changes = compare_results(old, report, args.threshold)
+        for line in changes:
+            print(line)
+        if not changes:
+            log("Существенных изменений нет")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
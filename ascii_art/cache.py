@@ -0,0 +1,240 @@
+import hashlib
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+
+from .core import DIRECTION_CHARS, AsciiFrame, load_fields, render_fields
+from .sources import is_sequence, sequence_digest
+
+# Этапы кэша: промежуточные данные кадров и готовый результат
+STAGES = ('fields', 'result')
+# Меняется при изменении формата записей, чтобы не читать старые файлы с диска
+FORMAT_VERSION = 2
+# Сколько хэшей файлов помнить (ключ - путь, размер и время изменения)
+MAX_DIGESTS = 1024
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Хэш содержимого файла (BLAKE2b)."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def entry_size(value):
+    """Приблизительный объём записи кэша в байтах."""
+    if value is None:
+        return 0
+    if hasattr(value, 'nbytes'):
+        return value.nbytes
+    if isinstance(value, str):
+        return sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        # Повторы кадров - ссылки на один объект, считаем их один раз
+        unique = {id(item): item for item in value}
+        return sum(entry_size(item) for item in unique.values()) + 8 * len(value)
+    return sys.getsizeof(value)
+
+
+class ConversionCache:
+    """LRU-кэш конвертаций в памяти и (опционально) на диске.
+
+    Ключ - хэш содержимого файла плюс параметры конвертации. Кэш двухэтапный:
+    'fields' хранит яркость, градиент и цвет в размере сетки (не зависят от
+    палитры и порога), 'result' - готовые кадры. Поэтому смена одной палитры
+    пересобирает только символы.
+    """
+
+    def __init__(self, max_bytes=256 << 20, max_items=64, disk_dir=None, disk_max_bytes=1 << 30):
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.hits = {stage: 0 for stage in STAGES}
+        self.misses = {stage: 0 for stage in STAGES}
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._digests = OrderedDict()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def digest(self, path):
+        """Хэш файла; повторно файл читается только если изменились размер или время.
+
+        Для последовательности кадров - хэш имён, размеров и времени изменения её файлов.
+        """
+        if is_sequence(path):
+            return sequence_digest(path)
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(key)
+            if digest is not None:
+                self._digests.move_to_end(key)
+                return digest
+        # Файл читается вне блокировки - хэш большого файла не задерживает другие потоки
+        digest = file_digest(path)
+        with self._lock:
+            self._digests[key] = digest
+            while len(self._digests) > MAX_DIGESTS:
+                self._digests.popitem(last=False)
+        return digest
+
+    def get(self, stage, key):
+        value = None
+        with self._lock:
+            entry = self._entries.get((stage, key))
+            if entry is not None:
+                value = entry[0]
+                self._entries.move_to_end((stage, key))
+        if value is None:
+            value = self._disk_get(stage, key)
+            if value is not None:
+                self._memory_put(stage, key, value)
+        with self._lock:
+            if value is None:
+                self.misses[stage] += 1
+            else:
+                self.hits[stage] += 1
+        return value
+
+    def put(self, stage, key, value):
+        self._memory_put(stage, key, value)
+        self._disk_put(stage, key, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def summary(self):
+        """Строка для статус-бара: попадания/промахи по этапам."""
+        with self._lock:
+            parts = [f"{stage} {self.hits[stage]}/{self.hits[stage] + self.misses[stage]}"
+                     for stage in STAGES]
+        return "Кэш (попаданий): " + ", ".join(parts)
+
+    def fields(self, path, params, progress=None, should_stop=None, workers=None, on_frame=None):
+        """FrameFields и FrameTiming всех кадров (этап 'fields'): (fields, timings); None при остановке."""
+        key = self._fields_key(self.digest(path), params)
+        fields = self.get('fields', key)
+        if fields is None:
+            fields = load_fields(path, params, progress, should_stop, workers, on_frame)
+            if fields is None:
+                return None
+            self.put('fields', key, fields)
+        elif progress is not None:
+            progress(1.0)
+        return fields
+
+    def render(self, path, params, direction_chars, fields):
+        """Готовые кадры AsciiFrame по уже полученным (fields, timings) (этап 'result')."""
+        key = self._result_key(self.digest(path), params, direction_chars)
+        frames = self.get('result', key)
+        if frames is None:
+            frames = self._render(key, params, direction_chars, fields)
+        return list(frames)
+
+    def convert(self, path, params, direction_chars=DIRECTION_CHARS, progress=None, should_stop=None,
+                workers=None):
+        """Как core.convert_file, но с переиспользованием закэшированных этапов."""
+        key = self._result_key(self.digest(path), params, direction_chars)
+        frames = self.get('result', key)
+        if frames is None:
+            fields = self.fields(path, params, progress, should_stop, workers)
+            if fields is None:
+                return None
+            frames = self._render(key, params, direction_chars, fields)
+        elif progress is not None:
+            progress(1.0)
+        return list(frames)
+
+    def _fields_key(self, digest, params):
+        # Предобработка не зависит от палитры и порога
+        return (FORMAT_VERSION, digest, tuple(params._replace(palette='', grad_thresh=0)))
+
+    def _result_key(self, digest, params, direction_chars):
+        return (FORMAT_VERSION, digest, tuple(params), tuple(sorted(direction_chars.items())))
+
+    def _render(self, key, params, direction_chars, fields):
+        rendered = {}  # повторяющиеся кадры - один объект FrameFields, собираем их один раз
+        frames = []
+        for frame, timing in zip(*fields):
+            if id(frame) not in rendered:
+                rendered[id(frame)] = render_fields(frame, params, direction_chars)
+            frames.append(AsciiFrame(*rendered[id(frame)], *timing))
+        self.put('result', key, frames)
+        return frames
+
+    def _memory_put(self, stage, key, value):
+        size = entry_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop((stage, key), None)
+            if old is not None:
+                self._total_bytes -= old[1]
+            self._entries[(stage, key)] = (value, size)
+            self._total_bytes += size
+            while self._entries and (self._total_bytes > self.max_bytes or len(self._entries) > self.max_items):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_size
+
+    def _disk_path(self, stage, key):
+        name = hashlib.blake2b(repr((stage, key)).encode('utf-8'), digest_size=20).hexdigest()
+        return os.path.join(self.disk_dir, f"{stage}_{name}.pkl")
+
+    def _disk_get(self, stage, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(stage, key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)  # отмечаем использование для LRU
+            return value
+        except:
+            return None
+
+    def _disk_put(self, stage, key, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(stage, key)
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            if len(data) > self.disk_max_bytes:
+                return
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._disk_evict()
+        except OSError:
+            pass
+
+    def _disk_evict(self):
+        """Удаляет давно не использованные файлы, пока кэш на диске больше лимита."""
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith('.pkl'):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
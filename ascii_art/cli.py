@@ -0,0 +1,214 @@
+import argparse
+import glob
+import json
+import os
+import sys
+from contextlib import nullcontext
+
+from .container import CONTAINER_EXTENSION, ContainerReader, format_container_stats, is_container, write_container
+from .core import (PALETTES, DEFAULT_PALETTE, NAME_TEMPLATE, ConversionParams, convert_file, is_animation,
+                   measure_speedup, output_name, resolve_palette)
+from .dedup import count_repeats
+from .export import format_stats, write_animated_html, write_html, write_text
+from .player import write_delta_html
+from .profiling import Profiler, format_summary
+from .raster import DEFAULT_FONT_SIZE, format_raster_stats, write_raster
+from .terminal import TerminalPlayer, render_ansi
+
+
+def expand_inputs(patterns):
+    """Раскрывает маски файлов; пути без совпадений остаются как есть."""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        paths.extend(matches if matches else [pattern])
+    # Убираем повторы, сохраняя порядок
+    return list(dict.fromkeys(paths))
+
+
+def add_conversion_arguments(parser):
+    """Параметры конвертации и сохранения (общие для CLI и пакетного режима)."""
+    parser.add_argument('-w', '--width', type=int, default=150,
+                        help="Ширина ASCII в символах")
+    parser.add_argument('-p', '--palette', default=DEFAULT_PALETTE,
+                        help=f"Палитра: {', '.join(PALETTES)} или свой набор символов")
+    parser.add_argument('-g', '--gamma', type=float, default=1.5,
+                        help="Контрастность (гамма)")
+    parser.add_argument('--no-edges', dest='use_edges', action='store_false',
+                        help="Не обводить границы")
+    parser.add_argument('--no-gradient', dest='use_gradient', action='store_false',
+                        help="Отключить контурный стиль")
+    parser.add_argument('-t', '--threshold', type=int, default=30,
+                        help="Порог градиента")
+    parser.add_argument('-v', '--v-compress', type=float, default=1.0,
+                        help="Сжатие по вертикали (1.0 = без сжатия)")
+    parser.add_argument('--shape', dest='shape_match', action='store_true',
+                        help="Подбирать символы по форме клетки, а не только по яркости")
+    parser.add_argument('--dedup-tolerance', type=float, default=0,
+                        help="GIF: средняя разница яркости (0-255), при которой соседние кадры "
+                             "считаются повтором (0 = только точные повторы)")
+    parser.add_argument('--start', type=float, default=0.0,
+                        help="Видео и последовательности: начало фрагмента, с")
+    parser.add_argument('--end', type=float, default=0.0,
+                        help="Видео и последовательности: конец фрагмента, с (0 = до конца)")
+    parser.add_argument('--fps', type=float, default=0.0,
+                        help="Видео и последовательности: не больше стольких кадров в секунду (0 = все кадры)")
+    parser.add_argument('--html', action='store_true',
+                        help="Сохранять цветной HTML (для GIF - анимированный)")
+    parser.add_argument('--html-colors', type=int, default=0,
+                        help="Уровней на канал цвета в HTML (0 = точные цвета)")
+    parser.add_argument('--html-full-frames', action='store_true',
+                        help="Анимированный HTML со всеми кадрами целиком вместо дельта-плеера")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='ascii_art',
+        description="Конвертация изображений, GIF и видео в ASCII-арт без GUI."
+    )
+    parser.add_argument('inputs', nargs='+',
+                        help="Файлы, маски (например, 'images/*.png'), папки с пронумерованными кадрами, "
+                             "шаблоны последовательностей ('frames/img_%%04d.png') или сохранённые .asca")
+    parser.add_argument('-o', '--output-dir', default=None,
+                        help="Папка для результатов (по умолчанию - рядом с исходником)")
+    add_conversion_arguments(parser)
+    parser.add_argument('--stdout', action='store_true',
+                        help="Печатать текст в stdout вместо сохранения в файл")
+    parser.add_argument('--raster', choices=('png', 'gif', 'mp4'), default=None,
+                        help="Сохранить картинкой: PNG (первый кадр), GIF или MP4 вместо TXT/HTML")
+    parser.add_argument('--container', action='store_true',
+                        help="Сохранить двоичный контейнер .asca (все кадры; цвета - вместе с --html), "
+                             "его можно открыть снова без конвертации")
+    parser.add_argument('--font-size', type=int, default=DEFAULT_FONT_SIZE,
+                        help="Размер шрифта для --raster, пикселей")
+    parser.add_argument('--font', default=None,
+                        help="Файл TrueType-шрифта для --raster (по умолчанию - моноширинный из системы)")
+    parser.add_argument('--terminal', action='store_true',
+                        help="Показать результат в терминале цветом ANSI (анимацию - проигрывать на месте)")
+    parser.add_argument('--terminal-fps', type=float, default=0,
+                        help="Не больше стольких перерисовок терминала в секунду (0 = как в исходнике)")
+    parser.add_argument('--loops', type=int, default=1,
+                        help="Сколько раз проиграть анимацию в терминале (0 = пока не нажат Ctrl+C)")
+    parser.add_argument('--terminal-colors', type=int, default=0,
+                        help="Уровней на канал цвета в терминале (0 = точные цвета)")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="Число процессов для кадров GIF и видео (по умолчанию - по числу ядер)")
+    parser.add_argument('--profile', action='store_true',
+                        help="Вывести время, память и объём данных по этапам конвертации")
+    parser.add_argument('--trace', default=None,
+                        help="Сохранить замеры этапов всех файлов в JSON")
+    parser.add_argument('--compare-serial', action='store_true',
+                        help="Для GIF и видео: замерить ускорение относительно последовательного режима")
+    return parser
+
+
+def params_from_args(args):
+    return ConversionParams(
+        width=args.width,
+        palette=resolve_palette(args.palette),
+        gamma=args.gamma,
+        use_edges=args.use_edges,
+        use_gradient=args.use_gradient,
+        grad_thresh=args.threshold,
+        v_compress=args.v_compress,
+        # Цвета нужны для HTML, терминала и картинок
+        export_html=(args.html or args.terminal or args.raster is not None) and not args.stdout,
+        dedup_tolerance=args.dedup_tolerance,
+        start_time=args.start,
+        end_time=args.end,
+        max_fps=args.fps,
+        shape_match=args.shape_match
+    )
+
+
+def save_result(path, frames, params, output_dir=None, html_colors=0, full_frames=False,
+                template=NAME_TEMPLATE, timestamp=None):
+    """Сохраняет результат так же, как кнопка 'СОХРАНИТЬ': HTML или TXT первого кадра.
+
+    Имя файла строится по template (см. core.output_name). Возвращает
+    (имя файла, ExportStats или None для TXT).
+    """
+    folder = output_dir or os.path.dirname(os.path.abspath(path))
+    ascii_str, color_data = frames[0].text, frames[0].colors
+    stats = None
+    if params.export_html and len(frames) > 1:
+        filename = os.path.join(folder, output_name(path, '_animated', '.html', timestamp, template))
+        writer = write_animated_html if full_frames else write_delta_html
+        stats = writer(filename, frames, quantize=html_colors)
+    elif params.export_html and color_data is not None:
+        filename = os.path.join(folder, output_name(path, '', '.html', timestamp, template))
+        stats = write_html(filename, ascii_str, color_data, quantize=html_colors)
+    else:
+        filename = os.path.join(folder, output_name(path, '', '.txt', timestamp, template))
+        write_text(filename, ascii_str)
+    return filename, stats
+
+
+def convert_path(path, args, params):
+    """Конвертирует и сохраняет (или печатает) один файл согласно аргументам CLI.
+
+    Контейнер .asca не конвертируется заново: его кадры читаются по мере надобности.
+    """
+    palette = params.palette
+    if is_container(path):
+        frames = ContainerReader(path)
+        palette = frames.table
+    else:
+        if args.compare_serial and is_animation(path):
+            stats = measure_speedup(path, params, args.jobs)
+            print(f"{path}: кадров {stats['frames']}, последовательно {stats['serial_time']:.2f} с, "
+                  f"процессов {stats['workers']}: {stats['parallel_time']:.2f} с, "
+                  f"ускорение x{stats['speedup']:.2f}", file=sys.stderr)
+        frames = convert_file(path, params, workers=args.jobs)
+    if args.terminal:
+        if len(frames) > 1:
+            TerminalPlayer(frames, fps=args.terminal_fps, quantize=args.terminal_colors).play(args.loops)
+        else:
+            sys.stdout.write(render_ansi(frames[0].text, frames[0].colors, args.terminal_colors))
+    elif args.stdout:
+        sys.stdout.write(frames[0].text)
+    elif args.raster:
+        folder = args.output_dir or os.path.dirname(os.path.abspath(path))
+        suffix = '_animated' if len(frames) > 1 and args.raster != 'png' else ''
+        filename = os.path.join(folder, output_name(path, suffix, '.' + args.raster))
+        stats = write_raster(filename, frames, palette, font_size=args.font_size, font_path=args.font)
+        print(f"{path} -> {filename} ({format_raster_stats(stats)})", file=sys.stderr)
+    elif args.container:
+        folder = args.output_dir or os.path.dirname(os.path.abspath(path))
+        filename = os.path.join(folder, output_name(path, '', CONTAINER_EXTENSION))
+        stats = write_container(filename, frames, params, os.path.basename(path))
+        print(f"{path} -> {filename} ({format_container_stats(stats)})", file=sys.stderr)
+    else:
+        filename, stats = save_result(path, frames, params, args.output_dir, args.html_colors,
+                                      args.html_full_frames)
+        details = f" ({format_stats(stats)})" if stats else ""
+        if len(frames) > 1:
+            details += f", повторов кадров пропущено: {count_repeats([f.text for f in frames])}"
+        print(f"{path} -> {filename}{details}", file=sys.stderr)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    params = params_from_args(args)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    failed = 0
+    traces = []
+    for path in expand_inputs(args.inputs):
+        profiler = Profiler() if args.profile or args.trace else None
+        try:
+            with profiler.activate() if profiler else nullcontext():
+                convert_path(path, args, params)
+        except Exception as e:
+            failed += 1
+            print(f"Ошибка: {path}: {e}", file=sys.stderr)
+        if profiler is not None:
+            if args.profile:
+                for line in format_summary(profiler.summary()):
+                    print(f"  {line}", file=sys.stderr)
+            traces.append({'file': path, **profiler.trace()})
+    if args.trace:
+        with open(args.trace, 'w', encoding='utf-8') as f:
+            json.dump({'inputs': traces}, f, ensure_ascii=False, indent=1)
+    return 1 if failed else 0
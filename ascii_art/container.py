@@ -0,0 +1,274 @@
+"""Двоичный контейнер ASCII-анимации (.asca): результат можно открыть снова без повторной конвертации.
+
+Устройство файла (все числа little-endian):
+
+    заголовок HEADER (32 байта): магия, версия, флаги, ширина и высота сетки,
+        число кадров, смещение индекса, смещение и длина метаданных
+    блоки кадров: индексы глифов uint8 (высота x ширина), затем, если есть
+        FLAG_COLORS, три плоскости цвета R, G, B того же размера
+    индекс кадров INDEX_ENTRY: смещение блока, длительность (мс), disposal
+    метаданные JSON: таблица глифов, параметры конвертации, имя исходника
+
+Повтор предыдущего кадра не записывается - его запись индекса ссылается на
+тот же блок. Индекс и метаданные пишутся после кадров, поэтому кадры можно
+сохранять по одному прямо из потоковой конвертации.
+"""
+import json
+import os
+import struct
+import time
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+from .core import AsciiFrame, ConversionParams
+from .engine import indices_to_text
+from .profiling import stage
+
+CONTAINER_EXTENSION = '.asca'
+MAGIC = b'ASCA'
+CONTAINER_VERSION = 1
+FLAG_COLORS = 1
+HEADER = struct.Struct('<4sHHIIIQQI')
+INDEX_ENTRY = np.dtype([('offset', '<u8'), ('duration', '<f4'), ('disposal', '<u2'), ('reserved', '<u2')])
+# Сколько раскодированных кадров держит ContainerReader
+FRAME_CACHE_SIZE = 32
+
+# Итог записи контейнера: размер файла, время, число кадров и записанных блоков (без повторов)
+ContainerStats = namedtuple('ContainerStats', ['filename', 'bytes', 'seconds', 'frames', 'unique'])
+
+
+def is_container(path):
+    return path.lower().endswith(CONTAINER_EXTENSION)
+
+
+class _GlyphTable:
+    """Таблица глифов, которая пополняется по мере записи кадров (не больше 256 символов)."""
+
+    def __init__(self, chars=''):
+        self.chars = []
+        self.lookup = {}
+        for char in chars:
+            self.add(ord(char))
+
+    def add(self, code):
+        index = self.lookup.get(code)
+        if index is None:
+            if len(self.chars) >= 256:
+                raise ValueError("В кадрах больше 256 разных символов")
+            index = self.lookup[code] = len(self.chars)
+            self.chars.append(chr(code))
+        return index
+
+    def indices(self, ascii_str, shape):
+        """Текст кадра -> сетка индексов uint8 (высота, ширина)."""
+        height, width = shape
+        codes = np.frombuffer(ascii_str.encode('utf-32-le'), np.uint32)
+        if codes.size != height * (width + 1):
+            raise ValueError("Кадры анимации разного размера")
+        codes = codes.reshape(height, width + 1)[:, :width]
+        unique, inverse = np.unique(codes, return_inverse=True)
+        lut = np.array([self.add(int(code)) for code in unique], np.uint8)
+        return lut[inverse].reshape(height, width)
+
+
+def _duration(value):
+    """Длительность из индекса: целые миллисекунды - int, как у кадров после конвертации."""
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def _grid_shape(ascii_str):
+    lines = ascii_str.split('\n')
+    if lines and lines[-1] == '':
+        lines.pop()
+    return len(lines), len(lines[0]) if lines else 0
+
+
+def write_container(filename, frames, params=None, source=None, before_replace=None):
+    """Сохраняет кадры AsciiFrame в контейнер; возвращает ContainerStats.
+
+    frames может быть генератором - кадры записываются по одному. Цвета
+    сохраняются, если они есть у первого кадра. Запись идёт во временный файл,
+    который затем заменяет filename. На Windows файл, отображённый в память
+    ContainerReader, заменить нельзя: если кадры читаются из filename же,
+    передайте before_replace=reader.close - он вызывается после записи кадров,
+    перед заменой. Если файл всё равно занят, будет PermissionError.
+    """
+    start = time.perf_counter()
+    table = _GlyphTable(params.palette if params is not None else '')
+    entries = []
+    unique = 0
+    flags = 0
+    shape = None
+    tmp_path = filename + '.tmp'
+    with stage('write_container') as st:
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(bytes(HEADER.size))
+                last = None
+                for frame in frames:
+                    if last is not None and frame.text is last.text and frame.colors is last.colors:
+                        offset = entries[-1][0]
+                    else:
+                        if shape is None:
+                            shape = _grid_shape(frame.text)
+                            flags = FLAG_COLORS if frame.colors is not None else 0
+                        offset = f.tell()
+                        f.write(table.indices(frame.text, shape).tobytes())
+                        if flags & FLAG_COLORS:
+                            colors = frame.colors
+                            if colors is None or colors.shape[:2] != shape:
+                                colors = np.zeros(shape + (3,), np.uint8)
+                            f.write(np.ascontiguousarray(colors.transpose(2, 0, 1), np.uint8).tobytes())
+                        unique += 1
+                    entries.append((offset, frame.duration, frame.disposal, 0))
+                    last = frame
+                if not entries:
+                    raise ValueError("Нет кадров для сохранения")
+                index_offset = f.tell()
+                f.write(np.array(entries, INDEX_ENTRY).tobytes())
+                meta = json.dumps({'table': ''.join(table.chars),
+                                   'params': params._asdict() if params is not None else None,
+                                   'source': source}, ensure_ascii=False).encode('utf-8')
+                meta_offset = f.tell()
+                f.write(meta)
+                f.seek(0)
+                f.write(HEADER.pack(MAGIC, CONTAINER_VERSION, flags, shape[1], shape[0], len(entries),
+                                    index_offset, meta_offset, len(meta)))
+            if before_replace is not None:
+                before_replace()
+            try:
+                os.replace(tmp_path, filename)
+            except PermissionError as e:
+                raise PermissionError(f"Файл {os.path.basename(filename)} занят (открыт в этой или другой "
+                                      f"программе) - сохраните под другим именем") from e
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        st.size = os.path.getsize(filename)
+    return ContainerStats(filename, os.path.getsize(filename), time.perf_counter() - start, len(entries), unique)
+
+
+class ContainerReader:
+    """Кадры контейнера по требованию: файл отображается в память, кадр читается по индексу.
+
+    Ведёт себя как список AsciiFrame (len, [i], итерация), поэтому подходит
+    для воспроизведения и экспорта вместо результата конвертации. Один и тот же
+    блок (повторы кадров) отдаётся одними и теми же объектами текста и цвета,
+    только пока он в кэше последних FRAME_CACHE_SIZE кадров; после вытеснения
+    блок читается в новые объекты, а их id могут совпасть с id уже удалённых.
+    Надёжный ключ повтора - frame_key().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._data = np.memmap(path, np.uint8, 'r')
+        if self._data.size < HEADER.size:
+            raise ValueError("Файл не является контейнером ASCII-арта")
+        (magic, version, self.flags, self.width, self.height, count, index_offset, meta_offset,
+         meta_length) = HEADER.unpack(self._data[:HEADER.size].tobytes())
+        if magic != MAGIC:
+            raise ValueError("Файл не является контейнером ASCII-арта")
+        if version > CONTAINER_VERSION:
+            raise ValueError(f"Версия контейнера {version} не поддерживается")
+        self.index = np.frombuffer(self._data, INDEX_ENTRY, count, index_offset)
+        meta = json.loads(self._data[meta_offset:meta_offset + meta_length].tobytes().decode('utf-8'))
+        self.table = meta['table']
+        self.params = None
+        if meta.get('params'):
+            # Поля, которых нет в этой версии, отбрасываются, недостающие берут значения по умолчанию
+            known = {name: value for name, value in meta['params'].items() if name in ConversionParams._fields}
+            self.params = ConversionParams(**known)
+        self.source = meta.get('source')
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        """Освобождает отображение файла (пока оно есть, на Windows файл нельзя заменить или удалить).
+
+        Кадры, уже полученные из контейнера, остаются действительными, кроме
+        срезов glyphs() - они ссылаются на отображение и держат его открытым.
+        """
+        self._cache.clear()
+        self.index = self.index.copy()
+        self._data = None
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        entry = self.index[index]
+        text, colors = self._block(int(entry['offset']))
+        return AsciiFrame(text, colors, _duration(entry['duration']), int(entry['disposal']))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    @property
+    def has_colors(self):
+        return bool(self.flags & FLAG_COLORS)
+
+    @property
+    def durations(self):
+        return [_duration(value) for value in self.index['duration']]
+
+    @property
+    def texts(self):
+        """Тексты кадров как последовательность (для TextPlayback), без чтения всех кадров сразу."""
+        return _Texts(self)
+
+    def frame_key(self, index):
+        """Ключ блока кадра: у повторов одного блока он одинаковый при любом состоянии кэша."""
+        return int(self.index[index]['offset'])
+
+    def glyphs(self, index):
+        """Индексы глифов кадра (высота, ширина) - срез отображения файла, без копирования."""
+        self._check_open()
+        offset = int(self.index[index]['offset'])
+        cells = self.width * self.height
+        return self._data[offset:offset + cells].reshape(self.height, self.width)
+
+    def _check_open(self):
+        if self._data is None:
+            raise ValueError("Контейнер закрыт")
+
+    def _block(self, offset):
+        cached = self._cache.get(offset)
+        if cached is not None:
+            self._cache.move_to_end(offset)
+            return cached
+        self._check_open()
+        cells = self.width * self.height
+        with stage('read_container') as st:
+            glyphs = self._data[offset:offset + cells].reshape(self.height, self.width)
+            text = indices_to_text(glyphs, self.table)
+            colors = None
+            if self.has_colors:
+                planes = self._data[offset + cells:offset + 4 * cells].reshape(3, self.height, self.width)
+                colors = np.ascontiguousarray(planes.transpose(1, 2, 0))
+            st.size = cells * (4 if colors is not None else 1)
+        self._cache[offset] = (text, colors)
+        if len(self._cache) > FRAME_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return text, colors
+
+
+class _Texts:
+    def __init__(self, reader):
+        self.reader = reader
+
+    def __len__(self):
+        return len(self.reader)
+
+    def __getitem__(self, index):
+        return self.reader[index].text
+
+
+def format_container_stats(stats):
+    """Краткая сводка записи контейнера для статус-бара и консоли."""
+    return (f"{stats.bytes / (1 << 20):.2f} МБ за {stats.seconds:.2f} с, кадров {stats.frames}, "
+            f"без повторов {stats.unique}")
@@ -0,0 +1,336 @@
+import os
+import time
+from collections import namedtuple
+from datetime import datetime
+from functools import partial
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from .dedup import FrameDeduplicator
+from .engine import map_glyphs
+from .parallel import ordered_map
+from .preprocess import preprocessor_for
+from .profiling import replay, stage, traced
+from .sources import (SEQUENCE_FPS, FrameSelector, is_sequence, is_video, iter_video_frames, sequence_files,
+                      source_name, video_frame_count)
+from .tiles import should_tile, tiled_fields
+from .timing import DEFAULT_DURATION, FrameTiming, normalize_duration
+
+# Палитры
+PALETTES = {
+    'Блочная': '█▓▒░ ',
+    'Градиентная': '█▇▆▅▄▃▂▁ ',
+    'Минимальная': '@ ',
+    '3D-стиль': ' .:!/r(l1Z4H9W8$@'
+}
+DEFAULT_PALETTE = '3D-стиль'
+
+# Символы для направлений
+DIRECTION_CHARS = {
+    'horizontal': '-',
+    'vertical': '|',
+    'diag_up': '/',
+    'diag_down': '\\',
+    'cross': '+'
+}
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+
+# Параметры конвертации (те же, что настраиваются в GUI).
+# dedup_tolerance - допуск, с которым соседние кадры GIF считаются повтором (0 - только точные).
+# start_time, end_time (с) и max_fps - фрагмент и прореживание видео и последовательностей кадров
+# (0 - с начала, до конца, без прореживания). shape_match - подбор символов по форме клетки, а не по яркости
+ConversionParams = namedtuple(
+    'ConversionParams',
+    ['width', 'palette', 'gamma', 'use_edges', 'use_gradient', 'grad_thresh', 'v_compress', 'export_html',
+     'dedup_tolerance', 'start_time', 'end_time', 'max_fps', 'shape_match'],
+    defaults=[150, PALETTES[DEFAULT_PALETTE], 1.5, True, True, 30, 1.0, False, 0, 0.0, 0.0, 0.0, False]
+)
+
+# Кадр результата: текст, цвета (uint8 H x W x 3 или None), длительность в мс и disposal GIF
+AsciiFrame = namedtuple('AsciiFrame', ['text', 'colors', 'duration', 'disposal'],
+                        defaults=[DEFAULT_DURATION, 0])
+
+
+def resolve_palette(name_or_chars):
+    """Возвращает символы палитры по имени; неизвестное имя считается набором символов."""
+    return PALETTES.get(name_or_chars, name_or_chars)
+
+
+def is_gif(path):
+    return path.lower().endswith('.gif')
+
+
+def is_animation(path):
+    """GIF, видео или последовательность кадров - всё, что конвертируется покадрово."""
+    return is_gif(path) or is_video(path) or is_sequence(path)
+
+
+def load_image(path):
+    """Загружает изображение в BGR; возвращает None, если файл не читается."""
+    with stage('decode') as st:
+        img = cv2.imread(path)
+        if img is None:
+            try:
+                pil_img = Image.open(path)
+                pil_img = pil_img.convert('RGB')
+                img = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
+            except:
+                return None
+        st.output(img)
+    return img
+
+
+def frame_fields(img, params):
+    """Промежуточные данные кадра (FrameFields): всё, что не зависит от палитры и порога."""
+    return preprocessor_for(params).fields(img)
+
+
+def image_fields(path, params, progress=None, should_stop=None):
+    """FrameFields статичного изображения; очень большие обрабатываются полосами (см. tiles).
+
+    progress и should_stop учитываются только при обработке полосами - обычное
+    изображение считается за один шаг. None - остановлено.
+    """
+    if should_tile(path):
+        return tiled_fields(path, params, progress, should_stop)
+    img = load_image(path)
+    if img is None:
+        raise ValueError("Не удалось загрузить изображение")
+    return frame_fields(img, params)
+
+
+def render_fields(fields, params, direction_chars=DIRECTION_CHARS):
+    """Последний шаг конвертации: (ascii_str, color_data) из готовых FrameFields."""
+    with stage('glyphs') as st:
+        ascii_str = st.output(map_glyphs(fields.luma, fields.magnitude, fields.angle, params.palette,
+                                         direction_chars, params.grad_thresh, fields.detail))
+    return ascii_str, fields.color
+
+
+def convert_frame(img, params, direction_chars=DIRECTION_CHARS):
+    """Конвертирует один BGR-кадр; возвращает (ascii_str, color_data).
+
+    color_data - массив uint8 формы (H, W, 3) с RGB-цветом каждого символа
+    или None, если цвет не нужен (export_html=False).
+    """
+    return render_fields(frame_fields(img, params), params, direction_chars)
+
+
+def iter_gif_rgb(path, timings=None):
+    """Последовательно декодирует кадры GIF в RGB-изображения PIL (по одному в памяти).
+
+    Если передан список timings, в него добавляется FrameTiming каждого кадра
+    до того, как кадр будет выдан.
+    """
+    with Image.open(path) as pil_gif:
+        while True:
+            if timings is not None:
+                timings.append(FrameTiming(normalize_duration(pil_gif.info.get('duration')),
+                                           getattr(pil_gif, 'disposal_method', 0) or 0))
+            with stage('decode', pil_gif.tell()) as st:
+                frame = st.output(pil_gif.convert('RGB'))
+            yield frame
+            try:
+                pil_gif.seek(pil_gif.tell() + 1)
+            except EOFError:
+                break
+
+
+def iter_gif_frames(path, timings=None):
+    """Последовательно декодирует кадры GIF в BGR-массивы."""
+    for frame_rgb in iter_gif_rgb(path, timings):
+        yield cv2.cvtColor(np.array(frame_rgb), cv2.COLOR_RGB2BGR)
+
+
+def gif_frame_count(path):
+    with Image.open(path) as pil_gif:
+        return getattr(pil_gif, 'n_frames', 1)
+
+
+def iter_sequence_frames(path, timings=None, start=0.0, end=0.0, fps=0.0):
+    """Кадры последовательности картинок в BGR по одному; частота считается равной SEQUENCE_FPS.
+
+    Все кадры приводятся к размеру первого: у анимации одна сетка символов.
+    """
+    selector = FrameSelector(SEQUENCE_FPS, start, end, fps)
+    files = sequence_files(path)
+    size = None
+    for index in range(selector.first, len(files)):
+        if selector.stopped(index):
+            break
+        if not selector.take(index):
+            continue
+        img = load_image(files[index])
+        if img is None:
+            raise ValueError(f"Не удалось загрузить кадр {os.path.basename(files[index])}")
+        if size is None:
+            size = (img.shape[1], img.shape[0])
+        elif (img.shape[1], img.shape[0]) != size:
+            img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+        if timings is not None:
+            timings.append(FrameTiming(selector.duration))
+        yield img
+
+
+def _tap_frames(frames, on_frame):
+    for index, frame in enumerate(frames):
+        on_frame(index, frame)
+        yield frame
+
+
+def iter_source_frames(path, params, timings=None, on_frame=None):
+    """Кадры GIF, видео или последовательности в BGR по одному (фрагмент и fps - из params).
+
+    on_frame(index, frame) получает каждый декодированный кадр - так превью
+    показывает кадры того же прохода декодирования, не читая файл заново.
+    """
+    if is_video(path):
+        frames = iter_video_frames(path, timings, params.start_time, params.end_time, params.max_fps)
+    elif is_sequence(path):
+        frames = iter_sequence_frames(path, timings, params.start_time, params.end_time, params.max_fps)
+    else:
+        frames = iter_gif_frames(path, timings)
+    return frames if on_frame is None else _tap_frames(frames, on_frame)
+
+
+def source_frame_count(path, params):
+    """Сколько кадров выдаст iter_source_frames (для видео - оценка по контейнеру)."""
+    if is_video(path):
+        return video_frame_count(path, params.start_time, params.end_time, params.max_fps)
+    if is_sequence(path):
+        selector = FrameSelector(SEQUENCE_FPS, params.start_time, params.end_time, params.max_fps)
+        return max(selector.count(len(sequence_files(path))), 1)
+    return gif_frame_count(path)
+
+
+def convert_image(path, params, direction_chars=DIRECTION_CHARS):
+    """Конвертирует статичное изображение; возвращает (ascii_str, color_data)."""
+    return render_fields(image_fields(path, params), params, direction_chars)
+
+
+def iter_convert_gif(path, params, direction_chars=DIRECTION_CHARS, should_stop=None, workers=None, pool=None,
+                     on_frame=None):
+    """Потоковая конвертация GIF, видео или последовательности: декодирование -> конвертация -> выдача по порядку.
+
+    В памяти одновременно находится лишь окно из нескольких исходных кадров,
+    сколько бы их ни было в файле. Повторяющиеся кадры конвертируются один раз,
+    повторы ссылаются на тот же текст и цвета. pool - общий пул процессов
+    (см. parallel.create_pool) вместо создаваемого на время вызова; с ним
+    конвертация никогда не идёт в вызывающем потоке. on_frame - см.
+    iter_source_frames.
+    """
+    if pool is None and is_gif(path) and gif_frame_count(path) == 1:
+        workers = 1
+    convert, profiler = traced(partial(convert_frame, params=params, direction_chars=direction_chars))
+    # Кадр декодируется раньше, чем выдаётся его результат, так что timings[index] уже есть
+    timings = []
+    dedup = FrameDeduplicator(params.dedup_tolerance)
+    frames = dedup.filter(iter_source_frames(path, params, timings, on_frame))
+    results = (replay(result, profiler, dedup.firsts[unique]) for unique, result in
+               enumerate(ordered_map(convert, frames, workers, should_stop=should_stop, pool=pool)))
+    for index, (ascii_str, color_data) in dedup.expand(results):
+        yield AsciiFrame(ascii_str, color_data, *timings[index])
+
+
+def convert_gif(path, params, direction_chars=DIRECTION_CHARS, progress=None, should_stop=None,
+                workers=None, on_frame=None):
+    """Конвертирует все кадры GIF (видео, последовательности); возвращает список AsciiFrame или None при остановке.
+
+    Кадры распределяются по workers процессам (по умолчанию - по числу ядер),
+    результаты собираются в исходном порядке; workers=1 - последовательный режим.
+    """
+    total_frames = source_frame_count(path, params)
+    results = []
+    for result in iter_convert_gif(path, params, direction_chars, should_stop, workers, on_frame=on_frame):
+        results.append(result)
+        if progress is not None:
+            progress(min(len(results) / total_frames, 1.0))
+    if should_stop is not None and should_stop():
+        return None
+    if not results:
+        raise ValueError("Анимация не содержит кадров")
+    return results
+
+
+def load_fields(path, params, progress=None, should_stop=None, workers=None, on_frame=None):
+    """FrameFields и FrameTiming всех кадров изображения или анимации: (fields, timings); None при остановке.
+
+    Повторяющиеся кадры представлены одним и тем же объектом FrameFields.
+    """
+    timings = []
+    if not is_animation(path):
+        frame = image_fields(path, params, progress, should_stop)
+        if frame is None:
+            return None
+        fields = [frame]
+        timings.append(FrameTiming())
+    else:
+        total_frames = source_frame_count(path, params)
+        if total_frames == 1:
+            workers = 1
+        fields = []
+        compute, profiler = traced(partial(frame_fields, params=params))
+        dedup = FrameDeduplicator(params.dedup_tolerance)
+        unique = (replay(result, profiler, dedup.firsts[number]) for number, result in
+                  enumerate(ordered_map(compute, dedup.filter(iter_source_frames(path, params, timings, on_frame)),
+                                        workers, should_stop=should_stop)))
+        for _, frame in dedup.expand(unique):
+            fields.append(frame)
+            if progress is not None:
+                progress(min(len(fields) / total_frames, 1.0))
+        if should_stop is not None and should_stop():
+            return None
+        if not fields:
+            raise ValueError("Анимация не содержит кадров")
+    if progress is not None:
+        progress(1.0)
+    return fields, timings[:len(fields)]
+
+
+def measure_speedup(path, params, workers=None, direction_chars=DIRECTION_CHARS):
+    """Сравнивает время последовательной и параллельной конвертации GIF."""
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    serial = convert_gif(path, params, direction_chars, workers=1)
+    serial_time = time.perf_counter() - start
+    start = time.perf_counter()
+    parallel = convert_gif(path, params, direction_chars, workers=workers)
+    parallel_time = time.perf_counter() - start
+    if [frame.text for frame in serial] != [frame.text for frame in parallel]:
+        raise RuntimeError("Параллельный результат отличается от последовательного")
+    return {
+        'frames': len(serial),
+        'workers': workers,
+        'serial_time': serial_time,
+        'parallel_time': parallel_time,
+        'speedup': serial_time / parallel_time if parallel_time > 0 else float('inf')
+    }
+
+
+def convert_file(path, params, direction_chars=DIRECTION_CHARS, progress=None, should_stop=None,
+                 workers=None):
+    """Конвертирует изображение, GIF, видео или последовательность; всегда возвращает список AsciiFrame (или None при остановке)."""
+    if is_animation(path):
+        return convert_gif(path, params, direction_chars, progress, should_stop, workers)
+    ascii_str, color_data = convert_image(path, params, direction_chars)
+    if progress is not None:
+        progress(1.0)
+    return [AsciiFrame(ascii_str, color_data)]
+
+
+# Шаблон имени выходного файла (без расширения), как при сохранении в GUI
+NAME_TEMPLATE = '{base}{suffix}_{timestamp}'
+
+
+def output_name(path, suffix='', ext='.txt', timestamp=None, template=NAME_TEMPLATE):
+    """Имя выходного файла по шаблону (поля {base}, {suffix}, {timestamp}, {source_ext}) плюс ext.
+
+    source_ext - расширение исходника без точки: различает p.jpg и p.png.
+    """
+    base = source_name(path) if is_sequence(path) else os.path.splitext(os.path.basename(path))[0]
+    source_ext = '' if is_sequence(path) else os.path.splitext(path)[1].lstrip('.').lower()
+    now = timestamp or datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    return template.format(base=base, suffix=suffix, timestamp=now, source_ext=source_ext) + ext
@@ -0,0 +1,88 @@
+import hashlib
+
+import cv2
+import numpy as np
+
+# Размер уменьшенной яркости для сравнения похожих кадров
+SIGNATURE_SIZE = (32, 32)
+
+
+def frame_digest(img):
+    """Хэш пикселей кадра (точные повторы)."""
+    digest = hashlib.blake2b(repr(img.shape).encode('ascii'), digest_size=16)
+    digest.update(np.ascontiguousarray(img).data)
+    return digest.digest()
+
+
+def frame_signature(img):
+    """Уменьшенная яркость кадра для сравнения с допуском."""
+    luma = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    return cv2.resize(luma, SIGNATURE_SIZE, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+class FrameDeduplicator:
+    """Пропускает повторяющиеся кадры, чтобы каждый уникальный конвертировался один раз.
+
+    Точные повторы ищутся по хэшу среди всех кадров. При tolerance > 0 кадр
+    считается повтором и тогда, когда средняя разница уменьшенной яркости
+    с последним уникальным кадром не больше tolerance (шкала 0-255).
+    sources[i] - номер уникального кадра, которым представлен кадр i,
+    firsts[k] - номер кадра, в котором уникальный кадр k встретился впервые.
+    """
+
+    def __init__(self, tolerance=0):
+        self.tolerance = tolerance
+        self.sources = []
+        self.firsts = []
+        self.unique = 0
+        self._digests = {}
+        self._last_signature = None
+
+    @property
+    def skipped(self):
+        return len(self.sources) - self.unique
+
+    def filter(self, frames):
+        """Выдаёт только уникальные кадры; для всех кадров заполняет sources."""
+        for img in frames:
+            digest = frame_digest(img)
+            source = self._digests.get(digest)
+            signature = None
+            if source is None and self.tolerance > 0:
+                signature = frame_signature(img)
+                if (self._last_signature is not None and
+                        np.abs(signature - self._last_signature).mean() <= self.tolerance):
+                    source = self.unique - 1
+            if source is not None:
+                self.sources.append(source)
+                continue
+            source = self.unique
+            self.unique += 1
+            self._digests[digest] = source
+            if self.tolerance > 0:
+                self._last_signature = signature
+            # Номер записывается до выдачи кадра: к приходу результата он уже известен
+            self.firsts.append(len(self.sources))
+            self.sources.append(source)
+            yield img
+
+    def expand(self, results):
+        """Раскладывает результаты уникальных кадров по всем кадрам: (номер кадра, результат).
+
+        Повторы получают тот же объект результата, а не копию.
+        """
+        done = []
+        index = 0
+        for result in results:
+            done.append(result)
+            while index < len(self.sources) and self.sources[index] < len(done):
+                yield index, done[self.sources[index]]
+                index += 1
+        while index < len(self.sources) and self.sources[index] < len(done):
+            yield index, done[self.sources[index]]
+            index += 1
+
+
+def count_repeats(items):
+    """Сколько элементов ссылаются на уже встречавшийся объект (пропущенные повторы)."""
+    return len(items) - len({id(item) for item in items})
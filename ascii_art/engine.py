@@ -0,0 +1,68 @@
+import numpy as np
+
+from .shapes import shape_indices
+
+# Порядок символов направлений в общей таблице глифов
+DIRECTION_KEYS = ('horizontal', 'diag_up', 'vertical', 'diag_down', 'cross')
+
+
+def glyph_table(palette, direction_chars):
+    """Возвращает общую таблицу глифов: символы палитры, затем символы направлений."""
+    return palette + ''.join(direction_chars[key] for key in DIRECTION_KEYS)
+
+
+def index_dtype(table_size):
+    """Минимальный целочисленный тип для индексов в таблице глифов."""
+    return np.uint8 if table_size <= 256 else np.uint16
+
+
+def direction_bins(angle):
+    """Квантует углы градиента (0..360) в номера направлений по DIRECTION_KEYS."""
+    conditions = [
+        ((0 <= angle) & (angle < 22.5)) | ((157.5 <= angle) & (angle < 202.5)) | ((337.5 <= angle) & (angle < 360)),
+        ((22.5 <= angle) & (angle < 67.5)) | ((202.5 <= angle) & (angle < 247.5)),
+        ((67.5 <= angle) & (angle < 112.5)) | ((247.5 <= angle) & (angle < 292.5)),
+        ((112.5 <= angle) & (angle < 157.5)) | ((292.5 <= angle) & (angle < 337.5)),
+    ]
+    return np.select(conditions, [0, 1, 2, 3], default=4)
+
+
+def glyph_indices(resized, magnitude, angle, palette_len, grad_thresh):
+    """Вычисляет индексы глифов (см. glyph_table) сразу для всего кадра."""
+    char_range = palette_len - 1
+    # Та же арифметика, что и int(pixel / 255 * char_range) для одного пикселя
+    indices = (resized / 255 * char_range).astype(np.intp)
+    if magnitude is not None and angle is not None:
+        edge_mask = magnitude > grad_thresh
+        if edge_mask.any():
+            indices[edge_mask] = palette_len + direction_bins(angle[edge_mask])
+    return indices.astype(index_dtype(palette_len + len(DIRECTION_KEYS)))
+
+
+def indices_to_lines(indices, table):
+    """Собирает строки символов по индексам глифов."""
+    height, width = indices.shape
+    chars = np.array(list(table), dtype='<U1')[indices]
+    # Каждая строка кадра - один непрерывный блок из width символов
+    return np.ascontiguousarray(chars).view(f'<U{width}').reshape(height).tolist()
+
+
+def indices_to_text(indices, table):
+    """Собирает текст кадра (каждая строка завершается переводом строки)."""
+    if indices.shape[0] == 0:
+        return ""
+    return '\n'.join(indices_to_lines(indices, table)) + '\n'
+
+
+def map_glyphs(resized, magnitude, angle, palette, direction_chars, grad_thresh, detail=None):
+    """Векторизованная замена попиксельного цикла: возвращает ASCII-текст кадра.
+
+    Если передан detail (подклеточная яркость), символы подбираются по форме клетки.
+    """
+    table = glyph_table(palette, direction_chars)
+    if detail is not None:
+        indices = shape_indices(detail, magnitude, table, len(palette), grad_thresh)
+        indices = indices.astype(index_dtype(len(table)))
+    else:
+        indices = glyph_indices(resized, magnitude, angle, len(palette), grad_thresh)
+    return indices_to_text(indices, table)
@@ -0,0 +1,181 @@
+import html
+import json
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from .profiling import stage
+from .timing import PLAYBACK_JS
+
+# Больше уникальных цветов в стилях не выносим - таблица классов перестаёт окупаться
+MAX_CSS_CLASSES = 4096
+
+PAGE_STYLE = 'body { background: black; font-family: "Courier New", monospace; font-size: 8px; line-height: 8px; }'
+
+# Итог экспорта: размер файла, время записи, число цветных фрагментов и цветов
+ExportStats = namedtuple('ExportStats', ['filename', 'bytes', 'seconds', 'spans', 'colors'])
+
+
+def write_text(filename, ascii_str):
+    with stage('write_txt') as st:
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(ascii_str)
+        st.size = os.path.getsize(filename)
+
+
+def quantize_colors(color_data, levels):
+    """Сводит каждый канал к levels уровням (центр интервала); 0 - без квантования."""
+    if not levels or levels >= 256:
+        return color_data
+    step = 256 // levels
+    return (color_data // step * step + step // 2).astype(np.uint8)
+
+
+def pack_colors(color_data):
+    """RGB (H, W, 3) -> одно целое 0xRRGGBB на ячейку."""
+    c = color_data.astype(np.uint32)
+    return (c[..., 0] << 16) | (c[..., 1] << 8) | c[..., 2]
+
+
+class ColorTable:
+    """Общая таблица цветов: CSS-классы, если цветов немного, иначе inline-стили."""
+
+    def __init__(self, packed_frames):
+        values = [np.unique(packed) for packed in packed_frames]
+        self.colors = np.unique(np.concatenate(values)) if values else np.zeros(0, np.uint32)
+        self.use_classes = len(self.colors) <= MAX_CSS_CLASSES
+
+    def stylesheet(self):
+        if not self.use_classes:
+            return ''
+        return '\n'.join(f'.c{i}{{color:#{int(value):06x}}}' for i, value in enumerate(self.colors))
+
+    def attrs(self, packed_row):
+        """Атрибут span для каждой ячейки строки."""
+        if self.use_classes:
+            classes = np.searchsorted(self.colors, packed_row)
+            return [f'class="c{i}"' for i in classes.tolist()]
+        return [f'style="color:#{value:06x}"' for value in packed_row.tolist()]
+
+
+def _fill_blank_colors(packed, line):
+    """Пробелы невидимы - берём им цвет предыдущего символа, чтобы не рвать отрезки."""
+    chars = np.frombuffer(line.encode('utf-32-le'), dtype=np.uint32)
+    visible = chars != ord(' ')
+    if visible.all() or not visible.any():
+        return packed
+    source = np.where(visible, np.arange(len(chars)), 0)
+    np.maximum.accumulate(source, out=source)
+    return packed[source]
+
+
+def frame_html_lines(ascii_str, packed, table):
+    """Строки HTML кадра: подряд идущие символы одного цвета - в одном span.
+
+    Возвращает (строки, число span).
+    """
+    lines = ascii_str.split('\n')
+    if lines and lines[-1] == '':
+        lines.pop()
+    out = []
+    spans = 0
+    rows = packed.shape[0] if packed is not None else 0
+    for y, line in enumerate(lines):
+        if y >= rows or not line:
+            out.append(html.escape(line, quote=False))
+            continue
+        width = min(len(line), packed.shape[1])
+        row = _fill_blank_colors(packed[y, :width], line[:width])
+        starts = np.flatnonzero(np.r_[True, row[1:] != row[:-1]]).tolist()
+        ends = starts[1:] + [width]
+        attrs = table.attrs(row[starts])
+        parts = [f'<span {attr}>{html.escape(line[s:e], quote=False)}</span>'
+                 for attr, s, e in zip(attrs, starts, ends)]
+        parts.append(html.escape(line[width:], quote=False))
+        out.append(''.join(parts))
+        spans += len(starts)
+    return out, spans
+
+
+def _prepare(colors, quantize):
+    packed = [pack_colors(quantize_colors(color_data, quantize)) if color_data is not None else None
+              for color_data in colors]
+    table = ColorTable([p for p in packed if p is not None])
+    return packed, table
+
+
+def _html_page_head(table, extra_style):
+    return ['<!DOCTYPE html><html><head><meta charset="UTF-8"><style>',
+            PAGE_STYLE,
+            extra_style,
+            table.stylesheet(),
+            '</style></head><body>']
+
+
+def _single_page(ascii_str, color_data, quantize):
+    packed, table = _prepare([color_data], quantize)
+    lines, spans = frame_html_lines(ascii_str, packed[0], table)
+    page = _html_page_head(table, 'pre { margin: 0; }') + ['<pre>'] + lines + ['</pre></body></html>']
+    return '\n'.join(page), spans, len(table.colors)
+
+
+def render_html(ascii_str, color_data, quantize=0):
+    """Цветной HTML для одного кадра."""
+    return _single_page(ascii_str, color_data, quantize)[0]
+
+
+def write_html(filename, ascii_str, color_data, quantize=0):
+    """Сохраняет цветной HTML одного кадра; возвращает ExportStats."""
+    start = time.perf_counter()
+    with stage('write_html') as st:
+        page, spans, colors = _single_page(ascii_str, color_data, quantize)
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(page)
+        st.size = os.path.getsize(filename)
+    return ExportStats(filename, os.path.getsize(filename), time.perf_counter() - start, spans, colors)
+
+
+def _js_template(text):
+    return '`' + text.replace('\\', '\\\\').replace('`', '\\`').replace('${', '\\${') + '`'
+
+
+def _write_animated_html(filename, frames, quantize):
+    packed, table = _prepare([frame.colors for frame in frames], quantize)
+    spans = 0
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(_html_page_head(table, '#ascii-container { white-space: pre; }') + [
+            '<div id="ascii-container"></div>',
+            '<script>',
+            'const frames = [']))
+        for index, frame in enumerate(frames):
+            lines, frame_spans = frame_html_lines(frame.text, packed[index], table)
+            spans += frame_spans
+            f.write((',\n' if index else '\n') + _js_template('\n'.join(lines) + '\n'))
+        f.write('\n'.join([
+            '];',
+            f'const durations = {json.dumps([frame.duration for frame in frames])};',
+            'const container = document.getElementById("ascii-container");',
+            'container.innerHTML = frames[0];',
+            PLAYBACK_JS,
+            'playFrames(durations, i => { container.innerHTML = frames[i]; });',
+            '</script></body></html>'
+        ]))
+    return spans, table
+
+
+def write_animated_html(filename, frames, quantize=0):
+    """Сохраняет анимированный HTML (кадры AsciiFrame), записывая кадры по одному; возвращает ExportStats."""
+    start = time.perf_counter()
+    with stage('write_html') as st:
+        spans, table = _write_animated_html(filename, frames, quantize)
+        st.size = os.path.getsize(filename)
+    return ExportStats(filename, os.path.getsize(filename), time.perf_counter() - start,
+                       spans, len(table.colors))
+
+
+def format_stats(stats):
+    """Краткая сводка экспорта для статус-бара и консоли."""
+    size = stats.bytes / (1 << 20)
+    return f"{size:.2f} МБ за {stats.seconds:.2f} с, фрагментов {stats.spans}, цветов {stats.colors}"
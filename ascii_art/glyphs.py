@@ -0,0 +1,102 @@
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from .playback import split_lines
+
+DEFAULT_FONT_SIZE = 12
+# Моноширинные шрифты, которые пробуем по очереди (Linux, Windows, macOS)
+FONT_CANDIDATES = ('DejaVuSansMono.ttf', 'consola.ttf', 'cour.ttf', 'Menlo.ttc', 'LiberationMono-Regular.ttf')
+BACKGROUND = (0, 0, 0)
+FOREGROUND = (255, 255, 255)
+# Блочные символы рисуем сами (доля закрашенной клетки) - в шрифтах их часто нет
+_SHADES = {'█': 1.0, '▓': 0.75, '▒': 0.5, '░': 0.25}
+_LOWER_BLOCKS = {chr(0x2580 + k): k / 8 for k in range(1, 8)}  # ▁..▇ - нижние k/8 клетки
+
+
+def load_font(size=DEFAULT_FONT_SIZE, path=None):
+    """TrueType-шрифт: указанный или первый найденный моноширинный, иначе встроенный Pillow."""
+    for candidate in ([path] if path else FONT_CANDIDATES):
+        try:
+            return ImageFont.truetype(candidate, size)
+        except OSError:
+            continue
+    if path:
+        raise ValueError(f"Не удалось загрузить шрифт {path}")
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def _block_mask(char, width, height):
+    """Маска блочного символа или None, если символ рисуется шрифтом."""
+    mask = np.zeros((height, width), np.uint8)
+    if char in _SHADES:
+        mask[:] = round(255 * _SHADES[char])
+    elif char in _LOWER_BLOCKS:
+        mask[height - round(height * _LOWER_BLOCKS[char]):] = 255
+    else:
+        return None
+    return mask
+
+
+class GlyphAtlas:
+    """Символы, отрисованные один раз в клетки одинакового размера.
+
+    masks - массив (символов, высота, ширина) uint8 с покрытием символа;
+    кадр собирается одной выборкой masks[индексы], без отрисовки по символам.
+    Неизвестные атласу символы выводятся пробелом.
+    """
+
+    def __init__(self, chars, font_size=DEFAULT_FONT_SIZE, font_path=None):
+        self.chars = ''.join(dict.fromkeys(' ' + chars))
+        font = load_font(font_size, font_path)
+        ascent, descent = font.getmetrics()
+        self.cell_height = ascent + descent
+        self.cell_width = max(1, int(np.ceil(max(font.getlength(char) for char in self.chars + 'M'))))
+        masks = []
+        for char in self.chars:
+            mask = _block_mask(char, self.cell_width, self.cell_height)
+            if mask is None:
+                image = Image.new('L', (self.cell_width, self.cell_height), 0)
+                offset = (self.cell_width - font.getlength(char)) / 2
+                ImageDraw.Draw(image).text((offset, 0), char, fill=255, font=font)
+                mask = np.asarray(image)
+            masks.append(mask)
+        self.masks = np.stack(masks)
+        codes = np.array([ord(char) for char in self.chars], np.uint32)
+        self._order = np.argsort(codes)
+        self._codes = codes[self._order]
+
+    def indices(self, ascii_str):
+        """Номера символов атласа для каждой клетки кадра: (строк, столбцов)."""
+        lines = split_lines(ascii_str)
+        columns = max((len(line) for line in lines), default=0)
+        padded = ''.join(line.ljust(columns) for line in lines)
+        codes = np.frombuffer(padded.encode('utf-32-le'), np.uint32).reshape(len(lines), columns)
+        position = np.minimum(np.searchsorted(self._codes, codes), len(self._codes) - 1)
+        found = self._codes[position] == codes
+        # Пробел всегда первый в атласе
+        return np.where(found, self._order[position], 0)
+
+    def render(self, ascii_str, colors=None, background=BACKGROUND, foreground=FOREGROUND):
+        """Кадр в RGB uint8; символы окрашены цветами colors (H x W x 3) или foreground."""
+        index = self.indices(ascii_str)
+        rows, columns = index.shape
+        coverage = self.masks[index].astype(np.uint16)  # (строк, столбцов, высота, ширина)
+        if colors is not None and colors.shape[:2] == (rows, columns):
+            ink = colors.astype(np.int16)[:, :, None, None, :]
+        else:
+            ink = np.array(foreground, np.int16)
+        back = np.array(background, np.int16)
+        image = back + (coverage[..., None] * (ink - back) + 127) // 255
+        image = image.astype(np.uint8).transpose(0, 2, 1, 3, 4)
+        return image.reshape(rows * self.cell_height, columns * self.cell_width, 3)
+
+
+@lru_cache(maxsize=8)
+def cached_atlas(chars, font_size=DEFAULT_FONT_SIZE, font_path=None):
+    """Общий GlyphAtlas для набора символов и шрифта (строится один раз)."""
+    return GlyphAtlas(chars, font_size, font_path)
@@ -0,0 +1,41 @@
+from .core import DIRECTION_CHARS
+from .engine import map_glyphs
+
+
+class LiveState:
+    """Промежуточные данные последней конвертации для мгновенной пересборки символов.
+
+    Палитра и порог градиента влияют только на выбор символов, поэтому при их
+    изменении достаточно заново пройти engine по сохранённым FrameFields.
+    """
+
+    def __init__(self, fields, params, direction_chars=DIRECTION_CHARS):
+        self.fields = fields
+        self.params = params
+        self.direction_chars = direction_chars
+        # Повторы кадров: первый кадр с теми же FrameFields -> все такие кадры
+        first = {}
+        self.copies = {}
+        for index, frame in enumerate(fields):
+            source = first.setdefault(id(frame), index)
+            self.copies.setdefault(source, []).append(index)
+        self.sources = [first[id(frame)] for frame in fields]
+
+    def __len__(self):
+        return len(self.fields)
+
+    def unique_order(self, start=0):
+        """Уникальные кадры, начиная с кадра start, для пересборки по одному разу."""
+        count = len(self.fields)
+        order = (self.sources[(start + i) % count] for i in range(count))
+        return list(dict.fromkeys(order))
+
+    def accepts(self, params):
+        """True, если params отличаются от исходных только палитрой и порогом."""
+        return params._replace(palette='', grad_thresh=0) == self.params._replace(palette='', grad_thresh=0)
+
+    def render_text(self, index, params):
+        """Текст кадра index для новых палитры и порога."""
+        fields = self.fields[index]
+        return map_glyphs(fields.luma, fields.magnitude, fields.angle, params.palette,
+                          self.direction_chars, params.grad_thresh, fields.detail)
@@ -0,0 +1,83 @@
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import cv2
+
+# Как часто при ожидании кадра из пула проверяется остановка, с
+STOP_POLL_INTERVAL = 0.05
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def _init_worker():
+    # Параллелизм уже на уровне процессов - внутренние потоки OpenCV только мешают
+    cv2.setNumThreads(1)
+
+
+def _wait(future, should_stop):
+    """Ждёт future, проверяя остановку; False - остановлено раньше, чем кадр готов."""
+    if should_stop is None:
+        return True
+    while not should_stop():
+        if wait([future], timeout=STOP_POLL_INTERVAL, return_when=FIRST_COMPLETED).done:
+            return True
+    return False
+
+
+def create_pool(workers=None, initializer=_init_worker, initargs=()):
+    """Пул процессов для ordered_map, который переживает один вызов (например, в сервере)."""
+    return ProcessPoolExecutor(max_workers=workers or default_workers(), initializer=initializer, initargs=initargs)
+
+
+def ordered_map(func, items, workers=None, window=None, should_stop=None, pool=None):
+    """Применяет func к items в пуле процессов и отдаёт результаты в исходном порядке.
+
+    Одновременно в работе не более window элементов, поэтому items может быть
+    генератором любой длины. При workers <= 1 всё выполняется в текущем процессе.
+    func должна быть функцией верхнего уровня (или functools.partial от неё),
+    чтобы её можно было передать в дочерний процесс.
+    Если передан pool (см. create_pool), используется он и остаётся открытым;
+    иначе на время вызова создаётся свой.
+    """
+    workers = workers or default_workers()
+    if workers <= 1 and pool is None:
+        for item in items:
+            if should_stop is not None and should_stop():
+                return
+            yield func(item)
+        return
+
+    window = window or workers * 2
+    own_pool = pool is None
+    if own_pool:
+        pool = create_pool(workers)
+    pending = deque()
+    completed = False
+    try:
+        for item in items:
+            if should_stop is not None and should_stop():
+                return
+            pending.append(pool.submit(func, item))
+            if len(pending) >= window:
+                if not _wait(pending[0], should_stop):
+                    return
+                yield pending.popleft().result()
+        while pending:
+            if not _wait(pending[0], should_stop):
+                return
+            yield pending.popleft().result()
+        completed = True
+    finally:
+        if own_pool:
+            if completed:
+                # Дожидаемся завершения процессов, иначе пул закрывается уже при выходе интерпретатора
+                pool.shutdown(wait=True)
+            else:
+                # При остановке и ошибке не ждём кадры, которые ещё не начали обрабатываться
+                pool.shutdown(wait=False, cancel_futures=True)
+        else:
+            for future in pending:
+                future.cancel()
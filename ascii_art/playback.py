@@ -0,0 +1,123 @@
+import time
+from collections import OrderedDict, deque
+
+from .timing import FrameScheduler
+
+# Сколько кадров, разбитых на строки, держат проигрыватели (LRU)
+LINES_CACHE_SIZE = 64
+
+
+def split_lines(text):
+    """Строки кадра без завершающего перевода строки."""
+    lines = text.split('\n')
+    if lines and lines[-1] == '':
+        lines.pop()
+    return lines
+
+
+def changed_blocks(old, new):
+    """Подряд идущие изменившиеся строки: [(первая, последняя)] включительно."""
+    blocks = []
+    start = None
+    for row, (a, b) in enumerate(zip(old, new)):
+        if a != b:
+            if start is None:
+                start = row
+        elif start is not None:
+            blocks.append((start, row - 1))
+            start = None
+    if start is not None:
+        blocks.append((start, len(new) - 1))
+    return blocks
+
+
+class TextPlayback:
+    """Воспроизведение ASCII-анимации в текстовом виджете Tk без полной перезаписи.
+
+    При смене кадра заменяются только изменившиеся строки (соседние - одним
+    блоком); повторяющийся кадр не перерисовывается вовсе. Кадр выбирается
+    FrameScheduler по реальному времени: если отрисовка не успевает, лишние
+    кадры пропускаются и считаются в dropped. frames - список текстов, его можно
+    менять на ходу (пересборка кадров на лету). on_frame(playback) вызывается
+    после каждой смены кадра.
+    """
+
+    def __init__(self, widget, frames, durations, on_frame=None):
+        self.widget = widget
+        self.frames = frames
+        self.scheduler = FrameScheduler(durations)
+        self.on_frame = on_frame
+        self.index = 0
+        self.job = None
+        self._shown_text = None
+        self._shown_lines = None
+        self._lines_cache = OrderedDict()
+        self._shown_times = deque(maxlen=30)
+
+    @property
+    def dropped(self):
+        return self.scheduler.dropped
+
+    @property
+    def fps(self):
+        """Фактическая частота смены кадров по последним показам."""
+        if len(self._shown_times) < 2:
+            return 0.0
+        span = self._shown_times[-1] - self._shown_times[0]
+        return (len(self._shown_times) - 1) / span if span > 0 else 0.0
+
+    def start(self, index=0):
+        self.stop()
+        self._shown_text = None
+        self._shown_lines = None
+        self._shown_times.clear()
+        self.scheduler.restart(index)
+        self.scheduler.dropped = 0
+        self.index = index
+        self._tick()
+
+    def stop(self):
+        if self.job is not None:
+            self.widget.after_cancel(self.job)
+            self.job = None
+
+    def _tick(self):
+        self.job = None
+        if not self.frames:
+            return
+        index, delay = self.scheduler.tick()
+        self.show(index)
+        self.job = self.widget.after(delay, self._tick)
+
+    def _lines(self, index):
+        text = self.frames[index]
+        cached = self._lines_cache.get(index)
+        if cached is None or cached[0] is not text:
+            cached = (text, split_lines(text))
+            self._lines_cache[index] = cached
+            if len(self._lines_cache) > LINES_CACHE_SIZE:
+                self._lines_cache.popitem(last=False)
+        else:
+            self._lines_cache.move_to_end(index)
+        return cached[1]
+
+    def show(self, index):
+        """Показывает кадр index, меняя в виджете только отличающиеся строки."""
+        text = self.frames[index]
+        self.index = index
+        if text is self._shown_text:
+            return
+        lines = self._lines(index)
+        old = self._shown_lines
+        if old is None or len(old) != len(lines):
+            self.widget.delete('1.0', 'end')
+            self.widget.insert('1.0', text)
+        else:
+            for first, last in changed_blocks(old, lines):
+                self.widget.delete(f'{first + 1}.0', f'{last + 1}.end')
+                self.widget.insert(f'{first + 1}.0', '\n'.join(lines[first:last + 1]))
+        self._shown_text = text
+        self._shown_lines = lines
+        self._shown_times.append(time.perf_counter())
+        if self.on_frame is not None:
+            self.on_frame(self)
@@ -0,0 +1,188 @@
+import base64
+import html
+import json
+import os
+import time
+
+import numpy as np
+
+from .export import PAGE_STYLE, ColorTable, ExportStats, pack_colors, quantize_colors
+from .profiling import stage
+from .timing import PLAYBACK_JS
+
+# Цвет символов кадра без цветовых данных
+DEFAULT_COLOR = 0xFFFFFF
+
+# Плеер: первый кадр целиком, далее только изменившиеся ячейки.
+# Перерисовываются лишь строки, в которых что-то поменялось.
+PLAYER_JS = '''
+function decode(b64, Type) {
+  const bin = atob(b64);
+  const bytes = new Uint8Array(bin.length);
+  for (let i = 0; i < bin.length; i++) bytes[i] = bin.charCodeAt(i);
+  return new Type(bytes.buffer);
+}
+const TYPES = {Uint8Array, Uint16Array, Uint32Array};
+const GlyphArray = TYPES[DATA.glyphType], ColorArray = TYPES[DATA.colorType];
+const container = document.getElementById("ascii-container");
+const glyph = decode(DATA.first.g, GlyphArray);
+const color = decode(DATA.first.c, ColorArray);
+const deltas = DATA.deltas.map(d => ({
+  p: decode(d.p, Uint32Array),
+  g: decode(d.g, GlyphArray),
+  c: decode(d.c, ColorArray)
+}));
+const W = DATA.width, H = DATA.height, SPACE = DATA.space;
+const rows = [];
+for (let y = 0; y < H; y++) {
+  const row = document.createElement("div");
+  container.appendChild(row);
+  rows.push(row);
+}
+function renderRow(y) {
+  let out = "", run = "", runColor = -1;
+  for (let x = y * W, end = x + W; x < end; x++) {
+    const g = glyph[x];
+    if (g !== SPACE && color[x] !== runColor) {
+      if (run) out += runColor < 0 ? run : "<span " + DATA.colors[runColor] + ">" + run + "</span>";
+      run = "";
+      runColor = color[x];
+    }
+    run += DATA.glyphs[g];
+  }
+  if (run) out += runColor < 0 ? run : "<span " + DATA.colors[runColor] + ">" + run + "</span>";
+  rows[y].innerHTML = out;
+}
+for (let y = 0; y < H; y++) renderRow(y);
+let current = 0;
+// Переход к кадру target: дельты применяются по порядку (в том числе пропущенных
+// кадров), а строки перерисовываются один раз
+function showFrame(target) {
+  const dirty = new Set();
+  while (current !== target) {
+    const d = deltas[current];
+    for (let i = 0; i < d.p.length; i++) {
+      const p = d.p[i];
+      glyph[p] = d.g[i];
+      color[p] = d.c[i];
+      dirty.add((p / W) | 0);
+    }
+    current = (current + 1) % deltas.length;
+  }
+  dirty.forEach(renderRow);
+}
+'''
+
+
+def _b64(array):
+    return base64.b64encode(np.ascontiguousarray(array).tobytes()).decode('ascii')
+
+
+def _typed_array(dtype):
+    return {np.dtype(np.uint8): 'Uint8Array', np.dtype(np.uint16): 'Uint16Array',
+            np.dtype(np.uint32): 'Uint32Array'}[np.dtype(dtype)]
+
+
+def _smallest_uint(count):
+    if count <= 1 << 8:
+        return np.uint8
+    if count <= 1 << 16:
+        return np.uint16
+    return np.uint32
+
+
+def text_grid(ascii_str):
+    """Текст кадра -> массив символов (H, W)."""
+    lines = ascii_str.split('\n')
+    if lines and lines[-1] == '':
+        lines.pop()
+    width = max((len(line) for line in lines), default=0)
+    return np.array([list(line.ljust(width)) for line in lines], dtype='<U1').reshape(len(lines), width)
+
+
+def encode_delta_frames(frames, quantize=0):
+    """Кодирует кадры AsciiFrame для плеера; возвращает (данные, ColorTable, изменённых ячеек).
+
+    Первый кадр хранится целиком (индексы глифов и цветов), каждый следующий -
+    как список изменившихся ячеек; последняя дельта возвращает к первому кадру.
+    Цвет пробелов не влияет на вид, поэтому его изменения не записываются.
+    """
+    grids = [text_grid(frame.text) for frame in frames]
+    shape = grids[0].shape
+    if any(grid.shape != shape for grid in grids):
+        raise ValueError("Кадры анимации разного размера")
+
+    glyphs = np.unique(np.concatenate([grid.ravel() for grid in grids]))
+    packed = []
+    for frame in frames:
+        if frame.colors is None:
+            packed.append(np.full(shape, DEFAULT_COLOR, np.uint32))
+        else:
+            packed.append(pack_colors(quantize_colors(frame.colors[:shape[0], :shape[1]], quantize)))
+    table = ColorTable(packed)
+
+    glyph_type = _smallest_uint(len(glyphs))
+    color_type = _smallest_uint(len(table.colors))
+    glyph_idx = [np.searchsorted(glyphs, grid.ravel()).astype(glyph_type) for grid in grids]
+    color_idx = [np.searchsorted(table.colors, p.ravel()).astype(color_type) for p in packed]
+    space = int(np.searchsorted(glyphs, ' ')) if ' ' in glyphs else -1
+
+    cur_g = glyph_idx[0].copy()
+    cur_c = color_idx[0].copy()
+    deltas = []
+    changed_cells = 0
+    order = list(range(1, len(frames))) + [0]
+    for index in order:
+        g, c = glyph_idx[index], color_idx[index]
+        changed = (g != cur_g) | ((c != cur_c) & (g != space))
+        positions = np.flatnonzero(changed).astype(np.uint32)
+        cur_g[positions] = g[positions]
+        cur_c[positions] = c[positions]
+        changed_cells += len(positions)
+        deltas.append({'p': _b64(positions), 'g': _b64(g[positions]), 'c': _b64(c[positions])})
+
+    data = {
+        'width': int(shape[1]),
+        'height': int(shape[0]),
+        'space': space,
+        'glyphs': [html.escape(ch, quote=False) for ch in glyphs.tolist()],
+        'colors': table.attrs(table.colors),
+        'glyphType': _typed_array(glyph_type),
+        'colorType': _typed_array(color_type),
+        'durations': [frame.duration for frame in frames],
+        'first': {'g': _b64(glyph_idx[0]), 'c': _b64(color_idx[0])},
+        'deltas': deltas,
+    }
+    return data, table, changed_cells
+
+
+def write_delta_html(filename, frames, quantize=0):
+    """Сохраняет анимацию в компактном дельта-формате с JS-плеером; возвращает ExportStats.
+
+    В ExportStats поле spans содержит число изменённых ячеек во всех дельтах.
+    """
+    start = time.perf_counter()
+    with stage('write_delta_html') as st:
+        data, table, changed_cells = encode_delta_frames(frames, quantize)
+        _write_page(filename, data, table)
+        st.size = os.path.getsize(filename)
+    return ExportStats(filename, os.path.getsize(filename), time.perf_counter() - start,
+                       changed_cells, len(table.colors))
+
+
+def _write_page(filename, data, table):
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':')).replace('</', '<\\/')
+    page = ['<!DOCTYPE html><html><head><meta charset="UTF-8"><style>',
+            PAGE_STYLE,
+            '#ascii-container { white-space: pre; }',
+            table.stylesheet(),
+            '</style></head><body>',
+            '<div id="ascii-container"></div>',
+            '<script>',
+            f'const DATA = {payload};',
+            PLAYER_JS,
+            PLAYBACK_JS,
+            'playFrames(DATA.durations, showFrame);',
+            '</script></body></html>']
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(page))
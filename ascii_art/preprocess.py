@@ -0,0 +1,165 @@
+import threading
+from collections import namedtuple
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+from .profiling import stage
+from .shapes import SHAPE_BLOCK
+
+# Соотношение сторон символа моноширинного шрифта
+CHAR_ASPECT = 2.0
+# Параметры CLAHE: порог ограничения контраста и сетка тайлов (по X, по Y)
+CLAHE_CLIP_LIMIT = 2.0
+CLAHE_GRID = (8, 8)
+
+# Промежуточные данные кадра в размере ASCII-сетки:
+# яркость, модуль и угол градиента (или None), цвет RGB (или None),
+# подклеточная яркость для подбора по форме (строк, столбцов, отсчётов SHAPE_BLOCK) или None
+FrameFields = namedtuple('FrameFields', ['luma', 'magnitude', 'angle', 'color', 'detail'], defaults=[None])
+
+
+def output_height(shape, width, v_compress):
+    """Высота ASCII-сетки для исходника заданного размера."""
+    height, orig_width = shape[:2]
+    aspect_ratio = height / orig_width
+    new_height = int(width * aspect_ratio / CHAR_ASPECT * v_compress)
+    if new_height < 1:
+        new_height = 1
+    return new_height
+
+
+def compute_gradient(resized):
+    """Модуль и направление (в градусах 0..360) градиента Собеля."""
+    gx = cv2.Sobel(resized, cv2.CV_64F, 1, 0, ksize=3)
+    gy = cv2.Sobel(resized, cv2.CV_64F, 0, 1, ksize=3)
+    magnitude = np.sqrt(gx**2 + gy**2)
+    angle = np.arctan2(gy, gx) * 180 / np.pi
+    angle = (angle + 360) % 360
+    return magnitude, angle
+
+
+def gamma_table(gamma):
+    inv_gamma = 1.0 / gamma
+    return np.array([((i / 255.0) ** inv_gamma) * 255 for i in range(256)]).astype("uint8")
+
+
+class Preprocessor:
+    """Предобработка кадров для одного набора параметров.
+
+    LUT гаммы, объект CLAHE, ядро дилатации и размеры сетки создаются один раз
+    и переиспользуются для всех кадров. Объект CLAHE хранит состояние между
+    вызовами apply, поэтому у каждого потока он свой.
+    """
+
+    def __init__(self, params):
+        self.width = params.width
+        self.v_compress = params.v_compress
+        self.use_edges = params.use_edges
+        self.use_gradient = params.use_gradient
+        self.with_color = params.export_html
+        self.with_detail = params.shape_match
+        self.table = gamma_table(params.gamma)
+        self._local = threading.local()
+        self.kernel = np.ones((2, 2), np.uint8)
+        self._sizes = {}
+
+    @property
+    def clahe(self):
+        clahe = getattr(self._local, 'clahe', None)
+        if clahe is None:
+            clahe = self._local.clahe = cv2.createCLAHE(clipLimit=CLAHE_CLIP_LIMIT, tileGridSize=CLAHE_GRID)
+        return clahe
+
+    def output_size(self, shape):
+        """Размер ASCII-сетки (width, height) для кадра заданной формы."""
+        key = shape[:2]
+        size = self._sizes.get(key)
+        if size is None:
+            size = (self.width, output_height(key, self.width, self.v_compress))
+            self._sizes[key] = size
+        return size
+
+    # Отдельные шаги предобработки (их же по одному замеряет bench)
+
+    def contrast(self, img):
+        """Серый кадр после гаммы и CLAHE."""
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        gray = cv2.LUT(gray, self.table)
+        return self.clahe.apply(gray)
+
+    def edges(self, gray):
+        """Обводка границ Canny поверх яркости."""
+        edges = cv2.Canny(gray, 100, 200)
+        edges = cv2.dilate(edges, self.kernel, iterations=1)
+        return cv2.addWeighted(gray, 0.8, edges, 0.2, 0)
+
+    def resize(self, gray, size):
+        return cv2.resize(gray, size, interpolation=cv2.INTER_CUBIC)
+
+    def detail(self, gray, size):
+        """Яркость каждой клетки в SHAPE_BLOCK отсчётах: (строк, столбцов, отсчётов)."""
+        rows, columns = SHAPE_BLOCK
+        width, height = size
+        fine = cv2.resize(gray, (width * columns, height * rows), interpolation=cv2.INTER_AREA)
+        return fine.reshape(height, rows, width, columns).transpose(0, 2, 1, 3).reshape(height, width, -1)
+
+    def color(self, img, size):
+        """RGB-цвет каждой ячейки сетки."""
+        img_color = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        return cv2.resize(img_color, size, interpolation=cv2.INTER_CUBIC)
+
+    def luminance(self, img):
+        """Яркость в исходном разрешении после гаммы, CLAHE и обводки границ."""
+        with stage('contrast') as st:
+            gray = st.output(self.contrast(img))
+        if self.use_edges:
+            with stage('edges') as st:
+                gray = st.output(self.edges(gray))
+        return gray
+
+    def fields(self, img):
+        """Все промежуточные данные кадра в размере ASCII-сетки."""
+        size = self.output_size(img.shape)
+        gray = self.luminance(img)
+        with stage('resize') as st:
+            resized = st.output(self.resize(gray, size))
+
+        if self.use_gradient:
+            with stage('sobel') as st:
+                magnitude, angle = st.output(compute_gradient(resized))
+        else:
+            magnitude = None
+            angle = None
+
+        resized_color = None
+        if self.with_color:
+            with stage('color') as st:
+                resized_color = st.output(self.color(img, size))
+
+        detail = None
+        if self.with_detail:
+            with stage('detail') as st:
+                detail = st.output(self.detail(gray, size))
+
+        return FrameFields(resized, magnitude, angle, resized_color, detail)
+
+
+# Параметры, от которых зависит предобработка кадра; остальные в ключ не входят
+PREPROCESS_FIELDS = ('width', 'gamma', 'use_edges', 'use_gradient', 'v_compress', 'export_html', 'shape_match')
+
+
+@lru_cache(maxsize=8)
+def _cached_preprocessor(params):
+    return Preprocessor(params)
+
+
+def preprocessor_for(params):
+    """Общий Preprocessor для набора параметров (в каждом процессе свой).
+
+    Палитра, порог градиента, допуск повторов и выбор кадров на предобработку
+    не влияют и в ключ не входят.
+    """
+    ignored = {name: value for name, value in params._field_defaults.items() if name not in PREPROCESS_FIELDS}
+    return _cached_preprocessor(params._replace(**ignored))
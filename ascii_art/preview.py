@@ -0,0 +1,107 @@
+import threading
+import time
+
+from PIL import Image
+
+from .timing import DEFAULT_DURATION, read_gif_timings
+
+# Размер превью в окне
+PREVIEW_SIZE = (800, 600)
+# Как часто превью берёт кадр из прохода конвертации, с
+FEED_INTERVAL = 0.1
+
+
+class LazyGifPreview:
+    """Кадры превью GIF, которые фоновый поток декодирует по мере надобности.
+
+    Сначала декодируется первый кадр, затем из заголовков читаются
+    длительности всех кадров. Дальше поток декодирует только те кадры, которые
+    запросил интерфейс через want(); готовое превью забирается take().
+    Держится не больше чем запрошено кадров, так что память не зависит от
+    длины GIF. Методы можно вызывать из потока интерфейса - они не блокируют.
+
+    Во время конвертации превью само не декодирует: интерфейс снимает
+    запросы want([]), а кадры приходят из прохода конвертации через feed() и
+    забираются take_fed(). Так файл на время конвертации декодируется один раз.
+    """
+
+    def __init__(self, path, size=PREVIEW_SIZE):
+        self.path = path
+        self.size = size
+        self.durations = None  # длительности кадров, мс (None - ещё читаются)
+        self.error = None
+        self._ready = {}
+        self._wanted = [0]
+        self._fed = None
+        self._fed_at = 0.0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def want(self, indices):
+        """Кадры, превью которых понадобится в ближайшее время, в порядке показа."""
+        with self._cond:
+            self._wanted = list(indices)
+            for index in [i for i in self._ready if i not in self._wanted]:
+                del self._ready[index]
+            self._cond.notify()
+
+    def take(self, index):
+        """Готовое превью кадра (PIL Image) или None, если он ещё не декодирован."""
+        with self._cond:
+            return self._ready.pop(index, None)
+
+    def feed(self, index, frame):
+        """Кадр BGR из прохода конвертации (вызывается в её потоке); берётся не чаще FEED_INTERVAL."""
+        now = time.perf_counter()
+        if now - self._fed_at < FEED_INTERVAL:
+            return
+        self._fed_at = now
+        image = Image.fromarray(frame[:, :, ::-1])
+        image.thumbnail(self.size)
+        with self._cond:
+            self._fed = (index, image)
+
+    def take_fed(self):
+        """Последний кадр из feed() как (index, PIL Image) или None, если нового нет."""
+        with self._cond:
+            fed, self._fed = self._fed, None
+            return fed
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def _next_target(self):
+        with self._cond:
+            while not self._closed:
+                for index in self._wanted:
+                    if index not in self._ready and (self.durations is None or index < len(self.durations)):
+                        return index
+                self._cond.wait()
+            return None
+
+    def _decode(self, gif, index):
+        gif.seek(index)
+        frame = gif.convert('RGB')
+        frame.thumbnail(self.size)
+        with self._cond:
+            if index in self._wanted:
+                self._ready[index] = frame
+
+    def _run(self):
+        try:
+            with Image.open(self.path) as gif:
+                self._decode(gif, 0)
+                durations = [timing.duration for timing in read_gif_timings(self.path)] or [DEFAULT_DURATION]
+                with self._cond:
+                    self.durations = durations
+                while True:
+                    index = self._next_target()
+                    if index is None:
+                        break
+                    self._decode(gif, index)
+        except Exception as e:
+            self.error = e
@@ -0,0 +1,205 @@
+import json
+import threading
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import partial
+
+# Замер одного этапа: время (с), пик выделенной памяти (байт, None без замера памяти),
+# объём результата (байт) и номер кадра (None - не относится к кадру)
+StageRecord = namedtuple('StageRecord', ['stage', 'seconds', 'memory', 'size', 'frame'])
+
+_local = threading.local()
+
+
+def data_size(value):
+    """Объём результата этапа в байтах."""
+    if value is None:
+        return 0
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if hasattr(value, 'getbands'):  # изображение PIL
+        return value.width * value.height * len(value.getbands())
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(data_size(item) for item in value)
+    return 0
+
+
+class _Stage:
+    __slots__ = ('size',)
+
+    def __init__(self):
+        self.size = 0
+
+    def output(self, value):
+        """Запоминает объём результата этапа."""
+        self.size = data_size(value)
+        return value
+
+
+class Profiler:
+    """Собирает замеры этапов конвертации и передаёт их подписчикам.
+
+    Этапы замеряются только в потоке, где профайлер активирован (activate),
+    и в дочерних процессах пула, откуда записи возвращаются вместе с результатом.
+    Каждый hook вызывается с StageRecord в потоке конвертации.
+    """
+
+    def __init__(self, hooks=(), memory=True):
+        self.hooks = list(hooks)
+        self.memory = memory
+        self.records = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def clear(self):
+        with self._lock:
+            self.records = []
+
+    def emit(self, record):
+        with self._lock:
+            self.records.append(record)
+        for hook in self.hooks:
+            hook(record)
+
+    @contextmanager
+    def activate(self):
+        """Включает замеры в текущем потоке на время блока with."""
+        previous = getattr(_local, 'profiler', None)
+        started = self.memory and not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        _local.profiler = self
+        try:
+            yield self
+        finally:
+            _local.profiler = previous
+            if started:
+                tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name, frame=None):
+        state = _Stage()
+        memory = self.memory and tracemalloc.is_tracing()
+        if memory:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        yield state
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] - base if memory else None
+        self.emit(StageRecord(name, seconds, peak, state.size, frame))
+
+    def summary(self):
+        """Итог по этапам: {этап: {'count', 'seconds', 'memory', 'size'}}, самые долгие первыми.
+
+        memory - наибольший пик одного вызова, size - суммарный объём результатов.
+        """
+        totals = {}
+        with self._lock:
+            records = list(self.records)
+        for record in records:
+            total = totals.setdefault(record.stage, {'count': 0, 'seconds': 0.0, 'memory': None, 'size': 0})
+            total['count'] += 1
+            total['seconds'] += record.seconds
+            total['size'] += record.size
+            if record.memory is not None:
+                total['memory'] = max(total['memory'] or 0, record.memory)
+        return dict(sorted(totals.items(), key=lambda item: -item[1]['seconds']))
+
+    def trace(self):
+        """Все замеры и итог в виде словаря для JSON."""
+        with self._lock:
+            records = [record._asdict() for record in self.records]
+        return {'records': records, 'summary': self.summary()}
+
+    def write_trace(self, filename):
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.trace(), f, ensure_ascii=False, indent=1)
+
+
+class _NoStage:
+    """Заглушка этапа, когда профайлер не активен: ничего не замеряет."""
+    __slots__ = ()
+
+    @property
+    def size(self):
+        return 0
+
+    @size.setter
+    def size(self, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def output(self, value):
+        return value
+
+
+_NO_STAGE = _NoStage()
+
+
+def current():
+    """Активный в текущем потоке профайлер или None."""
+    return getattr(_local, 'profiler', None)
+
+
+def stage(name, frame=None):
+    """Замер этапа активным профайлером: with stage('resize') as st: st.output(result)."""
+    profiler = getattr(_local, 'profiler', None)
+    if profiler is None:
+        return _NO_STAGE
+    return profiler.stage(name, frame)
+
+
+def _run_traced(func, memory, item):
+    profiler = Profiler(memory=memory)
+    with profiler.activate():
+        result = func(item)
+    return result, profiler.records
+
+
+def traced(func):
+    """Обёртка func для ordered_map: замеры в дочернем процессе возвращаются вместе с результатом.
+
+    Возвращает (функция, профайлер или None); результаты разворачивает replay.
+    """
+    profiler = current()
+    if profiler is None:
+        return func, None
+    return partial(_run_traced, func, profiler.memory), profiler
+
+
+def replay(result, profiler, frame=None):
+    """Передаёт замеры из дочернего процесса профайлеру и возвращает сам результат."""
+    if profiler is None:
+        return result
+    value, records = result
+    for record in records:
+        profiler.emit(record._replace(frame=frame))
+    return value
+
+
+def format_summary(summary):
+    """Строки итога для GUI и консоли."""
+    total = sum(item['seconds'] for item in summary.values()) or 1.0
+    lines = []
+    for name, item in summary.items():
+        line = (f"{name}: {item['count']} раз, {item['seconds'] * 1000:.1f} мс "
+                f"({item['seconds'] / total:.0%}), данные {item['size'] / (1 << 20):.2f} МБ")
+        if item['memory'] is not None:
+            line += f", память до {item['memory'] / (1 << 20):.2f} МБ"
+        lines.append(line)
+    return lines
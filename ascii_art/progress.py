@@ -0,0 +1,74 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+
+# Не чаще этого поток конвертации отправляет обновления, с
+DEFAULT_INTERVAL = 0.1
+
+# Состояние прогресса: доля, готовые и всего единиц (кадров), прошедшее время,
+# оценка оставшегося времени (None - пока неизвестно) и скорость в единицах в секунду
+ProgressSnapshot = namedtuple('ProgressSnapshot', ['fraction', 'done', 'total', 'elapsed', 'eta', 'rate'])
+
+
+class ProgressChannel:
+    """Прогресс и отмена между потоком конвертации и интерфейсом.
+
+    Поток конвертации вызывает report (его можно передавать как progress)
+    и проверяет should_stop; обновления прореживаются до одного за interval
+    и складываются в потокобезопасную очередь. Интерфейс забирает последнее
+    состояние через poll по своему таймеру, так что очередь событий Tk не
+    заполняется при любом числе кадров.
+    """
+
+    def __init__(self, total=1, interval=DEFAULT_INTERVAL, clock=time.perf_counter):
+        self.total = total
+        self.interval = interval
+        self.clock = clock
+        self.start_time = clock()
+        self._queue = queue.SimpleQueue()
+        self._cancel = threading.Event()
+        self._last_put = None
+
+    def report(self, fraction):
+        now = self.clock()
+        if fraction < 1.0 and self._last_put is not None and now - self._last_put < self.interval:
+            return
+        self._last_put = now
+        self._queue.put(self._snapshot(min(max(fraction, 0.0), 1.0), now))
+
+    def _snapshot(self, fraction, now):
+        elapsed = now - self.start_time
+        done = fraction * self.total
+        eta = elapsed * (1.0 - fraction) / fraction if fraction > 0 else None
+        rate = done / elapsed if elapsed > 0 else 0.0
+        return ProgressSnapshot(fraction, done, self.total, elapsed, eta, rate)
+
+    def poll(self):
+        """Последнее состояние из очереди (промежуточные отбрасываются) или None."""
+        snapshot = None
+        while True:
+            try:
+                snapshot = self._queue.get_nowait()
+            except queue.Empty:
+                return snapshot
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def should_stop(self):
+        return self._cancel.is_set()
+
+
+def format_progress(snapshot, unit="кадр"):
+    """Строка для статус-бара: процент, скорость и оставшееся время."""
+    text = f"{snapshot.fraction:.0%}"
+    if snapshot.total > 1 and snapshot.rate > 0:
+        text += f" | {snapshot.rate:.1f} {unit}/с"
+    if snapshot.eta is not None and snapshot.fraction < 1.0:
+        text += f" | осталось ~{snapshot.eta:.0f} с"
+    return text
@@ -0,0 +1,157 @@
+import os
+import time
+from collections import namedtuple
+
+import cv2
+import imageio.v2 as imageio_v2
+import imageio.v3 as iio
+import numpy as np
+from PIL import GifImagePlugin, Image
+
+from .core import DIRECTION_CHARS
+from .glyphs import DEFAULT_FONT_SIZE, cached_atlas
+from .profiling import stage
+
+# Частота кадров MP4: длительности кадров GIF передаются повтором кадров
+VIDEO_FPS = 25
+RASTER_EXTENSIONS = ('.png', '.gif', '.mp4')
+
+# Итог растрового экспорта: размер файла, время, число кадров и размер картинки (ширина, высота)
+RasterStats = namedtuple('RasterStats', ['filename', 'bytes', 'seconds', 'frames', 'size'])
+
+
+def atlas_for(palette, direction_chars=DIRECTION_CHARS, font_size=DEFAULT_FONT_SIZE, font_path=None):
+    """Общий атлас для палитры и символов направлений (строится один раз на набор)."""
+    chars = ''.join(sorted(set(palette) | set(''.join(direction_chars.values()))))
+    return cached_atlas(chars, font_size, font_path)
+
+
+def iter_rendered(frames, atlas):
+    """Картинки кадров AsciiFrame; повтор предыдущего кадра не рисуется заново (отдаётся тот же массив)."""
+    last = last_image = None
+    for frame in frames:
+        if last is None or frame.text is not last.text or frame.colors is not last.colors:
+            with stage('raster') as st:
+                last_image = st.output(atlas.render(frame.text, frame.colors))
+        last = frame
+        yield last_image
+
+
+def _even(image):
+    """Видеокодекам нужны чётные размеры - дополняем фоном."""
+    height, width = image.shape[:2]
+    if height % 2 == 0 and width % 2 == 0:
+        return image
+    return np.pad(image, ((0, height % 2), (0, width % 2), (0, 0)))
+
+
+def _video_frames(frames, images, fps):
+    """Кадры с постоянной частотой fps: каждый повторяется на свою длительность без накопления ошибки."""
+    elapsed = shown = 0
+    for frame, image in zip(frames, images):
+        elapsed += frame.duration
+        repeats = round(elapsed * fps / 1000) - shown
+        shown += repeats
+        for _ in range(repeats):
+            yield image
+
+
+def _write_video(filename, frames, images, fps):
+    images = (_even(image) for image in _video_frames(frames, images, fps))
+    try:
+        writer = imageio_v2.get_writer(filename, fps=fps, macro_block_size=1)
+    except (ImportError, ValueError, RuntimeError):
+        writer = None
+    if writer is not None:
+        with writer:
+            for image in images:
+                writer.append_data(image)
+        return
+    # Без плагина ffmpeg для imageio пишем через OpenCV
+    video = None
+    try:
+        for image in images:
+            if video is None:
+                height, width = image.shape[:2]
+                video = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+                if not video.isOpened():
+                    raise ValueError("Не удалось открыть MP4 для записи")
+            video.write(cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+    finally:
+        if video is not None:
+            video.release()
+
+
+def _write_gif_frame(f, image, previous, duration):
+    offset = (0, 0)
+    if previous is not None:
+        # Поверх предыдущего кадра (disposal 1) пишется только прямоугольник изменений
+        changed = np.any(image != previous, axis=2)
+        rows = np.flatnonzero(changed.any(axis=1))
+        cols = np.flatnonzero(changed.any(axis=0))
+        if rows.size:
+            image = image[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+            offset = (int(cols[0]), int(rows[0]))
+        else:
+            image = image[:1, :1]
+    frame = Image.fromarray(image).convert('P', palette=Image.Palette.ADAPTIVE)
+    if previous is None:
+        header, _ = GifImagePlugin.getheader(frame, info={'loop': 0})
+        f.write(b''.join(header))
+    f.write(b''.join(GifImagePlugin.getdata(frame, offset, duration=int(duration), disposal=1,
+                                            include_color_table=previous is not None)))
+
+
+def _write_gif(filename, frames, images):
+    """GIF, записываемый по кадру: в памяти только текущая и предыдущая картинки.
+
+    Pillow (и плагин pillow imageio) копит все кадры до закрытия файла, поэтому
+    кадры кодируются здесь по одному через GifImagePlugin.getheader/getdata, у
+    каждого кадра своя палитра. Повтор кадра не пишется - его длительность
+    прибавляется к предыдущему.
+    """
+    with open(filename, 'wb') as f:
+        previous = pending = None
+        duration = 0
+        for frame, image in zip(frames, images):
+            if image is pending:
+                duration += frame.duration
+                continue
+            if pending is not None:
+                _write_gif_frame(f, pending, previous, duration)
+                previous = pending
+            pending, duration = image, frame.duration
+        _write_gif_frame(f, pending, previous, duration)
+        f.write(b';')
+
+
+def write_raster(filename, frames, palette, direction_chars=DIRECTION_CHARS, font_size=DEFAULT_FONT_SIZE,
+                 font_path=None, fps=VIDEO_FPS):
+    """Сохраняет кадры AsciiFrame картинкой: PNG (первый кадр), GIF или MP4; возвращает RasterStats.
+
+    Кадры рисуются и записываются по одному, целиком в памяти не собираются.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in RASTER_EXTENSIONS:
+        raise ValueError(f"Поддерживаются {', '.join(RASTER_EXTENSIONS)}")
+    start = time.perf_counter()
+    atlas = atlas_for(palette, direction_chars, font_size, font_path)
+    first = atlas.render(frames[0].text, frames[0].colors)
+    with stage('write_raster') as st:
+        if ext == '.png':
+            iio.imwrite(filename, first)
+        elif ext == '.gif':
+            _write_gif(filename, frames, iter_rendered(frames, atlas))
+        else:
+            _write_video(filename, frames, iter_rendered(frames, atlas), fps)
+        st.size = os.path.getsize(filename)
+    count = 1 if ext == '.png' else len(frames)
+    return RasterStats(filename, os.path.getsize(filename), time.perf_counter() - start, count,
+                       (first.shape[1], first.shape[0]))
+
+
+def format_raster_stats(stats):
+    """Краткая сводка растрового экспорта для статус-бара и консоли."""
+    width, height = stats.size
+    return (f"{stats.bytes / (1 << 20):.2f} МБ за {stats.seconds:.2f} с, кадров {stats.frames}, "
+            f"{width}x{height}")
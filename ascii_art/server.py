@@ -0,0 +1,530 @@
+"""Локальный HTTP-сервис конвертации: загрузка файла -> ASCII-арт без запуска окна.
+
+    python -m ascii_art.server --port 8765 -j 4
+    curl --data-binary @photo.jpg "http://127.0.0.1:8765/convert?width=100"
+    curl --data-binary @anim.gif "http://127.0.0.1:8765/convert?name=anim.gif&format=ndjson&html=1"
+    curl http://127.0.0.1:8765/metrics
+
+Параметры конвертации передаются в строке запроса под именами флагов CLI
+(width, palette, gamma, no-edges, threshold, shape, start, fps, html...).
+format: txt (по умолчанию; кадры анимации разделяются строкой с \\f), html
+(только изображения) или ndjson (JSON на кадр: текст, длительность и, с html=1,
+цвета RGB в base64). Кадры анимации отправляются по мере готовности.
+
+Приём запросов асинхронный; задания стоят в ограниченной очереди - если она
+полна, сервер сразу отвечает 503 с Retry-After, не читая загрузку. Кадры
+считаются в общем пуле процессов, прогретом при запуске.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+
+from .cli import add_conversion_arguments, params_from_args
+from .core import AsciiFrame, ConversionParams, convert_frame, convert_image, is_animation, iter_convert_gif
+from .export import render_html
+from .parallel import STOP_POLL_INTERVAL, _init_worker, _wait, create_pool, default_workers
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# Сколько заданий может ждать в очереди сверх выполняемых
+QUEUE_SIZE = 16
+# Предел размера загрузки, байт
+MAX_UPLOAD_BYTES = 256 << 20
+# Сколько готовых кадров анимации может ждать отправки клиенту
+STREAM_WINDOW = 8
+# По скольким последним заданиям считаются квантили задержки
+LATENCY_WINDOW = 1000
+LATENCY_QUANTILES = (0.5, 0.9, 0.99)
+FORMATS = ('txt', 'html', 'ndjson')
+# Разделитель кадров анимации в ответе txt
+FRAME_SEPARATOR = '\f\n'
+
+# Расширение загрузки по Content-Type, если имя не передано
+CONTENT_TYPES = {'image/gif': '.gif', 'image/jpeg': '.jpg', 'image/png': '.png', 'image/bmp': '.bmp',
+                 'video/mp4': '.mp4', 'video/webm': '.webm', 'video/quicktime': '.mov'}
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 411: 'Length Required',
+           413: 'Payload Too Large', 422: 'Unprocessable Entity', 500: 'Internal Server Error', 501: 'Not Implemented',
+           503: 'Service Unavailable'}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class _QueryParser(argparse.ArgumentParser):
+    """Парсер флагов CLI, который сообщает об ошибке исключением, а не выходом.
+
+    flags - добавленные флаги: длинное имя -> действие argparse.
+    """
+
+    def __init__(self, **kwargs):
+        self.flags = {}
+        super().__init__(**kwargs)
+
+    def add_argument(self, *args, **kwargs):
+        action = super().add_argument(*args, **kwargs)
+        if action.option_strings:
+            self.flags[action.option_strings[-1]] = action
+        return action
+
+    def error(self, message):
+        raise HttpError(400, message)
+
+
+def _warm_worker():
+    """Инициализация процесса пула: один пробный кадр загружает модули и общие таблицы."""
+    _init_worker()
+    convert_frame(np.zeros((32, 32, 3), np.uint8), ConversionParams(width=16))
+
+
+def _ping():
+    return os.getpid()
+
+
+class ServerMetrics:
+    """Счётчики сервера и задержки последних заданий в формате Prometheus."""
+
+    def __init__(self):
+        self.requests = {}
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.active = 0
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.latency_sum = 0.0
+        self.wait = deque(maxlen=LATENCY_WINDOW)
+        self.latency = deque(maxlen=LATENCY_WINDOW)
+
+    def request(self, status):
+        self.requests[status] = self.requests.get(status, 0) + 1
+
+    def finished(self, job, ok):
+        if ok:
+            self.completed += 1
+        else:
+            self.failed += 1
+        total = time.perf_counter() - job.created
+        self.latency.append(total)
+        self.latency_sum += total
+
+    @staticmethod
+    def _quantiles(name, values):
+        if not values:
+            return []
+        points = np.quantile(np.fromiter(values, float), LATENCY_QUANTILES)
+        return [f'{name}{{quantile="{q}"}} {value:.6f}' for q, value in zip(LATENCY_QUANTILES, points)]
+
+    def render(self, queue_depth, queue_size, workers):
+        lines = [
+            '# TYPE ascii_queue_depth gauge', f'ascii_queue_depth {queue_depth}',
+            '# TYPE ascii_queue_capacity gauge', f'ascii_queue_capacity {queue_size}',
+            '# TYPE ascii_jobs_active gauge', f'ascii_jobs_active {self.active}',
+            '# TYPE ascii_workers gauge', f'ascii_workers {workers}',
+            '# TYPE ascii_jobs_total counter',
+            f'ascii_jobs_total{{result="completed"}} {self.completed}',
+            f'ascii_jobs_total{{result="failed"}} {self.failed}',
+            f'ascii_jobs_total{{result="rejected"}} {self.rejected}',
+            '# TYPE ascii_requests_total counter',
+        ]
+        lines += [f'ascii_requests_total{{status="{status}"}} {count}'
+                  for status, count in sorted(self.requests.items())]
+        lines += ['# TYPE ascii_frames_sent_total counter', f'ascii_frames_sent_total {self.frames_sent}',
+                  '# TYPE ascii_bytes_sent_total counter', f'ascii_bytes_sent_total {self.bytes_sent}',
+                  '# TYPE ascii_queue_wait_seconds summary']
+        lines += self._quantiles('ascii_queue_wait_seconds', self.wait)
+        lines += ['# TYPE ascii_job_latency_seconds summary']
+        lines += self._quantiles('ascii_job_latency_seconds', self.latency)
+        lines += [f'ascii_job_latency_seconds_sum {self.latency_sum:.6f}',
+                  f'ascii_job_latency_seconds_count {self.completed + self.failed}']
+        return '\n'.join(lines) + '\n'
+
+
+class Job:
+    """Задание конвертации: загруженный файл, параметры и очередь готовых частей ответа.
+
+    В очередь output попадают байты частей ответа, затем None (конец) или исключение.
+    """
+
+    def __init__(self, path, params, fmt, html_colors, loop):
+        self.path = path
+        self.params = params
+        self.format = fmt
+        self.html_colors = html_colors
+        self.animation = is_animation(path)
+        self.output = asyncio.Queue(STREAM_WINDOW)
+        self.stopped = threading.Event()
+        self.loop = loop
+        self.created = time.perf_counter()
+
+    def put(self, item):
+        """Кладёт часть ответа из потока конвертации; ждёт, пока клиент её заберёт. False - клиент ушёл."""
+        future = asyncio.run_coroutine_threadsafe(self.output.put(item), self.loop)
+        while True:
+            try:
+                future.result(STOP_POLL_INTERVAL)
+                return True
+            except FutureTimeout:
+                if self.stopped.is_set():
+                    future.cancel()
+                    return False
+
+
+def _frame_record(index, frame, with_colors):
+    record = {'index': index, 'duration': frame.duration, 'text': frame.text}
+    if with_colors and frame.colors is not None:
+        height, width = frame.colors.shape[:2]
+        record['colors'] = {'width': width, 'height': height,
+                            'rgb': base64.b64encode(frame.colors.tobytes()).decode('ascii')}
+    return json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def encode_frame(job, index, frame):
+    """Часть ответа для одного кадра в формате задания."""
+    if job.format == 'ndjson':
+        return _frame_record(index, frame, job.params.export_html).encode('utf-8')
+    if job.format == 'html':
+        return render_html(frame.text, frame.colors, job.html_colors).encode('utf-8')
+    if job.animation:
+        return (frame.text + FRAME_SEPARATOR).encode('utf-8')
+    return frame.text.encode('utf-8')
+
+
+def _upload_suffix(name, content_type, body):
+    ext = os.path.splitext(name or '')[1].lower()
+    if ext:
+        return ext
+    ext = CONTENT_TYPES.get((content_type or '').split(';')[0].strip().lower())
+    if ext:
+        return ext
+    return '.gif' if body[:4] == b'GIF8' else '.png'
+
+
+def parse_query(query):
+    """(ConversionParams, формат, уровни цвета HTML, имя файла) из строки запроса."""
+    parser = _QueryParser(add_help=False)
+    add_conversion_arguments(parser)
+    parser.set_defaults(stdout=False, terminal=False, raster=None)
+    argv = []
+    fmt, name = 'txt', None
+    for key, value in parse_qsl(query, keep_blank_values=True):
+        if key == 'format':
+            fmt = value
+            continue
+        if key == 'name':
+            name = value
+            continue
+        action = parser.flags.get('--' + key)
+        if action is None:
+            raise HttpError(400, f"Неизвестный параметр: {key}")
+        if action.nargs == 0:
+            if value.lower() not in ('0', 'false', 'no'):
+                argv.append('--' + key)
+        else:
+            argv += ['--' + key, value]
+    if fmt not in FORMATS:
+        raise HttpError(400, f"format: {', '.join(FORMATS)}")
+    args = parser.parse_args(argv)
+    args.html = args.html or fmt == 'html'
+    return params_from_args(args), fmt, args.html_colors, name
+
+
+class ConversionServer:
+    """asyncio-сервер: приём загрузок, ограниченная очередь заданий и общий прогретый пул процессов."""
+
+    def __init__(self, workers=None, queue_size=QUEUE_SIZE, max_upload=MAX_UPLOAD_BYTES, upload_dir=None):
+        self.workers = workers or default_workers()
+        self.queue_size = queue_size
+        self.max_upload = max_upload
+        self.upload_dir = upload_dir
+        self.metrics = ServerMetrics()
+        self.pool = None
+        self.threads = None
+        self.jobs = None
+        self._server = None
+        self._dispatchers = []
+
+    @property
+    def port(self):
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        loop = asyncio.get_running_loop()
+        self.pool = create_pool(self.workers, _warm_worker)
+        # Все процессы запускаются и прогреваются сразу, а не на первом запросе
+        await asyncio.gather(*(loop.run_in_executor(self.pool, _ping) for _ in range(self.workers)))
+        self.threads = ThreadPoolExecutor(self.workers, thread_name_prefix='ascii-job')
+        self.jobs = asyncio.Queue(self.queue_size)
+        self._dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for task in self._dispatchers:
+            task.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        if self.threads is not None:
+            self.threads.shutdown(wait=False, cancel_futures=True)
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    # Выполнение заданий
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.jobs.get()
+            self.metrics.wait.append(time.perf_counter() - job.created)
+            try:
+                # Клиент ушёл, пока задание ждало в очереди
+                if job.stopped.is_set():
+                    continue
+                self.metrics.active += 1
+                try:
+                    await loop.run_in_executor(self.threads, self._run, job)
+                except Exception as e:
+                    self.metrics.finished(job, False)
+                    await self._put(job, e)
+                else:
+                    self.metrics.finished(job, True)
+                    await self._put(job, None)
+                finally:
+                    self.metrics.active -= 1
+            finally:
+                try:
+                    os.remove(job.path)
+                except OSError:
+                    pass
+                self.jobs.task_done()
+
+    async def _put(self, job, item):
+        # Клиент, который уже ушёл, очередь не разбирает
+        if not job.stopped.is_set():
+            await job.output.put(item)
+
+    def _run(self, job):
+        """Конвертация в потоке: кадры считаются в пуле, части ответа по одной уходят клиенту."""
+        if not job.animation:
+            future = self.pool.submit(convert_image, job.path, job.params)
+            if not _wait(future, job.stopped.is_set):
+                # Клиент ушёл: ещё не начатое задание снимается с пула, начатое досчитается впустую
+                future.cancel()
+                return
+            job.put(encode_frame(job, 0, AsciiFrame(*future.result())))
+            return
+        frames = iter_convert_gif(job.path, job.params, should_stop=job.stopped.is_set, workers=self.workers,
+                                  pool=self.pool)
+        count = 0
+        for index, frame in enumerate(frames):
+            if not job.put(encode_frame(job, index, frame)):
+                frames.close()
+                return
+            count += 1
+        if count == 0 and not job.stopped.is_set():
+            raise ValueError("Анимация не содержит кадров")
+
+    # HTTP
+
+    async def _handle(self, reader, writer):
+        try:
+            status = await self._respond(reader, writer)
+        except HttpError as e:
+            status = e.status
+            await self._send_error(writer, e)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # Клиент закрыл соединение раньше времени
+            status = 499
+        except Exception as e:
+            status = 500
+            await self._send_error(writer, HttpError(500, str(e) or type(e).__name__))
+        self.metrics.request(status)
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    async def _send_error(self, writer, error):
+        body = (str(error) + '\n').encode('utf-8')
+        try:
+            await self._send_head(writer, error.status, 'text/plain; charset=utf-8',
+                                  {'Content-Length': len(body), **error.headers})
+            writer.write(body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def _send_head(self, writer, status, content_type, headers):
+        lines = [f'HTTP/1.1 {status} {REASONS.get(status, "")}', f'Content-Type: {content_type}',
+                 'Connection: close'] + [f'{key}: {value}' for key, value in headers.items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        await writer.drain()
+
+    async def _respond(self, reader, writer):
+        request_line = (await reader.readline()).decode('latin-1').split()
+        if len(request_line) != 3:
+            raise HttpError(400, "Неверная строка запроса")
+        method, target, _ = request_line
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            key, value = key.strip().lower(), value.strip()
+            if key == 'content-length' and headers.get(key, value) != value:
+                raise HttpError(400, "Несколько разных Content-Length")
+            headers[key] = value
+        url = urlsplit(target)
+
+        if url.path in ('/metrics', '/health'):
+            if method != 'GET':
+                raise HttpError(405, "Только GET")
+            if url.path == '/health':
+                body = b'ok\n'
+            else:
+                body = self.metrics.render(self.jobs.qsize(), self.queue_size, self.workers).encode('utf-8')
+            await self._send_head(writer, 200, 'text/plain; charset=utf-8', {'Content-Length': len(body)})
+            writer.write(body)
+            await writer.drain()
+            return 200
+        if url.path != '/convert':
+            raise HttpError(404, "Есть /convert, /metrics и /health")
+        if method != 'POST':
+            raise HttpError(405, "Только POST")
+        return await self._convert(reader, writer, url.query, headers)
+
+    async def _convert(self, reader, writer, query, headers):
+        params, fmt, html_colors, name = parse_query(query)
+        # Очередь полна - отказываем сразу, не принимая загрузку
+        if self.jobs.full():
+            self.metrics.rejected += 1
+            raise HttpError(503, "Очередь заданий заполнена", {'Retry-After': 1})
+        if 'transfer-encoding' in headers:
+            raise HttpError(501, "Transfer-Encoding не поддерживается, нужен Content-Length")
+        if 'content-length' not in headers:
+            raise HttpError(411, "Нужен Content-Length")
+        length = headers['content-length']
+        # int() принял бы и '+5', и ' 5', и '5_000' - допускаем только цифры
+        if not (length.isascii() and length.isdigit()):
+            raise HttpError(400, "Неверный Content-Length")
+        length = int(length)
+        if length > self.max_upload:
+            raise HttpError(413, f"Загрузка больше {self.max_upload} байт")
+        body = await reader.readexactly(length)
+        if not body:
+            raise HttpError(400, "Пустая загрузка")
+
+        suffix = _upload_suffix(name, headers.get('content-type'), body)
+        fd, path = tempfile.mkstemp(suffix=suffix, prefix='ascii_upload_', dir=self.upload_dir)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(body)
+        job = Job(path, params, fmt, html_colors, asyncio.get_running_loop())
+        if fmt == 'html' and job.animation:
+            os.remove(path)
+            raise HttpError(400, "Для анимации используйте format=txt или ndjson")
+        try:
+            self.jobs.put_nowait(job)
+        except asyncio.QueueFull:
+            os.remove(path)
+            self.metrics.rejected += 1
+            raise HttpError(503, "Очередь заданий заполнена", {'Retry-After': 1})
+        try:
+            return await self._stream(writer, job)
+        finally:
+            job.stopped.set()
+            # Освобождаем место в очереди частей, если конвертация ждёт ушедшего клиента
+            while not job.output.empty():
+                job.output.get_nowait()
+
+    async def _stream(self, writer, job):
+        item = await job.output.get()
+        if isinstance(item, BaseException):
+            raise item if isinstance(item, HttpError) else HttpError(422, str(item) or type(item).__name__)
+        content_type = {'txt': 'text/plain', 'html': 'text/html', 'ndjson': 'application/x-ndjson'}[job.format]
+        content_type += '; charset=utf-8'
+        if not job.animation:
+            await self._send_head(writer, 200, content_type, {'Content-Length': len(item)})
+            writer.write(item)
+            await writer.drain()
+            self.metrics.frames_sent += 1
+            self.metrics.bytes_sent += len(item)
+            return 200
+        await self._send_head(writer, 200, content_type, {'Transfer-Encoding': 'chunked'})
+        while item is not None:
+            if isinstance(item, BaseException):
+                # Заголовок уже отправлен - обрываем поток без завершающего блока
+                return 500
+            writer.write(f'{len(item):x}\r\n'.encode('latin-1') + item + b'\r\n')
+            await writer.drain()
+            self.metrics.frames_sent += 1
+            self.metrics.bytes_sent += len(item)
+            item = await job.output.get()
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+        return 200
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None, queue_size=QUEUE_SIZE,
+                max_upload=MAX_UPLOAD_BYTES, log=None):
+    server = await ConversionServer(workers, queue_size, max_upload).start(host, port)
+    if log is not None:
+        log(f"Сервер: http://{host}:{server.port} (процессов {server.workers}, очередь {queue_size})")
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='ascii_art.server',
+                                     description="Локальный HTTP-сервис конвертации в ASCII-арт.")
+    parser.add_argument('--host', default=DEFAULT_HOST,
+                        help="Адрес (по умолчанию - только локальные подключения)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help="Порт (0 - любой свободный)")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="Процессов в пуле и одновременных заданий (по умолчанию - по числу ядер)")
+    parser.add_argument('--queue', type=int, default=QUEUE_SIZE,
+                        help="Заданий в очереди, сверх которых сервер отвечает 503")
+    parser.add_argument('--max-upload', type=int, default=MAX_UPLOAD_BYTES,
+                        help="Предел размера загрузки, байт")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    def log(message):
+        print(message, file=sys.stderr)
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.jobs, args.queue, args.max_upload, log))
+    except KeyboardInterrupt:
+        log("Остановлено")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+from .glyphs import cached_atlas
+
+# Сколько отсчётов яркости (строк, столбцов) берётся на клетку при подборе по форме
+SHAPE_BLOCK = (6, 3)
+# Шрифт для признаков глифов: крупный, чтобы уменьшение до SHAPE_BLOCK было точным
+SHAPE_FONT_SIZE = 24
+# Вес совпадения формы относительно совпадения средней яркости
+SHAPE_WEIGHT = 1.0
+
+
+class ShapeIndex:
+    """Признаки глифов таблицы для подбора символа по форме клетки.
+
+    Каждый глиф уменьшается до SHAPE_BLOCK отсчётов. Расстояние от клетки до
+    глифа складывается из разницы средней яркости и разницы формы - отсчётов
+    за вычетом среднего, с весом SHAPE_WEIGHT. Яркость символа палитры задаёт
+    его место в ней, i / (n - 1), как в обычном режиме; у символов направлений
+    - плотность глифа. Если палитра идёт от плотных символов к редким, яркой
+    клетке соответствует меньше краски, и форма глифов берётся инвертированной.
+    Для всех клеток кадра расстояние считается одним матричным произведением:
+    слагаемые, зависящие только от клетки, на выбор глифа не влияют.
+    """
+
+    def __init__(self, table, palette_len=None, font_size=SHAPE_FONT_SIZE, font_path=None):
+        atlas = cached_atlas(''.join(sorted(set(table))), font_size, font_path)
+        lookup = {char: index for index, char in enumerate(atlas.chars)}
+        rows, columns = SHAPE_BLOCK
+        features = np.stack([
+            cv2.resize(atlas.masks[lookup[char]], (columns, rows), interpolation=cv2.INTER_AREA)
+            for char in table
+        ]).reshape(len(table), rows * columns).astype(np.float32) / 255
+        palette_len = len(table) if palette_len is None else palette_len
+        means = features.mean(axis=1)
+        centered = features - means[:, None]
+        density = means / means.max() if means.max() > 0 else means
+        self.inverted = palette_len > 1 and means[0] > means[palette_len - 1]
+        if self.inverted:
+            centered = -centered
+            density = 1 - density
+        self.brightness = density.astype(np.float32)
+        self.brightness[:palette_len] = np.arange(palette_len) / max(palette_len - 1, 1)
+        self.samples = rows * columns
+        self._centered = np.ascontiguousarray(centered.T)
+        self._energy = (centered ** 2).sum(axis=1)
+
+    def scores(self, blocks):
+        """Расстояния от блоков (клеток, отсчётов) с яркостью 0..1 до всех глифов: (клеток, глифов)."""
+        mean = blocks.mean(axis=1, keepdims=True)
+        shape = self._energy - 2 * (blocks @ self._centered)
+        return SHAPE_WEIGHT * shape + self.samples * (mean - self.brightness) ** 2
+
+
+@lru_cache(maxsize=16)
+def shape_index(table, palette_len=None, font_size=SHAPE_FONT_SIZE, font_path=None):
+    """Общий ShapeIndex для таблицы глифов и шрифта (строится один раз)."""
+    return ShapeIndex(table, palette_len, font_size, font_path)
+
+
+def shape_indices(detail, magnitude, table, palette_len, grad_thresh):
+    """Индексы глифов table по форме клеток detail (строк, столбцов, отсчётов uint8).
+
+    Символы палитры доступны всем клеткам, символы направлений - только клеткам
+    с градиентом выше порога (как в обычном режиме); magnitude=None - без них.
+    """
+    rows, columns, samples = detail.shape
+    blocks = detail.reshape(-1, samples).astype(np.float32) / 255
+    scores = shape_index(table, palette_len).scores(blocks)
+    if magnitude is None:
+        scores = scores[:, :palette_len]
+    else:
+        scores[magnitude.reshape(-1) <= grad_thresh, palette_len:] = np.inf
+    return scores.argmin(axis=1).reshape(rows, columns)
@@ -0,0 +1,167 @@
+import hashlib
+import os
+import re
+
+import cv2
+
+from .profiling import stage
+from .timing import FrameTiming
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm', '.m4v')
+SEQUENCE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+# Частота кадров последовательности картинок (своей у неё нет)
+SEQUENCE_FPS = 25.0
+# Частота, если видео её не сообщает
+DEFAULT_VIDEO_FPS = 25.0
+
+_NUMBERED = re.compile(r'^(.*?)(\d+)(\.[^.]+)$')
+_PRINTF_NUMBER = re.compile(r'%0?\d*d')
+
+
+def is_video(path):
+    return path.lower().endswith(VIDEO_EXTENSIONS)
+
+
+def is_sequence(path):
+    """Папка с пронумерованными кадрами или шаблон вида 'frames/img_%04d.png'."""
+    return os.path.isdir(path) or bool(_PRINTF_NUMBER.search(os.path.basename(path)))
+
+
+def _numbered_files(folder, prefix=None, ext=None):
+    """Пронумерованные картинки папки: [(номер, путь)] по возрастанию номера."""
+    groups = {}
+    for name in os.listdir(folder):
+        match = _NUMBERED.match(name)
+        if not match or not match.group(3).lower().endswith(SEQUENCE_EXTENSIONS):
+            continue
+        key = (match.group(1), match.group(3).lower())
+        if prefix is not None and key != (prefix, ext.lower()):
+            continue
+        groups.setdefault(key, []).append((int(match.group(2)), os.path.join(folder, name)))
+    if not groups:
+        return []
+    # В папке без шаблона берём самую длинную серию
+    return sorted(max(groups.values(), key=len))
+
+
+def sequence_files(path):
+    """Пути кадров последовательности по порядку номеров."""
+    if os.path.isdir(path):
+        files = _numbered_files(path)
+    else:
+        folder, name = os.path.split(path)
+        prefix, ext = _PRINTF_NUMBER.split(name, maxsplit=1)
+        files = _numbered_files(folder or '.', prefix, ext)
+    if not files:
+        raise ValueError("Не найдено пронумерованных кадров")
+    return [file for _, file in files]
+
+
+def sequence_pattern_for(path, min_frames=2):
+    """Шаблон последовательности, к которой принадлежит картинка ('img_0001.png' -> 'img_%d.png'), или None."""
+    folder, name = os.path.split(path)
+    match = _NUMBERED.match(name)
+    if not match or not name.lower().endswith(SEQUENCE_EXTENSIONS):
+        return None
+    if len(_numbered_files(folder or '.', match.group(1), match.group(3))) < min_frames:
+        return None
+    return os.path.join(folder, f"{match.group(1)}%d{match.group(3)}")
+
+
+def sequence_digest(path):
+    """Хэш последовательности по именам, размерам и времени изменения файлов."""
+    digest = hashlib.blake2b(digest_size=20)
+    for file in sequence_files(path):
+        stat = os.stat(file)
+        digest.update(f"{os.path.basename(file)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def source_name(path):
+    """Имя источника для выходных файлов: без расширения и шаблона номера."""
+    name = os.path.basename(os.path.normpath(path))
+    name = _PRINTF_NUMBER.sub('', os.path.splitext(name)[0]).strip('_-. ')
+    return name or 'frames'
+
+
+class FrameSelector:
+    """Выбор кадров по времени: диапазон [start, end) в секундах и прореживание до fps.
+
+    end=0 - до конца, fps=0 - без прореживания. Длительность выбранного кадра
+    (duration, мс) - интервал между выбранными кадрами.
+    """
+
+    def __init__(self, source_fps, start=0.0, end=0.0, fps=0.0):
+        self.interval = 1000.0 / (source_fps or DEFAULT_VIDEO_FPS)
+        self.step = max(self.interval, 1000.0 / fps) if fps else self.interval
+        self.start_ms = max(start, 0.0) * 1000.0
+        self.end_ms = end * 1000.0 if end else None
+        self.first = int(self.start_ms / self.interval + 0.5)
+        self._next_ms = self.first * self.interval
+
+    @property
+    def duration(self):
+        return int(round(self.step))
+
+    def stopped(self, index):
+        return self.end_ms is not None and index * self.interval >= self.end_ms
+
+    def take(self, index):
+        """True, если кадр index нужно выдать (вызывать по порядку номеров)."""
+        time_ms = index * self.interval
+        # Половина исходного интервала - запас на погрешность дробных частот
+        if time_ms + self.interval / 2 < self._next_ms:
+            return False
+        while self._next_ms <= time_ms + self.interval / 2:
+            self._next_ms += self.step
+        return True
+
+    def count(self, total):
+        """Сколько кадров будет выбрано из total исходных."""
+        probe = FrameSelector(1000.0 / self.interval)
+        probe.__dict__.update(self.__dict__)
+        selected = 0
+        for index in range(self.first, total):
+            if probe.stopped(index):
+                break
+            selected += probe.take(index)
+        return selected
+
+
+def iter_video_frames(path, timings=None, start=0.0, end=0.0, fps=0.0):
+    """Кадры видео в BGR по одному; пропущенные прореживанием кадры не декодируются."""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError("Не удалось открыть видео")
+    try:
+        selector = FrameSelector(capture.get(cv2.CAP_PROP_FPS), start, end, fps)
+        index = selector.first
+        if index:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+        while not selector.stopped(index):
+            if not selector.take(index):
+                if not capture.grab():
+                    break
+            else:
+                with stage('decode', index) as st:
+                    ok, frame = capture.read()
+                    st.output(frame)
+                if not ok:
+                    break
+                if timings is not None:
+                    timings.append(FrameTiming(selector.duration))
+                yield frame
+            index += 1
+    finally:
+        capture.release()
+
+
+def video_frame_count(path, start=0.0, end=0.0, fps=0.0):
+    """Сколько кадров видео будет выбрано (по данным контейнера, может быть неточным)."""
+    capture = cv2.VideoCapture(path)
+    try:
+        total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        source_fps = capture.get(cv2.CAP_PROP_FPS)
+    finally:
+        capture.release()
+    return max(FrameSelector(source_fps, start, end, fps).count(total), 1)
@@ -0,0 +1,147 @@
+import shutil
+import sys
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .export import _fill_blank_colors, pack_colors, quantize_colors
+from .playback import LINES_CACHE_SIZE, split_lines
+from .timing import FrameScheduler
+
+RESET = '\x1b[0m'
+CLEAR_SCREEN = '\x1b[H\x1b[2J'
+CLEAR_LINE_END = '\x1b[K'
+HIDE_CURSOR = '\x1b[?25l'
+SHOW_CURSOR = '\x1b[?25h'
+
+
+def move_to(row):
+    """Курсор в начало строки row (с нуля)."""
+    return f'\x1b[{row + 1};1H'
+
+
+def ansi_lines(ascii_str, color_data=None, quantize=0, columns=None, rows=None):
+    """Строки кадра с цветом ANSI 24 бита; код цвета выводится только при его смене.
+
+    Каждая строка начинается со своего цвета, поэтому её можно перерисовать
+    отдельно. columns и rows обрезают кадр под размер терминала.
+    """
+    lines = split_lines(ascii_str)[:rows]
+    if columns:
+        lines = [line[:columns] for line in lines]
+    if color_data is None:
+        return lines
+    packed = pack_colors(quantize_colors(color_data, quantize))
+    out = []
+    for y, line in enumerate(lines):
+        if y >= packed.shape[0] or not line:
+            out.append(line)
+            continue
+        width = min(len(line), packed.shape[1])
+        row = _fill_blank_colors(packed[y, :width], line[:width])
+        starts = np.flatnonzero(np.r_[True, row[1:] != row[:-1]]).tolist()
+        ends = starts[1:] + [width]
+        parts = [f'\x1b[38;2;{value >> 16};{(value >> 8) & 255};{value & 255}m{line[s:e]}'
+                 for value, s, e in zip(row[starts].tolist(), starts, ends)]
+        parts.append(line[width:])
+        out.append(''.join(parts))
+    return out
+
+
+def render_ansi(ascii_str, color_data=None, quantize=0):
+    """Кадр целиком для вывода в терминал (цвет сбрасывается в конце)."""
+    text = '\n'.join(ansi_lines(ascii_str, color_data, quantize)) + '\n'
+    return text + RESET if color_data is not None else text
+
+
+class TerminalPlayer:
+    """Воспроизведение кадров AsciiFrame в терминале на месте.
+
+    Первый кадр рисуется после очистки экрана, дальше курсор переводится только
+    на изменившиеся строки, и они перерисовываются целиком; кадр уходит в
+    терминал одной записью, что важно для SSH. Кадр выбирается FrameScheduler
+    по реальному времени, fps ограничивает частоту перерисовок: отставшие
+    кадры пропускаются и считаются в dropped.
+    """
+
+    def __init__(self, frames, out=None, fps=0, quantize=0, fit=True, clock=time.perf_counter,
+                 sleep=time.sleep):
+        self.frames = frames
+        self.out = out or sys.stdout
+        self.min_delay = 1000.0 / fps if fps else 0.0
+        self.quantize = quantize
+        self.scheduler = FrameScheduler([frame.duration for frame in frames], clock)
+        self.clock = clock
+        self.sleep = sleep
+        self.columns = self.rows = None
+        if fit:
+            size = shutil.get_terminal_size()
+            # Последняя строка остаётся пустой, чтобы экран не прокручивался
+            self.columns, self.rows = size.columns, max(size.lines - 1, 1)
+        self.bytes_written = 0
+        self.shown = 0
+        self._lines = OrderedDict()
+        self._shown_lines = None
+
+    @property
+    def dropped(self):
+        return self.scheduler.dropped
+
+    def frame_lines(self, index):
+        """ANSI-строки кадра; повторы кадров (тот же объект текста) кодируются один раз.
+
+        Кэш (LRU на LINES_CACHE_SIZE кадров) хранит сам кадр рядом со строками:
+        пока запись жива, id его текста и цвета не достанутся другим объектам.
+        Если источник умеет frame_key (ContainerReader), ключ берётся у него -
+        повторы находятся и после того, как источник вытеснил блок из своего кэша.
+        """
+        frame = self.frames[index]
+        frame_key = getattr(self.frames, 'frame_key', None)
+        key = frame_key(index) if frame_key is not None else (id(frame.text), id(frame.colors))
+        cached = self._lines.get(key)
+        if cached is None:
+            cached = (frame, ansi_lines(frame.text, frame.colors, self.quantize, self.columns, self.rows))
+            self._lines[key] = cached
+            if len(self._lines) > LINES_CACHE_SIZE:
+                self._lines.popitem(last=False)
+        else:
+            self._lines.move_to_end(key)
+        return cached[1]
+
+    def show(self, index):
+        """Выводит кадр index, перерисовывая только строки, отличающиеся от показанного."""
+        lines = self.frame_lines(index)
+        old = self._shown_lines
+        if lines is old:
+            return
+        if old is None or len(old) != len(lines):
+            data = CLEAR_SCREEN + '\r\n'.join(lines)
+        else:
+            data = ''.join(f'{move_to(row)}{line}{CLEAR_LINE_END}'
+                           for row, (previous, line) in enumerate(zip(old, lines)) if previous != line)
+        data += RESET
+        self.out.write(data)
+        self.out.flush()
+        self.bytes_written += len(data)
+        self.shown += 1
+        self._shown_lines = lines
+
+    def play(self, loops=0):
+        """Проигрывает кадры loops раз (0 - пока не прервут Ctrl+C)."""
+        self.out.write(HIDE_CURSOR)
+        self.scheduler.restart()
+        try:
+            while True:
+                index, delay = self.scheduler.tick()
+                self.show(index)
+                played = (self.clock() - self.scheduler.start_time) * 1000.0 / self.scheduler.total
+                if len(self.frames) < 2 or (loops and played >= loops):
+                    break
+                self.sleep(max(delay, self.min_delay) / 1000.0)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            rows = len(self._shown_lines) if self._shown_lines is not None else 0
+            self.out.write(RESET + move_to(rows) + SHOW_CURSOR)
+            self.out.flush()
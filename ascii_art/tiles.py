@@ -0,0 +1,347 @@
+"""Конвертация очень больших изображений полосами.
+
+Исходник читается уменьшенным до рабочего разрешения (JPEG и несжатые форматы
+без декодирования целиком, см. open_source), CLAHE собирается из гистограмм
+всего изображения (на стыках полос швов нет). Полосы сжимаются в сетку
+усреднением INTER_AREA, а не бикубически, как обычный путь, поэтому яркость
+ячеек отличается от него в среднем на 5-7 уровней.
+"""
+import os
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from .preprocess import CLAHE_CLIP_LIMIT, CLAHE_GRID, FrameFields, compute_gradient, preprocessor_for
+from .profiling import stage
+
+# Изображения больше стольких пикселей обрабатываются полосами
+TILE_MIN_PIXELS = 50_000_000
+# Ширина рабочего разрешения - не меньше стольких пикселей на столбец ASCII
+WORK_PIXELS_PER_COLUMN = 16
+# Примерный размер полосы (пикселей рабочего разрешения) и порции чтения исходника
+STRIP_PIXELS = 4_000_000
+READ_PIXELS = 16_000_000
+# Перекрытие полос для Canny и дилатации, строк рабочего разрешения
+EDGE_OVERLAP = 8
+# Больше стольких пикселей изображение не открывается вовсе (своя защита от «бомб» распаковки)
+MAX_PIXELS = 1_000_000_000
+# Форматы, которые читаются отображением в память (если они несжатые)
+MEMMAP_EXTENSIONS = ('.npy', '.ppm', '.pgm', '.pnm', '.bmp')
+# Флаги OpenCV для чтения сразу уменьшенным (JPEG - масштабированием DCT, остальное уменьшается после распаковки)
+REDUCED_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4,
+                 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+def _open_image(path):
+    """Image.open с порогом MAX_PIXELS вместо Image.MAX_IMAGE_PIXELS.
+
+    Порог Pillow глобальный и для таких изображений слишком мал, а менять его
+    из потока конвертации небезопасно, поэтому файл открывает сам плагин
+    формата (он читает только заголовок), а размер проверяется здесь.
+    """
+    Image.init()
+    fmt = Image.registered_extensions().get(os.path.splitext(path)[1].lower())
+    if fmt not in Image.OPEN:
+        raise ValueError("Неизвестный формат изображения")
+    img = Image.OPEN[fmt][0](path)
+    width, height = img.size
+    if width * height > MAX_PIXELS:
+        img.close()
+        raise ValueError(f"Изображение {width}x{height} больше {MAX_PIXELS} пикселей")
+    return img
+
+
+def _netpbm_header(f):
+    """Поля заголовка PPM/PGM (магия, ширина, высота, максимум) и смещение данных."""
+    tokens = []
+    while len(tokens) < 4:
+        line = f.readline()
+        if not line:
+            return None
+        tokens += line.split(b'#')[0].split()
+    # Данные начинаются сразу после одного пробельного символа за максимумом
+    return tokens[:4], f.tell()
+
+
+def _memmap(path):
+    """Отображает несжатое 8-битное изображение в память: (массив, порядок каналов) или None."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in MEMMAP_EXTENSIONS:
+        return None
+    if ext == '.npy':
+        array = np.load(path, mmap_mode='r')
+        if array.dtype != np.uint8 or array.ndim not in (2, 3):
+            raise ValueError("Ожидается массив uint8 (H, W) или (H, W, 3)")
+        return array, 'rgb'
+    with open(path, 'rb') as f:
+        if ext == '.bmp':
+            header = f.read(54)
+            if len(header) < 54 or header[:2] != b'BM':
+                return None
+            offset = int.from_bytes(header[10:14], 'little')
+            width = int.from_bytes(header[18:22], 'little', signed=True)
+            height = int.from_bytes(header[22:26], 'little', signed=True)
+            bits = int.from_bytes(header[28:30], 'little')
+            compression = int.from_bytes(header[30:34], 'little')
+            if compression != 0 or bits not in (24, 32) or width <= 0:
+                return None
+            channels = bits // 8
+            stride = (bits * width + 31) // 32 * 4
+            rows = np.memmap(path, np.uint8, 'r', offset, (abs(height), stride))
+            array = rows[:, :width * channels].reshape(abs(height), width, channels)
+            # Обычно строки BMP хранятся снизу вверх
+            return (array[::-1] if height > 0 else array), 'bgr'
+        parsed = _netpbm_header(f)
+    if parsed is None:
+        return None
+    (magic, width, height, maxval), offset = parsed
+    if magic not in (b'P5', b'P6') or int(maxval) > 255:
+        return None
+    shape = (int(height), int(width)) + ((3,) if magic == b'P6' else ())
+    return np.memmap(path, np.uint8, 'r', offset, shape), 'rgb'
+
+
+def image_size(path):
+    """Размер изображения (ширина, высота) без декодирования пикселей."""
+    mapped = _memmap(path)
+    if mapped is not None:
+        height, width = mapped[0].shape[:2]
+        return width, height
+    with _open_image(path) as img:
+        return img.size
+
+
+def should_tile(path):
+    """Обрабатывать ли изображение полосами: очень большое или .npy (его читает только этот модуль)."""
+    if path.lower().endswith('.npy'):
+        return True
+    try:
+        width, height = image_size(path)
+    except Exception:
+        return False
+    return width * height > TILE_MIN_PIXELS
+
+
+def reduction_for(width, columns):
+    """Степень двойки, во сколько раз уменьшать исходник шириной width для сетки в columns столбцов."""
+    factor = 1
+    while width // (factor * 2) >= columns * WORK_PIXELS_PER_COLUMN:
+        factor *= 2
+    return factor
+
+
+class ArraySource:
+    """Строки изображения в рабочем разрешении из массива (в том числе отображённого в память).
+
+    Исходник уменьшается в factor раз усреднением блоков factor x factor и
+    читается порциями по READ_PIXELS, так что целиком в память не попадает.
+    full_shape - размер исходника до всех уменьшений (для пропорций сетки).
+    """
+
+    def __init__(self, array, factor=1, order='rgb', full_shape=None):
+        self.array = array
+        self.factor = factor
+        self.order = order
+        self.full_shape = full_shape or array.shape[:2]
+        height, width = array.shape[:2]
+        self.shape = (max(height // factor, 1), max(width // factor, 1))
+
+    def _bgr(self, block):
+        if block.ndim == 2:
+            return cv2.cvtColor(block, cv2.COLOR_GRAY2BGR)
+        block = block[..., :3]
+        if self.order == 'rgb':
+            return cv2.cvtColor(block, cv2.COLOR_RGB2BGR)
+        return np.ascontiguousarray(block)
+
+    def rows(self, y0, y1):
+        """Строки [y0, y1) рабочего разрешения в BGR."""
+        factor = self.factor
+        height, width = self.shape
+        step = max(READ_PIXELS // (self.array.shape[1] * factor), 1)
+        parts = []
+        for start in range(y0, y1, step):
+            end = min(start + step, y1)
+            block = np.ascontiguousarray(self.array[start * factor:end * factor, :width * factor])
+            if factor > 1:
+                block = cv2.resize(block, (width, end - start), interpolation=cv2.INTER_AREA)
+            parts.append(self._bgr(block))
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+
+def _decode_reduced(path, factor):
+    """Pillow: изображение, уменьшенное в factor раз, в RGB (массив).
+
+    JPEG через draft декодируется сразу уменьшенным. Остальные форматы Pillow
+    распаковывает только целиком, поэтому одна копия в исходном разрешении
+    в памяти есть, но уменьшается она до перевода в RGB - второй полной копии нет.
+    """
+    with _open_image(path) as img:
+        full_width = img.width
+        img.draft('RGB', (img.width // factor, img.height // factor))
+        if img.mode not in ('L', 'RGB', 'RGBA'):
+            # Палитру, CMYK, 16 бит и т.п. reduce не усредняет - сначала приводим
+            img = img.convert('RGBA' if img.mode in ('P', 'PA', 'LA') else 'RGB')
+        remaining = max(round(factor * img.width / full_width), 1)
+        if remaining > 1:
+            img = img.reduce(remaining)
+        return np.asarray(img.convert('RGB'))
+
+
+def open_source(path, columns):
+    """ArraySource изображения в рабочем разрешении для сетки в columns столбцов.
+
+    Несжатые форматы отображаются в память, JPEG OpenCV декодирует сразу
+    уменьшенным до 8 раз - для них память не зависит от размера исходника.
+    PNG, TIFF и прочие сжатые без потерь построчно не читаются: OpenCV
+    распаковывает их один раз целиком и уменьшает, а что он не читает -
+    Pillow (см. _decode_reduced).
+    """
+    mapped = _memmap(path)
+    if mapped is not None:
+        array, order = mapped
+        return ArraySource(array, reduction_for(array.shape[1], columns), order)
+    full_width, full_height = image_size(path)
+    factor = reduction_for(full_width, columns)
+    data = cv2.imread(path, REDUCED_FLAGS[min(factor, max(REDUCED_FLAGS))])
+    order = 'bgr'
+    if data is None:
+        data, order = _decode_reduced(path, factor), 'rgb'
+    scale = max(round(full_width / data.shape[1]), 1)
+    return ArraySource(data, max(factor // scale, 1), order, (full_height, full_width))
+
+
+def clahe_luts(hists, counts, clip_limit=CLAHE_CLIP_LIMIT):
+    """LUT CLAHE (тайлов по Y, по X, 256) по гистограммам тайлов - та же арифметика, что в OpenCV.
+
+    Порог и нормировка считаются по числу пикселей тайла, поэтому неполные
+    тайлы у нижнего и правого краёв не темнеют.
+    """
+    luts = np.empty(hists.shape, np.uint8)
+    for ty, tx in np.ndindex(*hists.shape[:2]):
+        area = max(int(counts[ty, tx]), 1)
+        limit = max(int(clip_limit * area / 256), 1)
+        hist = hists[ty, tx].astype(np.int64)
+        excess = int(np.maximum(hist - limit, 0).sum())
+        hist = np.minimum(hist, limit)
+        batch, residual = divmod(excess, 256)
+        hist += batch
+        if residual:
+            hist[::max(256 // residual, 1)][:residual] += 1
+        luts[ty, tx] = np.clip(np.rint(np.cumsum(hist) * (255 / area)), 0, 255)
+    return luts
+
+
+def _tile_weights(start, count, tile, tiles):
+    """Соседние тайлы и веса билинейной смеси для координат start..start+count-1."""
+    position = np.arange(start, start + count) / tile - 0.5
+    first = np.floor(position).astype(np.intp)
+    weight = (position - first).astype(np.float32)
+    return np.maximum(first, 0), np.minimum(first + 1, tiles - 1), weight
+
+
+def apply_clahe(gray, y0, luts, tile_size):
+    """CLAHE для полосы gray, начинающейся со строки y0 изображения: смесь LUT четырёх соседних тайлов."""
+    tiles_y, tiles_x = luts.shape[:2]
+    tile_w, tile_h = tile_size
+    ty1, ty2, ya = _tile_weights(y0, gray.shape[0], tile_h, tiles_y)
+    tx1, tx2, xa = _tile_weights(0, gray.shape[1], tile_w, tiles_x)
+    ty1, ty2, ya = ty1[:, None], ty2[:, None], ya[:, None]
+    top = luts[ty1, tx1, gray] * (1 - xa) + luts[ty1, tx2, gray] * xa
+    bottom = luts[ty2, tx1, gray] * (1 - xa) + luts[ty2, tx2, gray] * xa
+    return np.clip(np.rint(top * (1 - ya) + bottom * ya), 0, 255).astype(np.uint8)
+
+
+def tiled_fields(path, params, progress=None, should_stop=None):
+    """FrameFields большого изображения, собранные полосами (см. описание модуля); None при остановке.
+
+    Остановка проверяется и прогресс сообщается после каждой полосы обоих проходов.
+    """
+    pre = preprocessor_for(params)
+    source = open_source(path, params.width)
+    height, width = source.shape
+    out_w, out_h = pre.output_size(source.full_shape)
+    tiles_x, tiles_y = CLAHE_GRID
+    tile_size = (-(-width // tiles_x), -(-height // tiles_y))
+    read_rows = max(STRIP_PIXELS // width, 1)
+    strip_rows = max(read_rows * out_h // height, 1)
+    total = -(-height // read_rows) + -(-out_h // strip_rows)
+    done = 0
+
+    def step():
+        nonlocal done
+        done += 1
+        if progress is not None:
+            progress(done / total)
+        return should_stop is None or not should_stop()
+
+    def gray_rows(y0, y1):
+        with stage('decode') as st:
+            bgr = st.output(source.rows(y0, y1))
+        return bgr, cv2.LUT(cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY), pre.table)
+
+    # Проход 1: гистограммы тайлов CLAHE
+    hists = np.zeros((tiles_y, tiles_x, 256), np.int64)
+    counts = np.zeros((tiles_y, tiles_x), np.int64)
+    for y0 in range(0, height, read_rows):
+        y1 = min(y0 + read_rows, height)
+        _, gray = gray_rows(y0, y1)
+        with stage('contrast'):
+            for ty in range(y0 // tile_size[1], (y1 - 1) // tile_size[1] + 1):
+                rows = gray[max(ty * tile_size[1], y0) - y0:min((ty + 1) * tile_size[1], y1) - y0]
+                for tx in range(tiles_x):
+                    block = rows[:, tx * tile_size[0]:(tx + 1) * tile_size[0]]
+                    hists[ty, tx] += np.bincount(block.ravel(), minlength=256)
+                    counts[ty, tx] += block.size
+        if not step():
+            return None
+    luts = clahe_luts(hists, counts)
+
+    # Проход 2: полосы сразу уменьшаются в свои строки сетки
+    luma = np.empty((out_h, out_w), np.uint8)
+    color = np.empty((out_h, out_w, 3), np.uint8) if pre.with_color else None
+    detail = None
+    bounds = [round(i * height / out_h) for i in range(out_h + 1)]
+    for i0 in range(0, out_h, strip_rows):
+        i1 = min(i0 + strip_rows, out_h)
+        y0 = min(bounds[i0], height - 1)
+        y1 = max(bounds[i1], y0 + 1)
+        e0, e1 = max(y0 - EDGE_OVERLAP, 0), min(y1 + EDGE_OVERLAP, height)
+        bgr, gray = gray_rows(e0, e1)
+        with stage('contrast') as st:
+            gray = st.output(apply_clahe(gray, e0, luts, tile_size))
+        if pre.use_edges:
+            with stage('edges') as st:
+                gray = st.output(pre.edges(gray))
+        inner = gray[y0 - e0:y1 - e0]
+        size = (out_w, i1 - i0)
+        with stage('resize') as st:
+            # Усреднение, а не INTER_CUBIC, как в Preprocessor.resize: бикубическое сжатие полосы даёт алиасинг
+            luma[i0:i1] = st.output(cv2.resize(inner, size, interpolation=cv2.INTER_AREA))
+        if color is not None:
+            with stage('color') as st:
+                rgb = cv2.cvtColor(bgr[y0 - e0:y1 - e0], cv2.COLOR_BGR2RGB)
+                color[i0:i1] = st.output(cv2.resize(rgb, size, interpolation=cv2.INTER_AREA))
+        if pre.with_detail:
+            with stage('detail') as st:
+                part = st.output(pre.detail(inner, size))
+            if detail is None:
+                detail = np.empty((out_h, out_w, part.shape[2]), np.uint8)
+            detail[i0:i1] = part
+        if not step():
+            return None
+
+    magnitude = angle = None
+    if pre.use_gradient:
+        with stage('sobel') as st:
+            magnitude, angle = st.output(compute_gradient(luma))
+    return FrameFields(luma, magnitude, angle, color, detail)
+
+
+def preview_image(path, size):
+    """Уменьшенная копия изображения (PIL, RGB) не больше size - без декодирования в полном размере."""
+    source = open_source(path, max(size[0] // WORK_PIXELS_PER_COLUMN, 1))
+    img = Image.fromarray(cv2.cvtColor(source.rows(0, source.shape[0]), cv2.COLOR_BGR2RGB))
+    img.thumbnail(size)
+    return img
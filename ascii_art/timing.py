@@ -0,0 +1,144 @@
+import mmap
+import time
+from bisect import bisect_right
+from collections import namedtuple
+
+from PIL import Image
+
+# Длительность кадра по умолчанию, мс (как у браузеров для GIF без задержки)
+DEFAULT_DURATION = 100
+# Задержки не больше этой браузеры считают нулевыми и показывают как DEFAULT_DURATION
+MIN_DURATION = 10
+
+# Время показа кадра (мс) и способ его удаления (disposal method GIF: 0-3)
+FrameTiming = namedtuple('FrameTiming', ['duration', 'disposal'], defaults=[DEFAULT_DURATION, 0])
+
+
+def normalize_duration(duration):
+    """Длительность кадра в мс с теми же поправками, что делают браузеры."""
+    if not duration or duration <= MIN_DURATION:
+        return DEFAULT_DURATION
+    return int(duration)
+
+
+def _skip_sub_blocks(data, pos):
+    while data[pos]:
+        pos += data[pos] + 1
+    return pos + 1
+
+
+def _pillow_gif_timings(path):
+    """FrameTiming по info['duration'] Pillow: кадры распаковываются, зато обрезанный файл читается до обрыва."""
+    timings = []
+    with Image.open(path) as gif:
+        while True:
+            timings.append(FrameTiming(normalize_duration(gif.info.get('duration')),
+                                       getattr(gif, 'disposal_method', 0) or 0))
+            try:
+                gif.seek(gif.tell() + 1)
+            except (EOFError, OSError):
+                break
+    return timings
+
+
+def read_gif_timings(path):
+    """FrameTiming всех кадров GIF по заголовкам блоков, без декодирования изображений.
+
+    Длительность кадра без своего Graphic Control Extension берётся
+    от предыдущего кадра, как это делает Pillow. Если файл обрезан или
+    повреждён, длительности берутся у Pillow.
+    """
+    try:
+        return _parse_gif_timings(path)
+    except IndexError:
+        return _pillow_gif_timings(path)
+
+
+def _parse_gif_timings(path):
+    timings = []
+    duration, disposal = 0, 0
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if data[:3] != b'GIF':
+            raise ValueError("Файл не является GIF")
+        pos = 13
+        if data[10] & 0x80:
+            pos += 3 << ((data[10] & 7) + 1)
+        while pos < len(data):
+            block = data[pos]
+            if block == 0x21:  # расширение
+                if data[pos + 1] == 0xF9 and data[pos + 2] == 4:
+                    disposal = (data[pos + 3] >> 2) & 7
+                    duration = (data[pos + 4] | data[pos + 5] << 8) * 10
+                pos = _skip_sub_blocks(data, pos + 2)
+            elif block == 0x2C:  # кадр
+                flags = data[pos + 9]
+                pos += 10
+                if flags & 0x80:
+                    pos += 3 << ((flags & 7) + 1)
+                pos = _skip_sub_blocks(data, pos + 1)
+                timings.append(FrameTiming(normalize_duration(duration), disposal))
+                disposal = 0
+            else:  # 0x3B - конец файла
+                break
+    return timings
+
+
+class FrameScheduler:
+    """Выбор кадра по реальному времени с начала воспроизведения.
+
+    Кадр вычисляется от момента старта, а не накоплением задержек, поэтому
+    ошибка таймера не копится; если отрисовка отстала, лишние кадры
+    пропускаются (и считаются в dropped).
+    """
+
+    def __init__(self, durations, clock=time.perf_counter):
+        self.durations = [normalize_duration(d) for d in durations] or [DEFAULT_DURATION]
+        self.ends = []
+        total = 0
+        for duration in self.durations:
+            total += duration
+            self.ends.append(total)
+        self.total = total
+        self.clock = clock
+        self.start_time = clock()
+        self.current = 0
+        self.dropped = 0
+
+    def restart(self, index=0):
+        """Начинает воспроизведение заново с кадра index."""
+        offset = self.ends[index - 1] if index > 0 else 0
+        self.start_time = self.clock() - offset / 1000.0
+        self.current = index
+
+    def tick(self):
+        """Возвращает (кадр для показа сейчас, задержка в мс до следующей смены кадра)."""
+        elapsed = (self.clock() - self.start_time) * 1000.0 % self.total
+        index = min(bisect_right(self.ends, elapsed), len(self.ends) - 1)
+        skipped = (index - self.current) % len(self.ends) - 1
+        if skipped > 0:
+            self.dropped += skipped
+        self.current = index
+        delay = max(1, int(round(self.ends[index] - elapsed)))
+        return index, delay
+
+
+# То же на стороне браузера: show(i) вызывается только при смене кадра,
+# задержка до следующего вызова считается от момента старта
+PLAYBACK_JS = '''
+function playFrames(durations, show) {
+  if (durations.length < 2) return;
+  const ends = [];
+  let total = 0;
+  for (const d of durations) ends.push(total += d);
+  const start = performance.now();
+  let shown = 0;
+  function tick() {
+    const t = (performance.now() - start) % total;
+    let i = 0;
+    while (i < ends.length - 1 && ends[i] <= t) i++;
+    if (i !== shown) { show(i); shown = i; }
+    setTimeout(tick, Math.max(1, ends[i] - t));
+  }
+  setTimeout(tick, durations[0]);
+}
+'''